@@ -2,52 +2,39 @@
 Flask-compatible admin maintenance endpoints for AdminMaintenance.vue
 """
 
-from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from contextlib import closing
+
+from flask import Blueprint, jsonify, request, url_for
+from flask_jwt_extended import jwt_required
 from psycopg2 import sql
 from postgres_config import get_db_connection
+from app.core.authorization import superuser_required
+from app.services.background_jobs import complete_job, create_job, jobs_db, submit_job, worker_stats
+from app.services.hls_packaging import hls_packager
+from app.services.media_fingerprints import duplicates_report, fingerprints_available, refresh_fingerprints
+from app.services.media_probe import run_probe_stage
+from app.services.subtitles import refresh_subtitles, subtitles_available
+from app.services.system_settings import get_setting
+from app.services.transcoding import TranscodeError, transcodes
+from app.services.trickplay import generate_trickplay
+from app.services.playlist_cache import playlist_cache
+from app.services.smart_playlists import smart_playlists
 from app.services.media_maintenance import (
     MediaMaintenanceError,
     run_media_maintenance_scan,
 )
-import json
 import os
 import time
 from datetime import datetime
 
 router = Blueprint('admin', __name__)
 
-# Simple job tracking (in production, use Redis or database)
-job_counter = 1
-jobs_db = {}
-
-
 DEFAULT_BACKUP_DIR = os.getenv('WATCH1_BACKUP_DIR', '/app/data/backups')
 
 
-def ensure_settings_table(cursor):
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS system_settings (
-            key TEXT PRIMARY KEY,
-            value JSONB NOT NULL,
-            updated_at TIMESTAMPTZ DEFAULT NOW()
-        )
-        """
-    )
-
-
-def get_database_settings(cursor):
-    ensure_settings_table(cursor)
-    cursor.execute('SELECT value FROM system_settings WHERE key = %s', ('database',))
-    row = cursor.fetchone()
-    if row and isinstance(row.get('value'), dict):
-        return row['value']
-    if row and isinstance(row.get('value'), str):
-        try:
-            return json.loads(row['value'])
-        except json.JSONDecodeError:
-            return {}
+def get_database_settings():
+    settings = get_setting('database', {})
+    return settings if isinstance(settings, dict) else {}
 
 
 def table_exists(cursor, table_name: str) -> bool:
@@ -106,57 +93,15 @@ def get_sum(cursor, table_name: str, column_name: str) -> int:
     row = cursor.fetchone()
     return int(row['total']) if row and row.get('total') is not None else 0
 
-def create_job(job_name, status='queued'):
-    """Create a new maintenance job"""
-    global job_counter
-    job_id = job_counter
-    job_counter += 1
-    
-    job = {
-        'id': job_id,
-        'job_name': job_name,
-        'status': status,
-        'details': None,
-        'started_at': datetime.utcnow().isoformat() + 'Z',
-        'finished_at': None,
-        'duration_seconds': None,
-        'result': None,
-        'running': status == 'running'
-    }
-    
-    jobs_db[job_id] = job
-    return job
-
-def complete_job(job_id, status='success', result=None):
-    """Complete a maintenance job"""
-    if job_id in jobs_db:
-        job = jobs_db[job_id]
-        job['status'] = status
-        job['finished_at'] = datetime.utcnow().isoformat() + 'Z'
-        job['running'] = False
-        job['result'] = result
-        
-        # Calculate duration
-        started = datetime.fromisoformat(job['started_at'].replace('Z', '+00:00'))
-        finished = datetime.fromisoformat(job['finished_at'].replace('Z', '+00:00'))
-        job['duration_seconds'] = (finished - started).total_seconds()
-
 @router.route('/database/info', methods=['GET'])
 @jwt_required()
+@superuser_required
 def get_database_info():
     """Get database information for AdminMaintenance.vue"""
     try:
-        user_id = get_jwt_identity()
-        
-        # Check if user is superuser
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT is_superuser FROM users WHERE id = %s', (user_id,))
-        user = cursor.fetchone()
-        
-        if not user or not user['is_superuser']:
-            return jsonify({"detail": "Not enough permissions"}), 403
-        
+
         # Table counts aligned with Drizzle schema
         users_count = get_table_count(cursor, 'users')
         media_items_count = get_table_count(cursor, 'media_items')
@@ -198,20 +143,11 @@ def get_database_info():
 
 @router.route('/database/backups', methods=['GET'])
 @jwt_required()
+@superuser_required
 def list_backups():
     """List available database backups"""
     try:
-        user_id = get_jwt_identity()
-
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute('SELECT is_superuser FROM users WHERE id = %s', (user_id,))
-        user = cursor.fetchone()
-        if not user or not user['is_superuser']:
-            return jsonify({"detail": "Not enough permissions"}), 403
-
-        db_settings = get_database_settings(cursor)
+        db_settings = get_database_settings()
         backup_directory = (db_settings.get('backup_directory') or '').strip()
         if not backup_directory:
             backup_directory = DEFAULT_BACKUP_DIR
@@ -243,28 +179,13 @@ def list_backups():
     except Exception as e:
         print(f"List backups error: {e}")
         return jsonify({"detail": f"List backups error: {str(e)}"}), 500
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
 
 @router.route('/database/clean', methods=['POST'])
 @jwt_required()
+@superuser_required
 def clean_orphans():
     """Clean orphan records"""
     try:
-        user_id = get_jwt_identity()
-        
-        # Check if user is superuser
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT is_superuser FROM users WHERE id = %s', (user_id,))
-        user = cursor.fetchone()
-        
-        if not user or not user['is_superuser']:
-            return jsonify({"detail": "Not enough permissions"}), 403
-        
         # Handle both JSON and form data
         if request.is_json:
             data = request.get_json() or {}
@@ -304,28 +225,13 @@ def clean_orphans():
     except Exception as e:
         print(f"Clean orphans error: {e}")
         return jsonify({"detail": f"Clean orphans error: {str(e)}"}), 500
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
 
 @router.route('/database/prune', methods=['POST'])
 @jwt_required()
+@superuser_required
 def prune_test_media():
     """Prune test media"""
     try:
-        user_id = get_jwt_identity()
-        
-        # Check if user is superuser
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT is_superuser FROM users WHERE id = %s', (user_id,))
-        user = cursor.fetchone()
-        
-        if not user or not user['is_superuser']:
-            return jsonify({"detail": "Not enough permissions"}), 403
-        
         data = request.get_json() or {}
         apply = data.get('apply', False)
         delete_rows = data.get('delete', False)
@@ -356,28 +262,13 @@ def prune_test_media():
     except Exception as e:
         print(f"Prune test media error: {e}")
         return jsonify({"detail": f"Prune test media error: {str(e)}"}), 500
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
 
 @router.route('/database/verify-posters', methods=['POST'])
 @jwt_required()
+@superuser_required
 def verify_posters():
     """Verify poster data"""
     try:
-        user_id = get_jwt_identity()
-        
-        # Check if user is superuser
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT is_superuser FROM users WHERE id = %s', (user_id,))
-        user = cursor.fetchone()
-        
-        if not user or not user['is_superuser']:
-            return jsonify({"detail": "Not enough permissions"}), 403
-        
         data = request.get_json() or {}
         rebuild = data.get('rebuild', False)
         
@@ -400,29 +291,14 @@ def verify_posters():
     except Exception as e:
         print(f"Verify posters error: {e}")
         return jsonify({"detail": f"Verify posters error: {str(e)}"}), 500
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
 
 
 @router.route('/media/maintenance-scan', methods=['POST'])
 @jwt_required()
+@superuser_required
 def maintenance_scan():
     """Run the unified media maintenance scanner."""
-    conn = None
-    cursor = None
     try:
-        user_id = get_jwt_identity()
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute('SELECT is_superuser FROM users WHERE id = %s', (user_id,))
-        user = cursor.fetchone()
-        if not user or not user['is_superuser']:
-            return jsonify({"detail": "Not enough permissions"}), 403
-
         payload = request.get_json(silent=True) or {}
         category_keys = payload.get('categories')
         dry_run = bool(payload.get('dry_run', False))
@@ -455,27 +331,238 @@ def maintenance_scan():
     except Exception as e:
         print(f"Maintenance scan error: {e}")
         return jsonify({"detail": f"Maintenance scan error: {str(e)}"}), 500
-    finally:
-        if cursor is not None:
-            cursor.close()
-        if conn is not None:
-            conn.close()
+
+@router.route('/media/fingerprints', methods=['POST'])
+@jwt_required()
+@superuser_required
+def start_fingerprint_refresh():
+    """Compute missing content fingerprints in the background."""
+    try:
+        if not fingerprints_available():
+            return jsonify({"detail": "Fingerprint columns missing; apply migration 009"}), 409
+
+        payload = request.get_json(silent=True) or {}
+        limit = payload.get('limit')
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except (ValueError, TypeError):
+                return jsonify({"detail": "'limit' must be an integer"}), 400
+
+        job = submit_job("Media fingerprint refresh", refresh_fingerprints, limit=limit)
+        return jsonify({
+            "job_id": job["id"],
+            "status": job["status"],
+            "status_url": url_for('admin.get_job_status', job_id=job["id"]),
+        }), 202
+
+    except Exception as e:
+        print(f"Fingerprint refresh error: {e}")
+        return jsonify({"detail": f"Fingerprint refresh error: {str(e)}"}), 500
+
+
+@router.route('/media/probe', methods=['POST'])
+@jwt_required()
+@superuser_required
+def start_metadata_probe():
+    """Extract embedded metadata for items not yet probed at their current signature."""
+    try:
+        payload = request.get_json(silent=True) or {}
+        category_keys = payload.get('categories')
+        limit = payload.get('limit')
+
+        if category_keys is not None and not isinstance(category_keys, (list, tuple)):
+            return jsonify({"detail": "'categories' must be a list when provided"}), 400
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except (ValueError, TypeError):
+                return jsonify({"detail": "'limit' must be an integer"}), 400
+
+        job = submit_job("Media metadata probe", run_probe_stage, categories=category_keys, limit=limit)
+        return jsonify({
+            "job_id": job["id"],
+            "status": job["status"],
+            "status_url": url_for('admin.get_job_status', job_id=job["id"]),
+        }), 202
+
+    except Exception as e:
+        print(f"Metadata probe error: {e}")
+        return jsonify({"detail": f"Metadata probe error: {str(e)}"}), 500
+
+
+@router.route('/media/subtitles', methods=['POST'])
+@jwt_required()
+@superuser_required
+def start_subtitle_refresh():
+    """Re-index sidecar subtitles (optional ``{"categories"}``) as a background job."""
+    try:
+        if not subtitles_available(force=True):
+            return jsonify({"detail": "Subtitle table missing; apply migration 011"}), 409
+
+        payload = request.get_json(silent=True) or {}
+        category_keys = payload.get('categories')
+        if category_keys is not None and not isinstance(category_keys, (list, tuple)):
+            return jsonify({"detail": "'categories' must be a list when provided"}), 400
+
+        job = submit_job("Subtitle index refresh", refresh_subtitles, categories=category_keys)
+        return jsonify({
+            "job_id": job["id"],
+            "status": job["status"],
+            "status_url": url_for('admin.get_job_status', job_id=job["id"]),
+        }), 202
+
+    except Exception as e:
+        print(f"Subtitle refresh error: {e}")
+        return jsonify({"detail": f"Subtitle refresh error: {str(e)}"}), 500
+
+
+@router.route('/media/trickplay', methods=['POST'])
+@jwt_required()
+@superuser_required
+def start_trickplay_generation():
+    """Generate missing seek-preview sprites (optional ``{"categories", "media_ids", "limit"}``)."""
+    try:
+        payload = request.get_json(silent=True) or {}
+        category_keys = payload.get('categories')
+        media_ids = payload.get('media_ids')
+        limit = payload.get('limit')
+
+        for name, value in (('categories', category_keys), ('media_ids', media_ids)):
+            if value is not None and not isinstance(value, (list, tuple)):
+                return jsonify({"detail": f"'{name}' must be a list when provided"}), 400
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except (ValueError, TypeError):
+                return jsonify({"detail": "'limit' must be an integer"}), 400
+
+        job = submit_job(
+            "Trickplay generation",
+            generate_trickplay,
+            categories=category_keys,
+            media_ids=media_ids,
+            limit=limit,
+        )
+        return jsonify({
+            "job_id": job["id"],
+            "status": job["status"],
+            "status_url": url_for('admin.get_job_status', job_id=job["id"]),
+        }), 202
+
+    except Exception as e:
+        print(f"Trickplay generation error: {e}")
+        return jsonify({"detail": f"Trickplay generation error: {str(e)}"}), 500
+
+
+@router.route('/media/duplicates', methods=['GET'])
+@jwt_required()
+@superuser_required
+def get_duplicate_media():
+    """Report groups of items with identical content (``?limit=100&media_type=``)."""
+    try:
+        if not fingerprints_available():
+            return jsonify({"detail": "Fingerprint columns missing; apply migration 009"}), 409
+
+        limit = request.args.get('limit', 100, type=int)
+        media_type = request.args.get('media_type') or None
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            return jsonify(duplicates_report(cursor, limit=limit, media_type=media_type))
+
+    except Exception as e:
+        print(f"Duplicate report error: {e}")
+        return jsonify({"detail": f"Duplicate report error: {str(e)}"}), 500
+
+@router.route('/media/hls', methods=['GET'])
+@jwt_required()
+@superuser_required
+def get_hls_cache():
+    """HLS cache usage against its budget and packaging in progress."""
+    try:
+        return jsonify(hls_packager.stats())
+    except Exception as e:
+        print(f"HLS cache stats error: {e}")
+        return jsonify({"detail": f"HLS cache stats error: {str(e)}"}), 500
+
+
+@router.route('/media/hls/evict', methods=['POST'])
+@jwt_required()
+@superuser_required
+def evict_hls_cache():
+    """Evict least recently played HLS renditions (optional ``{"max_bytes"}`` overrides the budget)."""
+    try:
+        payload = request.get_json(silent=True) or {}
+        max_bytes = payload.get('max_bytes')
+        if max_bytes is not None:
+            try:
+                max_bytes = max(int(max_bytes), 0)
+            except (ValueError, TypeError):
+                return jsonify({"detail": "'max_bytes' must be an integer"}), 400
+        return jsonify(hls_packager.enforce_budget(max_bytes))
+    except Exception as e:
+        print(f"HLS eviction error: {e}")
+        return jsonify({"detail": f"HLS eviction error: {str(e)}"}), 500
+
+@router.route('/playlists/cache', methods=['GET'])
+@jwt_required()
+@superuser_required
+def get_playlist_cache_stats():
+    """Playlist read cache backend, hit rates and smart playlist evaluations."""
+    try:
+        return jsonify({**playlist_cache.stats(), "smart_playlists": dict(smart_playlists.stats)})
+    except Exception as e:
+        print(f"Playlist cache stats error: {e}")
+        return jsonify({"detail": f"Playlist cache stats error: {str(e)}"}), 500
+
+@router.route('/media/transcodes', methods=['GET'])
+@jwt_required()
+@superuser_required
+def get_transcode_queue():
+    """Transcode queue depth, running jobs and the core budget."""
+    try:
+        return jsonify(transcodes.stats())
+    except Exception as e:
+        print(f"Transcode stats error: {e}")
+        return jsonify({"detail": f"Transcode stats error: {str(e)}"}), 500
+
+
+@router.route('/media/transcodes', methods=['POST'])
+@jwt_required()
+@superuser_required
+def queue_background_transcodes():
+    """Queue background pre-transcodes (optional ``{"qualities", "categories", "limit"}``)."""
+    try:
+        payload = request.get_json(silent=True) or {}
+        qualities = payload.get('qualities')
+        category_keys = payload.get('categories')
+        limit = payload.get('limit')
+
+        for name, value in (('qualities', qualities), ('categories', category_keys)):
+            if value is not None and not isinstance(value, (list, tuple)):
+                return jsonify({"detail": f"'{name}' must be a list when provided"}), 400
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except (ValueError, TypeError):
+                return jsonify({"detail": "'limit' must be an integer"}), 400
+
+        try:
+            result = transcodes.queue_background(qualities=qualities, categories=category_keys, limit=limit)
+        except TranscodeError as exc:
+            return jsonify({"detail": str(exc)}), exc.status
+        return jsonify(result), 202
+
+    except Exception as e:
+        print(f"Background transcode error: {e}")
+        return jsonify({"detail": f"Background transcode error: {str(e)}"}), 500
+
 
 @router.route('/database/backup', methods=['POST'])
 @jwt_required()
+@superuser_required
 def create_backup():
     """Create database backup"""
     try:
-        
-        # Check if user is superuser
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT is_superuser FROM users WHERE id = %s', (user_id,))
-        user = cursor.fetchone()
-        
-        if not user or not user['is_superuser']:
-            return jsonify({"detail": "Not enough permissions"}), 403
-        
         data = request.get_json() or {}
         format_type = data.get('format', 'plain')
         output = data.get('output')
@@ -507,28 +594,13 @@ def create_backup():
     except Exception as e:
         print(f"Create backup error: {e}")
         return jsonify({"detail": f"Create backup error: {str(e)}"}), 500
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
 
 @router.route('/database/jobs', methods=['GET'])
 @jwt_required()
+@superuser_required
 def get_job_history():
     """Get maintenance job history"""
     try:
-        user_id = get_jwt_identity()
-        
-        # Check if user is superuser
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT is_superuser FROM users WHERE id = %s', (user_id,))
-        user = cursor.fetchone()
-        
-        if not user or not user['is_superuser']:
-            return jsonify({"detail": "Not enough permissions"}), 403
-        
         limit = int(request.args.get('limit', 20))
         
         # Get recent jobs (sorted by ID descending)
@@ -541,28 +613,13 @@ def get_job_history():
     except Exception as e:
         print(f"Get job history error: {e}")
         return jsonify({"detail": f"Get job history error: {str(e)}"}), 500
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
 
 @router.route('/database/jobs/<int:job_id>', methods=['GET'])
 @jwt_required()
+@superuser_required
 def get_job_status(job_id):
     """Get job status"""
     try:
-        user_id = get_jwt_identity()
-        
-        # Check if user is superuser
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT is_superuser FROM users WHERE id = %s', (user_id,))
-        user = cursor.fetchone()
-        
-        if not user or not user['is_superuser']:
-            return jsonify({"detail": "Not enough permissions"}), 403
-        
         if job_id not in jobs_db:
             return jsonify({"detail": "Job not found"}), 404
         
@@ -572,28 +629,13 @@ def get_job_status(job_id):
     except Exception as e:
         print(f"Get job status error: {e}")
         return jsonify({"detail": f"Get job status error: {str(e)}"}), 500
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
 
 @router.route('/database/jobs/<int:job_id>', methods=['DELETE'])
 @jwt_required()
+@superuser_required
 def cancel_job(job_id):
     """Cancel a job"""
     try:
-        user_id = get_jwt_identity()
-        
-        # Check if user is superuser
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT is_superuser FROM users WHERE id = %s', (user_id,))
-        user = cursor.fetchone()
-        
-        if not user or not user['is_superuser']:
-            return jsonify({"detail": "Not enough permissions"}), 403
-        
         if job_id not in jobs_db:
             return jsonify({"detail": "Job not found"}), 404
         
@@ -612,44 +654,15 @@ def cancel_job(job_id):
     except Exception as e:
         print(f"Cancel job error: {e}")
         return jsonify({"detail": f"Cancel job error: {str(e)}"}), 500
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
 
 @router.route('/worker/health', methods=['GET'])
 @jwt_required()
+@superuser_required
 def get_worker_health():
     """Get worker health status"""
     try:
-        user_id = get_jwt_identity()
-        
-        # Check if user is superuser
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT is_superuser FROM users WHERE id = %s', (user_id,))
-        user = cursor.fetchone()
-        
-        if not user or not user['is_superuser']:
-            return jsonify({"detail": "Not enough permissions"}), 403
-        
-        # Mock worker health data
-        running_jobs = [job['id'] for job in jobs_db.values() if job['running']]
-        pending_jobs = []  # No pending jobs in this simple implementation
-        
-        return jsonify({
-            "max_workers": 4,
-            "running": len(running_jobs),
-            "pending_jobs": pending_jobs,
-            "completed_result_cache": len(jobs_db) - len(running_jobs)
-        })
+        return jsonify(worker_stats())
         
     except Exception as e:
         print(f"Get worker health error: {e}")
         return jsonify({"detail": f"Get worker health error: {str(e)}"}), 500
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
@@ -7,6 +7,7 @@ import hashlib
 
 from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
 from postgres_config import get_db_connection
+from app.core.authorization import build_token_claims
 
 def get_current_user_from_token():
     verify_jwt_in_request(optional=False)
@@ -57,7 +58,8 @@ def login():
         try:
             cursor.execute(
                 """
-                SELECT id, email, password_hash, is_active, is_superuser, full_name
+                SELECT id, email, password_hash, is_active, is_superuser, full_name, created_at,
+                       token_version
                 FROM users
                 WHERE email = %s
                 """,
@@ -77,7 +79,8 @@ def login():
 
             access_token = create_access_token(
                 identity=str(user['id']),
-                expires_delta=timedelta(days=8)
+                expires_delta=timedelta(days=8),
+                additional_claims=build_token_claims(user),
             )
 
             return jsonify({
@@ -125,7 +128,7 @@ def register():
                 """
                 INSERT INTO users (email, password_hash, full_name, is_active, is_superuser)
                 VALUES (%s, %s, %s, TRUE, FALSE)
-                RETURNING id, email, full_name, is_superuser
+                RETURNING id, email, full_name, is_active, is_superuser, created_at
                 """,
                 (email, password_hash, display_name)
             )
@@ -135,7 +138,11 @@ def register():
             cursor.close()
             conn.close()
 
-        access_token = create_access_token(identity=str(new_user['id']), expires_delta=timedelta(days=8))
+        access_token = create_access_token(
+            identity=str(new_user['id']),
+            expires_delta=timedelta(days=8),
+            additional_claims=build_token_claims(new_user),
+        )
 
         return jsonify({
             "access_token": access_token,
@@ -2,27 +2,51 @@
 Flask-compatible media endpoints extracted from working flask_simple.py
 """
 
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, Response, jsonify, redirect, request, send_file, url_for
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from postgres_config import get_db_connection
+from app.core.authorization import superuser_required
+from app.core.http_cache import conditional_get
+from app.core.stream_tokens import issue_stream_token, verify_query_token
+from app.services.background_jobs import get_job, submit_job
+from app.services.catalog_index import SORT_KEYS as CATALOG_SORT_KEYS, query_catalog, text_order_sql
+from app.services.catalog_version import catalog_version
 from app.services.media_maintenance import STATUS_AVAILABLE
+from app.services.media_search import build_search_clause, suggest
+from app.services.subtitles import get_subtitle, list_subtitles, webvtt_path
+from app.services.system_settings import get_setting
+from app.services.trickplay import INDEX_NAME as TRICKPLAY_INDEX, resolve as resolve_trickplay, trickplay_manifest
+from app.services.transcoding import (
+    PRIORITY_ON_DEMAND,
+    QUALITY_PRESETS,
+    SOURCE_QUALITIES,
+    TRANSCODE_FORMAT,
+    TranscodeError,
+    transcodes,
+)
+from app.services.unraid_scanner import run_unraid_scan
+from app.services.chunked_uploads import UploadError, uploads as chunked_uploads
+from app.services.hls_packaging import PLAYLIST_NAME, HlsError, hls_packager, rendition_key
 from app.services.media_ingestion import (
-    save_uploaded_file,
+    StoredUpload,
+    store_upload_stream,
     delete_media_file_record,
     generate_file_metadata,
+    insert_uploaded_item,
 )
-from .settings_flask import ensure_settings_table
+from app.schemas.subtitle import SubtitleInfo
 from config_loader import load_media_config
 import os
-import json
+from contextlib import closing
 import hashlib
 import sys
 from datetime import datetime
 from decimal import Decimal
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Optional, Tuple
 import io
 import mimetypes
 from base64 import b64decode
+from urllib.parse import unquote
 sys.path.append('/app')
 from app.core.enhanced_scanner import EnhancedMediaScanner
 from pathlib import Path
@@ -33,6 +57,23 @@ _DEFAULT_POSTER_BYTES = b64decode(
 
 router = Blueprint('media', __name__)
 
+# Cache-Control per endpoint; all are revalidated through catalog-version ETags.
+_CATALOG_CACHE_CONTROL = 'private, no-cache'
+_CATEGORIES_CACHE_CONTROL = 'private, max-age=15, must-revalidate'
+_POSTER_CACHE_CONTROL = 'private, max-age=300, stale-while-revalidate=3600'
+# HLS files live under a per-source-signature directory and never change.
+_HLS_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+# Trickplay sheets, like HLS files, live under a per-source-signature directory.
+_TRICKPLAY_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+# Converted subtitles are revalidated by ETag (source id, mtime and size).
+_SUBTITLE_CACHE_CONTROL = 'private, max-age=3600'
+_HLS_MIMETYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.m4s': 'video/iso.segment',
+    '.mp4': 'video/mp4',
+    '.ts': 'video/mp2t',
+}
+
 
 def _ensure_metadata(metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
     return metadata if isinstance(metadata, dict) else {}
@@ -85,64 +126,144 @@ def _isoformat(value: Any) -> Optional[str]:
     return value
 
 
-def _map_media_item_row(row: Dict[str, Any]) -> Dict[str, Any]:
-    metadata = _ensure_metadata(row.get('metadata'))
+def _media_file_size(row: Dict[str, Any], metadata: Dict[str, Any]) -> int:
+    return _to_int(_metadata_value(metadata, 'fileSize', 'sizeBytes', 'size'), default=0)
 
-    file_size = _to_int(
-        _metadata_value(metadata, 'fileSize', 'sizeBytes', 'size'),
-        default=0,
-    )
-    file_path = row.get('source_path') or _metadata_value(
-        metadata,
-        'sourcePath',
-        'filePath',
-        'path',
-        default='',
-    )
-    duration_seconds = _to_float(
+
+def _media_file_path(row: Dict[str, Any], metadata: Dict[str, Any]) -> Any:
+    return row.get('source_path') or _metadata_value(metadata, 'sourcePath', 'filePath', 'path', default='')
+
+
+def _media_duration(row: Dict[str, Any], metadata: Dict[str, Any]) -> Optional[float]:
+    return _to_float(
         row.get('duration_seconds')
         or metadata.get('duration')
         or metadata.get('durationSeconds'),
         default=None,
     )
 
-    filename = _metadata_value(metadata, 'filename', 'fileName', 'name', default=row.get('title') or '')
-    original_filename = _metadata_value(metadata, 'originalFilename', 'original_name', default=None)
 
-    created_at = _isoformat(row.get('created_at'))
-    updated_at = _isoformat(row.get('updated_at'))
+# Canonical media item schema: one name per value. Each field lists the
+# columns and metadata keys it reads so projections can select only those.
+_MEDIA_FIELDS: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...], Callable[[Dict[str, Any], Dict[str, Any]], Any]]] = {
+    'id': (('id',), (), lambda row, md: str(row['id']) if row.get('id') is not None else None),
+    'title': (('title',), (), lambda row, md: row.get('title')),
+    'description': (('description',), (), lambda row, md: row.get('description')),
+    'media_type': (('media_type',), (), lambda row, md: row.get('media_type')),
+    'status': (('status',), (), lambda row, md: row.get('status')),
+    'filename': (
+        ('title',),
+        ('filename', 'fileName', 'name'),
+        lambda row, md: _metadata_value(md, 'filename', 'fileName', 'name', default=row.get('title') or ''),
+    ),
+    'original_filename': (
+        (),
+        ('originalFilename', 'original_name'),
+        lambda row, md: _metadata_value(md, 'originalFilename', 'original_name', default=None),
+    ),
+    'file_path': (('source_path',), ('sourcePath', 'filePath', 'path'), _media_file_path),
+    'file_size': ((), ('fileSize', 'sizeBytes', 'size'), _media_file_size),
+    'mime_type': ((), ('mimeType', 'contentType'), lambda row, md: _metadata_value(md, 'mimeType', 'contentType')),
+    'duration_seconds': (('duration_seconds',), ('duration', 'durationSeconds'), _media_duration),
+    'thumbnail_path': (
+        (),
+        ('thumbnailPath', 'thumbnail_path'),
+        lambda row, md: _metadata_value(md, 'thumbnailPath', 'thumbnail_path'),
+    ),
+    'poster_path': ((), ('posterPath', 'poster_path'), lambda row, md: _metadata_value(md, 'posterPath', 'poster_path')),
+    'artwork': ((), ('artwork',), lambda row, md: _metadata_value(md, 'artwork')),
+    'uploaded_by': ((), ('uploadedBy', 'uploader'), lambda row, md: _metadata_value(md, 'uploadedBy', 'uploader')),
+    'last_accessed': ((), ('lastAccessed',), lambda row, md: _metadata_value(md, 'lastAccessed')),
+    'metadata': (('metadata',), (), lambda row, md: md),
+    'created_at': (('created_at',), (), lambda row, md: _isoformat(row.get('created_at'))),
+    'updated_at': (('updated_at',), (), lambda row, md: _isoformat(row.get('updated_at'))),
+}
+
+COMPACT_MEDIA_FIELDS = (
+    'id', 'title', 'media_type', 'status', 'filename', 'file_size',
+    'duration_seconds', 'thumbnail_path', 'poster_path', 'created_at',
+)
+
+
+def _requested_media_fields() -> Optional[Tuple[str, ...]]:
+    """Fields selected by ``?fields=a,b`` or ``?view=compact``; ``None`` for the full legacy item.
+
+    Raises ``ValueError`` for unknown field names.
+    """
+    fields_param = request.args.get('fields')
+    if fields_param:
+        names = [name.strip() for name in fields_param.split(',') if name.strip()]
+        unknown = [name for name in names if name not in _MEDIA_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        return tuple(dict.fromkeys(['id', *names]))
+    if (request.args.get('view') or '').lower() == 'compact':
+        return COMPACT_MEDIA_FIELDS
+    return None
+
+
+def _media_select_list(fields: Optional[Tuple[str, ...]]) -> str:
+    """SELECT list for ``fields``; ``metadata`` is narrowed to the keys they read."""
+    if fields is None:
+        return (
+            "id, title, description, media_type, source_path, status, "
+            "metadata, duration_seconds, created_at, updated_at"
+        )
+    columns: Dict[str, None] = {}
+    metadata_keys: Dict[str, None] = {}
+    for name in fields:
+        field_columns, field_keys, _ = _MEDIA_FIELDS[name]
+        columns.update(dict.fromkeys(field_columns))
+        metadata_keys.update(dict.fromkeys(field_keys))
+    select = list(columns)
+    if 'metadata' not in columns and metadata_keys:
+        pairs = ', '.join(f"'{key}', metadata->'{key}'" for key in metadata_keys)
+        select.append(f"jsonb_build_object({pairs}) AS metadata")
+    return ', '.join(select)
+
+
+def _project_media_item_row(row: Dict[str, Any], fields: Tuple[str, ...]) -> Dict[str, Any]:
+    metadata = _ensure_metadata(row.get('metadata'))
+    return {name: _MEDIA_FIELDS[name][2](row, metadata) for name in fields}
+
 
-    media_type = row.get('media_type')
+def _map_media_item_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Full item with the legacy camelCase/alias keys the older UI still reads."""
+    item = _project_media_item_row(row, tuple(_MEDIA_FIELDS))
+    media_type = item['media_type']
+    file_path = item['file_path']
+    file_size = item['file_size']
+    duration_seconds = item['duration_seconds']
 
     mapped = {
-        'id': str(row.get('id')) if row.get('id') is not None else None,
-        'title': row.get('title'),
-        'description': row.get('description'),
+        'id': item['id'],
+        'title': item['title'],
+        'description': item['description'],
         'media_type': media_type,
         'mediaType': media_type,
-        'status': row.get('status'),
-        'filename': filename,
-        'original_filename': original_filename,
+        'status': item['status'],
+        'filename': item['filename'],
+        'original_filename': item['original_filename'],
         'file_path': file_path,
         'source_path': file_path,
         'sourcePath': file_path,
         'file_size': file_size,
         'fileSize': file_size,
-        'mime_type': _metadata_value(metadata, 'mimeType', 'contentType'),
+        'mime_type': item['mime_type'],
         'category': media_type,
         'duration_seconds': duration_seconds,
         'durationSeconds': duration_seconds,
         'duration': duration_seconds,
-        'thumbnail_path': _metadata_value(metadata, 'thumbnailPath', 'thumbnail_path'),
-        'poster_path': _metadata_value(metadata, 'posterPath', 'poster_path'),
-        'artwork': _metadata_value(metadata, 'artwork'),
-        'uploaded_by': _metadata_value(metadata, 'uploadedBy', 'uploader'),
-        'last_accessed': _metadata_value(metadata, 'lastAccessed'),
-        'metadata': metadata,
-        'created_at': created_at,
-        'createdAt': created_at,
-        'updated_at': updated_at,
-        'updatedAt': updated_at,
+        'thumbnail_path': item['thumbnail_path'],
+        'poster_path': item['poster_path'],
+        'artwork': item['artwork'],
+        'uploaded_by': item['uploaded_by'],
+        'last_accessed': item['last_accessed'],
+        'metadata': item['metadata'],
+        'created_at': item['created_at'],
+        'createdAt': item['created_at'],
+        'updated_at': item['updated_at'],
+        'updatedAt': item['updated_at'],
     }
 
     return mapped
@@ -157,6 +278,7 @@ def media_options():
 @router.route('', methods=['GET'], strict_slashes=False)
 @router.route('/', methods=['GET'], strict_slashes=False)
 @jwt_required()
+@conditional_get(catalog_version.current, _CATALOG_CACHE_CONTROL)
 def get_media():
     """Get media files with pagination from the `media_items` table."""
     conn = None
@@ -169,6 +291,15 @@ def get_media():
         status_filter = request.args.get('status')
         media_type_filter = request.args.get('media_type') or request.args.get('category')
         search_term = request.args.get('search')
+        try:
+            fields = _requested_media_fields()
+        except ValueError as exc:
+            return jsonify({"detail": str(exc)}), 400
+        if fields is None:
+            map_row = _map_media_item_row
+        else:
+            def map_row(row):
+                return _project_media_item_row(row, fields)
 
         sort_by_param = (request.args.get('sort_by') or 'created_at').lower()
         sort_order_param = (request.args.get('sort_order') or 'desc').lower()
@@ -176,18 +307,19 @@ def get_media():
         if sort_direction not in ('ASC', 'DESC'):
             sort_direction = 'ASC'
 
+        # Text sorts use the same key as the in-memory catalog index.
         if sort_by_param == 'title':
-            sort_column = 'title'
+            order_by = text_order_sql('title', sort_direction)
         elif sort_by_param == 'duration':
-            sort_column = 'duration_seconds'
+            order_by = f'duration_seconds {sort_direction}'
         elif sort_by_param == 'status':
-            sort_column = 'status'
+            order_by = text_order_sql('status', sort_direction)
         elif sort_by_param == 'filename':
-            sort_column = "COALESCE(metadata->>'filename', title)"
+            order_by = text_order_sql("COALESCE(NULLIF(metadata->>'filename', ''), title)", sort_direction)
         elif sort_by_param == 'file_size':
-            sort_column = "COALESCE(NULLIF(metadata->>'fileSize', ''), '0')::numeric"
+            order_by = f"COALESCE(NULLIF(metadata->>'fileSize', ''), '0')::numeric {sort_direction}"
         else:
-            sort_column = 'created_at'
+            order_by = f'created_at {sort_direction}'
 
         filters = []
         params = []
@@ -200,16 +332,37 @@ def get_media():
             filters.append('media_type = %s')
             params.append(media_type_filter)
 
-        if search_term:
-            like_term = f"%{search_term}%"
-            filters.append(
-                "(title ILIKE %s OR description ILIKE %s OR "
-                "metadata->>'filename' ILIKE %s OR metadata->>'originalFilename' ILIKE %s)"
-            )
-            params.extend([like_term, like_term, like_term, like_term])
+        order_params = []
+        if search_term and search_term.strip():
+            search = build_search_clause(search_term)
+            filters.append(search.where)
+            params.extend(search.params)
+            # Searches rank by relevance unless a sort was requested explicitly.
+            if search.rank and (sort_by_param == 'relevance' or 'sort_by' not in request.args):
+                order_by = f"({search.rank}) DESC"
+                order_params = search.rank_params
 
         where_clause = ' AND '.join(filters) if filters else 'TRUE'
 
+        offset = (page - 1) * limit
+        if not search_term:
+            indexed = query_catalog(
+                status=status_filter,
+                media_type=media_type_filter,
+                sort_by=sort_by_param if sort_by_param in CATALOG_SORT_KEYS else 'created_at',
+                descending=sort_direction == 'DESC',
+                offset=offset,
+                limit=limit,
+            )
+            if indexed is not None:
+                return jsonify({
+                    'items': [map_row(row) for row in indexed['rows']],
+                    'total': indexed['total'],
+                    'page': page,
+                    'page_size': limit,
+                    'categories': indexed['categories']
+                })
+
         conn = get_db_connection()
         cursor = conn.cursor()
 
@@ -218,18 +371,16 @@ def get_media():
         total_row = cursor.fetchone() or {'count': 0}
         total_count = _to_int(total_row.get('count'), default=0)
 
-        offset = (page - 1) * limit
         query = f"""
-            SELECT id, title, description, media_type, source_path, status,
-                   metadata, duration_seconds, created_at, updated_at
+            SELECT {_media_select_list(fields)}
             FROM media_items
             WHERE {where_clause}
-            ORDER BY {sort_column} {sort_direction}
+            ORDER BY {order_by}
             LIMIT %s OFFSET %s
         """
-        cursor.execute(query, params + [limit, offset])
+        cursor.execute(query, params + order_params + [limit, offset])
         rows = cursor.fetchall() or []
-        media_items = [_map_media_item_row(row) for row in rows]
+        media_items = [map_row(row) for row in rows]
 
         cursor.execute(
             """
@@ -263,77 +414,111 @@ def get_media():
 @router.route('/upload', methods=['POST'])
 @jwt_required()
 def upload_media():
-    """Upload a media file and create a record in `media_items`."""
-    if 'file' not in request.files:
-        return jsonify({"detail": "No file part in request"}), 400
+    """Upload a media file and create a record in `media_items`.
+
+    Accepts either a multipart ``file`` field or, for large files, a raw
+    ``application/octet-stream`` body named by the ``X-Filename`` header (form
+    fields then come from the query string). The raw body is written straight
+    from the socket without Werkzeug spooling it to a temporary file first.
+    """
+    if request.mimetype == 'application/octet-stream':
+        upload_name = unquote(request.headers.get('X-Filename') or request.args.get('filename') or '')
+        if not upload_name:
+            return jsonify({"detail": "Missing X-Filename header"}), 400
+        upload_stream = request.stream
+        upload_mimetype = request.headers.get('X-Content-Type') or mimetypes.guess_type(upload_name)[0]
+        form = request.args
+    else:
+        if 'file' not in request.files:
+            return jsonify({"detail": "No file part in request"}), 400
 
-    uploaded_file = request.files['file']
-    if not uploaded_file or uploaded_file.filename == '':
-        return jsonify({"detail": "Empty filename"}), 400
+        uploaded_file = request.files['file']
+        if not uploaded_file or uploaded_file.filename == '':
+            return jsonify({"detail": "Empty filename"}), 400
+        upload_name = uploaded_file.filename
+        upload_stream = uploaded_file.stream
+        upload_mimetype = uploaded_file.mimetype
+        form = request.form or {}
 
-    form = request.form or {}
     category_key = form.get('category')
     title = form.get('title')
     description = form.get('description')
 
+    category, error = _resolve_upload_category(category_key)
+    if error is not None:
+        return error
+
+    try:
+        stored = store_upload_stream(
+            upload_stream,
+            destination_dir=category.root_path,
+            filename=upload_name,
+        )
+    except Exception as exc:
+        print(f"Upload media error: {exc}")
+        return jsonify({"detail": f"Upload media error: {str(exc)}"}), 500
+
+    return _ingest_stored_upload(
+        stored,
+        category,
+        title=title,
+        description=description,
+        uploader=form.get('uploaded_by') or form.get('uploader') or form.get('user'),
+        mime_type=upload_mimetype,
+        original_filename=upload_name,
+    )
+
+
+def _resolve_upload_category(category_key: Optional[str]):
+    """Return ``(category, None)`` or ``(None, error_response)``."""
     try:
         config = load_media_config()
     except Exception as exc:
         print(f"Config load error: {exc}")
-        return jsonify({"detail": "Failed to load media configuration"}), 500
+        return None, (jsonify({"detail": "Failed to load media configuration"}), 500)
 
     categories = {cat.key: cat for cat in config.categories}
     category = None
     if category_key:
         category = categories.get(category_key)
         if category is None:
-            return jsonify({"detail": f"Unknown category '{category_key}'"}), 400
+            return None, (jsonify({"detail": f"Unknown category '{category_key}'"}), 400)
     else:
         category = config.default_category or (config.categories[0] if config.categories else None)
 
     if category is None:
-        return jsonify({"detail": "No media categories configured"}), 500
-
-    saved_path = None
+        return None, (jsonify({"detail": "No media categories configured"}), 500)
+    return category, None
+
+
+def _ingest_stored_upload(
+    stored: StoredUpload,
+    category,
+    *,
+    title: Optional[str],
+    description: Optional[str],
+    uploader: Optional[str],
+    mime_type: Optional[str],
+    original_filename: Optional[str],
+):
+    """Create the `media_items` row for a file already written to the library."""
     conn = None
     cursor = None
     try:
-        saved_path = save_uploaded_file(
-            uploaded_file,
-            destination_dir=category.root_path,
-            preferred_name=uploaded_file.filename,
-        )
-
         metadata = generate_file_metadata(
-            saved_path,
+            stored.path,
             category=category,
             title=title,
             description=description,
-            uploader=request.form.get('uploaded_by') or request.form.get('uploader') or request.form.get('user'),
-            mime_type=uploaded_file.mimetype,
-            original_filename=uploaded_file.filename,
+            uploader=uploader,
+            mime_type=mime_type,
+            original_filename=original_filename,
+            file_hash=stored.sha256,
         )
 
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO media_items (title, description, media_type, source_path, status, metadata, duration_seconds)
-            VALUES (%s, %s, %s, %s, %s, %s::jsonb, %s)
-            RETURNING id, title, description, media_type, source_path, status,
-                      metadata, duration_seconds, created_at, updated_at
-            """,
-            (
-                metadata.get('title'),
-                description or metadata.get('description'),
-                metadata.get('mediaType'),
-                metadata.get('sourcePath'),
-                STATUS_AVAILABLE,
-                json.dumps(metadata),
-                metadata.get('durationSeconds'),
-            ),
-        )
-        inserted_row = cursor.fetchone()
+        inserted_row = insert_uploaded_item(cursor, metadata, status=STATUS_AVAILABLE, description=description)
         conn.commit()
 
         response_payload = _map_media_item_row(inserted_row)
@@ -345,9 +530,9 @@ def upload_media():
     except Exception as exc:
         if conn is not None:
             conn.rollback()
-        if saved_path and Path(saved_path).exists():
+        if stored.path.exists():
             try:
-                os.remove(saved_path)
+                os.remove(stored.path)
             except OSError:
                 pass
         print(f"Upload media error: {exc}")
@@ -359,8 +544,147 @@ def upload_media():
             conn.close()
 
 
+def _upload_error(exc: UploadError):
+    return jsonify({"detail": str(exc)}), exc.status
+
+
+def _upload_headers(session) -> Dict[str, str]:
+    return {
+        'Upload-Offset': str(session.offset),
+        'Upload-Length': str(session.size),
+        'Cache-Control': 'no-store',
+    }
+
+
+@router.route('/uploads', methods=['POST'])
+@jwt_required()
+def create_chunked_upload():
+    """Start a resumable upload.
+
+    Body: ``{"filename", "size", "category"?, "title"?, "description"?, "mime_type"?}``.
+    Chunks are then sent with ``PATCH /uploads/<id>`` and the upload is
+    finished with ``POST /uploads/<id>/complete``.
+    """
+    payload = request.get_json(silent=True) or {}
+    filename = (payload.get('filename') or '').strip()
+    if not filename:
+        return jsonify({"detail": "filename is required"}), 400
+    try:
+        size = int(payload.get('size') or request.headers.get('Upload-Length') or 0)
+    except (TypeError, ValueError):
+        return jsonify({"detail": "size must be an integer"}), 400
+
+    category, error = _resolve_upload_category(payload.get('category'))
+    if error is not None:
+        return error
+
+    try:
+        session = chunked_uploads.create(
+            owner=get_jwt_identity(),
+            filename=filename,
+            size=size,
+            category=category,
+            title=payload.get('title'),
+            description=payload.get('description'),
+            mime_type=payload.get('mime_type') or mimetypes.guess_type(filename)[0],
+        )
+    except UploadError as exc:
+        return _upload_error(exc)
+    except Exception as exc:
+        print(f"Create upload error: {exc}")
+        return jsonify({"detail": f"Create upload error: {str(exc)}"}), 500
+
+    headers = _upload_headers(session)
+    headers['Location'] = url_for('media.get_chunked_upload', upload_id=session.id)
+    return jsonify(session.describe()), 201, headers
+
+
+@router.route('/uploads/<upload_id>', methods=['GET', 'HEAD'])
+@jwt_required()
+def get_chunked_upload(upload_id):
+    """Report the received ranges so a client can resume."""
+    try:
+        session = chunked_uploads.get(upload_id, get_jwt_identity())
+    except UploadError as exc:
+        return _upload_error(exc)
+    return jsonify(session.describe()), 200, _upload_headers(session)
+
+
+@router.route('/uploads/<upload_id>', methods=['PATCH'])
+@jwt_required()
+def upload_chunk(upload_id):
+    """Write the request body at ``Upload-Offset``; chunks may be sent in parallel."""
+    offset_header = request.headers.get('Upload-Offset')
+    if offset_header is None or request.content_length is None:
+        return jsonify({"detail": "Upload-Offset and Content-Length headers are required"}), 400
+    try:
+        offset = int(offset_header)
+    except ValueError:
+        return jsonify({"detail": "Upload-Offset must be an integer"}), 400
+
+    try:
+        session = chunked_uploads.write_chunk(
+            upload_id,
+            get_jwt_identity(),
+            offset,
+            request.stream,
+            request.content_length,
+        )
+    except UploadError as exc:
+        return _upload_error(exc)
+    except Exception as exc:
+        print(f"Upload chunk error: {exc}")
+        return jsonify({"detail": f"Upload chunk error: {str(exc)}"}), 500
+    return '', 204, _upload_headers(session)
+
+
+@router.route('/uploads/<upload_id>/complete', methods=['POST'])
+@jwt_required()
+def complete_chunked_upload(upload_id):
+    """Move a fully received upload into its category and create the media item."""
+    user_id = get_jwt_identity()
+    try:
+        session = chunked_uploads.get(upload_id, user_id)
+    except UploadError as exc:
+        return _upload_error(exc)
+
+    category, error = _resolve_upload_category(session.category)
+    if error is not None:
+        return error
+
+    try:
+        session, stored = chunked_uploads.complete(upload_id, user_id, category)
+    except UploadError as exc:
+        return _upload_error(exc)
+    except Exception as exc:
+        print(f"Complete upload error: {exc}")
+        return jsonify({"detail": f"Complete upload error: {str(exc)}"}), 500
+
+    return _ingest_stored_upload(
+        stored,
+        category,
+        title=session.title,
+        description=session.description,
+        uploader=user_id,
+        mime_type=session.mime_type,
+        original_filename=session.filename,
+    )
+
+
+@router.route('/uploads/<upload_id>', methods=['DELETE'])
+@jwt_required()
+def abort_chunked_upload(upload_id):
+    """Discard an unfinished upload and its staged data."""
+    try:
+        chunked_uploads.abort(upload_id, get_jwt_identity())
+    except UploadError as exc:
+        return _upload_error(exc)
+    return '', 204
+
+
 @router.route('/<media_id>', methods=['GET'])
 @jwt_required()
+@conditional_get(catalog_version.current, _CATALOG_CACHE_CONTROL)
 def get_media_detail(media_id):
     """Return a single media item."""
     conn = None
@@ -471,12 +795,10 @@ def get_scan_info():
         cursor = conn.cursor()
 
         try:
-            ensure_settings_table(cursor)
-
             # Load persisted scan directory if available
-            cursor.execute('SELECT value FROM system_settings WHERE key = %s', ('database',))
-            db_row = cursor.fetchone() or {}
-            database_settings = db_row.get('value') if isinstance(db_row.get('value'), dict) else {}
+            database_settings = get_setting('database', {})
+            if not isinstance(database_settings, dict):
+                database_settings = {}
             scan_directory = (database_settings.get('media_scan_root') or '/app/media').strip()
 
             cursor.execute(
@@ -530,6 +852,80 @@ def get_scan_info():
         print(f"Scan info error: {e}")
         return jsonify({"detail": f"Scan info error: {str(e)}"}), 500
 
+def _default_playback_quality() -> str:
+    playback = get_setting('playback', {})
+    quality = playback.get('default_quality') if isinstance(playback, dict) else None
+    return str(quality or 'auto').lower()
+
+
+def _file_etag(file_path: Path, stat: os.stat_result) -> str:
+    """Strong validator for the file actually served (path, size and mtime)."""
+    digest = hashlib.sha1(str(file_path).encode('utf-8')).hexdigest()[:8]
+    return f"{digest}-{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+def _if_range_matches(etag: str, stat: os.stat_result) -> bool:
+    """Whether a Range request may be honoured under its ``If-Range`` condition."""
+    if 'If-Range' not in request.headers:
+        return True
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return int(if_range.date.timestamp()) == int(stat.st_mtime)
+    return False
+
+
+def _rendition_url(media_id, quality: str, signature: Optional[str], token: Optional[str]) -> str:
+    params = {'quality': quality, 'rendition': rendition_key(signature)}
+    if token:
+        params['token'] = token
+    return url_for('media.stream_media', media_id=media_id, **params)
+
+
+def _rendition_redirect(
+    media_id,
+    quality: str,
+    metadata: Dict[str, Any],
+    token: Optional[str],
+    *,
+    authenticated: bool,
+    explicit: bool = True,
+):
+    """Redirect to the rendition's own URL, or report why it cannot be served.
+
+    Only ``authenticated`` callers queue a missing rendition. For the
+    ``playback.default_quality`` setting (``explicit=False``) nothing is
+    queued, and ``None`` means "serve the original".
+    """
+    signature = metadata.get('scannerSignature')
+    source_height = (metadata.get('probe') or {}).get('height')
+    if source_height and QUALITY_PRESETS[quality]['height'] >= source_height:
+        if not explicit:
+            return None
+        return jsonify({"detail": f"Source is not above {quality}; stream the original"}), 409
+    request_missing = authenticated and explicit
+    if transcodes.ready_path(media_id, quality, signature, request_missing=request_missing) is not None:
+        return redirect(_rendition_url(media_id, quality, signature, token), code=307)
+    if not explicit:
+        return None
+    error = transcodes.failure(media_id, quality, signature)
+    if error:
+        return jsonify({"detail": f"Transcode failed: {error}"}), 409
+    state = transcodes.state(media_id, quality)
+    if state is None and not authenticated:
+        return jsonify({"detail": "Authentication required to request a transcode"}), 401
+    response = jsonify({"media_id": str(media_id), "quality": quality, **(state or {"status": "pending"})})
+    response.headers['Retry-After'] = '5'
+    return response, 202
+
+
+def _starts_playback() -> bool:
+    """True for a request that opens the stream rather than continuing it."""
+    range_header = (request.headers.get('Range') or '').replace(' ', '')
+    return not range_header or range_header.startswith('bytes=0-')
+
+
 @router.route('/<media_id>/stream', methods=['GET', 'HEAD', 'OPTIONS'])
 @jwt_required(optional=True)  # Allow token in query parameter
 def stream_media(media_id):
@@ -538,12 +934,8 @@ def stream_media(media_id):
     cursor = None
     try:
         token = request.args.get('token')
-        if token:
-            from flask_jwt_extended import decode_token
-            try:
-                decode_token(token)
-            except Exception:
-                return jsonify({"detail": "Invalid token"}), 401
+        if token and verify_query_token(token, media_id) is None:
+            return jsonify({"detail": "Invalid token"}), 401
 
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -581,8 +973,41 @@ def stream_media(media_id):
             default=file_path.name,
         )
 
+        # Renditions have their own URL (?quality=&rendition=), so the bytes
+        # behind a URL never change while a player issues Range requests.
+        authenticated = bool(token) or get_jwt_identity() is not None
+        quality = (request.args.get('quality') or '').lower()
+        if not quality and _starts_playback():
+            # playback.default_quality: a ready rendition is picked when the
+            # stream is opened; later Range requests keep the original.
+            default_quality = _default_playback_quality()
+            if default_quality in QUALITY_PRESETS:
+                response = _rendition_redirect(
+                    media_id, default_quality, metadata, token, authenticated=authenticated, explicit=False
+                )
+                if response is not None:
+                    return response
+        if quality and quality not in SOURCE_QUALITIES:
+            signature = metadata.get('scannerSignature')
+            if quality not in QUALITY_PRESETS:
+                return jsonify({"detail": f"Unknown quality '{quality}'"}), 400
+            rendition = request.args.get('rendition')
+            if rendition is None:
+                return _rendition_redirect(media_id, quality, metadata, token, authenticated=authenticated)
+            rendition_path = None
+            if rendition == rendition_key(signature):
+                rendition_path = transcodes.ready_path(media_id, quality, signature)
+            if rendition_path is None:
+                return jsonify({"detail": "Rendition not available"}), 404
+            file_path = rendition_path
+            download_name = f"{Path(download_name).stem}-{quality}.mp4"
+
+        stat = file_path.stat()
+        file_size = stat.st_size
+        etag = _file_etag(file_path, stat)
         range_header = request.headers.get('Range')
-        file_size = file_path.stat().st_size
+        if range_header and not _if_range_matches(etag, stat):
+            range_header = None
 
         if range_header:
             byte_start = 0
@@ -616,6 +1041,8 @@ def stream_media(media_id):
             response.headers['Content-Range'] = f'bytes {byte_start}-{byte_end}/{file_size}'
             response.headers['Accept-Ranges'] = 'bytes'
             response.headers['Content-Length'] = str(content_length)
+            response.set_etag(etag)
+            response.last_modified = stat.st_mtime
 
             if request.method == 'HEAD':
                 response.response = []
@@ -628,7 +1055,9 @@ def stream_media(media_id):
             mimetype=mimetypes.guess_type(str(file_path))[0] or 'application/octet-stream',
             as_attachment=False,
             download_name=download_name,
+            etag=etag,
         )
+        response.headers['Accept-Ranges'] = 'bytes'
         if request.method == 'HEAD':
             response.response = []
             response.direct_passthrough = False
@@ -644,8 +1073,255 @@ def stream_media(media_id):
             conn.close()
 
 
+@router.route('/<media_id>/stream-token', methods=['POST'])
+@jwt_required()
+def create_stream_token(media_id):
+    """Issue a short-lived token scoped to streaming a single media item."""
+    try:
+        issued = issue_stream_token(media_id, get_jwt_identity())
+        return jsonify({
+            "token": issued["token"],
+            "expires_at": issued["expires_at"],
+            "stream_url": url_for('media.stream_media', media_id=media_id, token=issued["token"]),
+        })
+    except Exception as e:
+        print(f"Stream token error: {e}")
+        return jsonify({"detail": f"Stream token error: {str(e)}"}), 500
+
+
+@router.route('/<media_id>/transcodes', methods=['GET'])
+@jwt_required()
+def get_media_transcodes(media_id):
+    """List an item's transcoded renditions with their queue state.
+
+    Ready renditions carry their ``stream_url``; players switch to it rather
+    than expecting ``/stream`` to change files.
+    """
+    try:
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            cursor.execute(
+                """
+                SELECT t.quality, t.is_ready, t.processing_progress, t.error, t.file_size,
+                       t.width, t.height, t.bitrate, t.completed_at,
+                       t.source_signature IS NOT DISTINCT FROM m.metadata->>'scannerSignature' AS is_current,
+                       m.metadata->>'scannerSignature' AS signature
+                FROM transcoded_files t
+                JOIN media_items m ON m.id::text = t.media_item_id
+                WHERE t.media_item_id = %s AND t.format = %s
+                """,
+                (str(media_id), TRANSCODE_FORMAT),
+            )
+            rows = {row["quality"]: row for row in cursor.fetchall() or []}
+
+        renditions = []
+        for quality in QUALITY_PRESETS:
+            row = rows.get(quality)
+            state = transcodes.state(media_id, quality)
+            if row is None and state is None:
+                continue
+            entry = {"quality": quality, "status": "missing"}
+            if row is not None:
+                entry.update({
+                    "status": "ready" if row["is_ready"] and row["is_current"] else (
+                        "failed" if row["error"] else "stale" if not row["is_current"] else "pending"
+                    ),
+                    "progress": row["processing_progress"],
+                    "error": row["error"],
+                    "file_size": row["file_size"],
+                    "width": row["width"],
+                    "height": row["height"],
+                    "bitrate": row["bitrate"],
+                    "completed_at": _isoformat(row["completed_at"]),
+                })
+                if entry["status"] == "ready":
+                    entry["stream_url"] = _rendition_url(media_id, quality, row["signature"], None)
+            if state is not None:
+                entry.update(state)
+            renditions.append(entry)
+
+        return jsonify({
+            "media_id": str(media_id),
+            "qualities": list(QUALITY_PRESETS),
+            "default_quality": _default_playback_quality(),
+            "renditions": renditions,
+        })
+
+    except Exception as e:
+        print(f"Transcode list error: {e}")
+        return jsonify({"detail": f"Transcode list error: {str(e)}"}), 500
+
+
+@router.route('/<media_id>/transcodes', methods=['POST'])
+@jwt_required()
+def request_media_transcode(media_id):
+    """Queue an on-demand transcode (``{"quality": "720p"}``) ahead of background work."""
+    try:
+        payload = request.get_json(silent=True) or {}
+        quality = str(payload.get('quality') or '').lower()
+        try:
+            status = transcodes.enqueue(media_id, quality, PRIORITY_ON_DEMAND)
+        except TranscodeError as exc:
+            return jsonify({"detail": str(exc)}), exc.status
+        state = transcodes.state(media_id, quality) or {"status": status}
+        return jsonify({"media_id": str(media_id), "quality": quality, **state}), 202
+
+    except Exception as e:
+        print(f"Transcode request error: {e}")
+        return jsonify({"detail": f"Transcode request error: {str(e)}"}), 500
+
+
+def _with_token(playlist: str, token: str) -> str:
+    """Append ``token`` to every URI in an HLS playlist (players drop the query string)."""
+    suffix = f"?token={token}"
+    lines = []
+    for line in playlist.splitlines():
+        if line and not line.startswith('#'):
+            line = f"{line}{suffix}"
+        elif line.startswith('#EXT-X-MAP:URI="'):
+            uri, _, rest = line[len('#EXT-X-MAP:URI="'):].partition('"')
+            line = f'#EXT-X-MAP:URI="{uri}{suffix}"{rest}'
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+@router.route('/<media_id>/hls', methods=['GET'])
+@jwt_required(optional=True)  # Allow token in query parameter
+def get_media_hls(media_id):
+    """Report HLS packaging state; queues packaging when no current rendition exists.
+
+    Packaging runs ffmpeg and can evict other renditions, so it is only queued
+    for a signed-in user or a verified stream token.
+    """
+    try:
+        token = request.args.get('token')
+        if token and verify_query_token(token, media_id) is None:
+            return jsonify({"detail": "Invalid token"}), 401
+        authenticated = bool(token) or get_jwt_identity() is not None
+
+        try:
+            state = hls_packager.status(media_id, enqueue=authenticated)
+        except HlsError as exc:
+            return jsonify({"detail": str(exc)}), exc.status
+        if state["status"] == "missing":
+            return jsonify({"detail": "Authentication required to start HLS packaging"}), 401
+
+        if state["status"] == "ready":
+            state["playlist_url"] = url_for(
+                'media.get_media_hls_file',
+                media_id=media_id,
+                rendition=state["rendition"],
+                filename=PLAYLIST_NAME,
+                token=token,
+            )
+            return jsonify(state)
+        if state["status"] == "failed":
+            return jsonify(state), 422
+        response = jsonify(state)
+        response.status_code = 202
+        response.headers['Retry-After'] = '5'
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    except Exception as e:
+        print(f"HLS error: {e}")
+        return jsonify({"detail": f"HLS error: {str(e)}"}), 500
+
+
+@router.route('/<media_id>/hls/<rendition>/<filename>', methods=['GET', 'HEAD'])
+@jwt_required(optional=True)  # Allow token in query parameter
+def get_media_hls_file(media_id, rendition, filename):
+    """Serve a packaged HLS playlist, init segment or media segment."""
+    try:
+        token = request.args.get('token')
+        if token and verify_query_token(token, media_id) is None:
+            return jsonify({"detail": "Invalid token"}), 401
+
+        file_path = hls_packager.resolve(media_id, rendition, filename)
+        if file_path is None:
+            return jsonify({"detail": "HLS file not found"}), 404
+
+        mimetype = _HLS_MIMETYPES.get(file_path.suffix, 'application/octet-stream')
+        if filename == PLAYLIST_NAME:
+            hls_packager.touch(media_id)
+            playlist = file_path.read_text(encoding='utf-8')
+            if token:
+                playlist = _with_token(playlist, token)
+            response = Response(playlist, mimetype=mimetype)
+        else:
+            response = send_file(file_path, mimetype=mimetype, as_attachment=False, conditional=True)
+        response.headers['Cache-Control'] = _HLS_CACHE_CONTROL
+        return response
+
+    except Exception as e:
+        print(f"HLS file error: {e}")
+        return jsonify({"detail": f"HLS file error: {str(e)}"}), 500
+
+
+@router.route('/<media_id>/subtitles', methods=['GET'])
+@jwt_required(optional=True)  # Allow token in query parameter
+def get_media_subtitles(media_id):
+    """List sidecar subtitles indexed for a media item, with WebVTT URLs."""
+    try:
+        token = request.args.get('token')
+        if token and verify_query_token(token, media_id) is None:
+            return jsonify({"detail": "Invalid token"}), 401
+
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            rows = list_subtitles(cursor, media_id)
+
+        subtitles = [
+            SubtitleInfo(
+                id=str(row['id']),
+                filename=Path(row['source_path']).name,
+                language=row['language'],
+                format=row['format'],
+                size=int(row['size_bytes'] or 0),
+                url=url_for('media.get_media_subtitle', media_id=media_id, subtitle_id=row['id'], token=token),
+                forced=row['is_forced'],
+                hearing_impaired=row['is_hearing_impaired'],
+            ).model_dump()
+            for row in rows
+        ]
+        return jsonify({"media_id": str(media_id), "subtitles": subtitles})
+
+    except Exception as e:
+        print(f"Subtitle list error: {e}")
+        return jsonify({"detail": f"Subtitle list error: {str(e)}"}), 500
+
+
+@router.route('/<media_id>/subtitles/<int:subtitle_id>.vtt', methods=['GET', 'HEAD'])
+@jwt_required(optional=True)  # Allow token in query parameter
+def get_media_subtitle(media_id, subtitle_id):
+    """Serve a subtitle as WebVTT from the conversion cache."""
+    try:
+        token = request.args.get('token')
+        if token and verify_query_token(token, media_id) is None:
+            return jsonify({"detail": "Invalid token"}), 401
+
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            subtitle = get_subtitle(cursor, media_id, subtitle_id)
+        if not subtitle:
+            return jsonify({"detail": "Subtitle not found"}), 404
+
+        try:
+            cached = webvtt_path(subtitle)
+        except FileNotFoundError:
+            return jsonify({"detail": "Subtitle file not found on disk"}), 404
+
+        # Served as a regular body (not send_file) so the response can be compressed.
+        response = Response(cached.read_bytes(), mimetype='text/vtt')
+        response.set_etag(cached.stem)
+        response.headers['Cache-Control'] = _SUBTITLE_CACHE_CONTROL
+        return response.make_conditional(request)
+
+    except Exception as e:
+        print(f"Subtitle error: {e}")
+        return jsonify({"detail": f"Subtitle error: {str(e)}"}), 500
+
+
 @router.route('/<media_id>/poster', methods=['GET', 'HEAD'])
 @jwt_required(optional=True)
+@conditional_get(catalog_version.current, _POSTER_CACHE_CONTROL)
 def get_media_poster(media_id):
     """Serve poster or thumbnail image for a media item from metadata."""
     conn = None
@@ -740,8 +1416,72 @@ def get_media_poster(media_id):
             conn.close()
 
 
+@router.route('/<media_id>/trickplay', methods=['GET'])
+@jwt_required(optional=True)  # Allow token in query parameter
+def get_media_trickplay(media_id):
+    """Describe the seek-preview sprite sheets generated for a video."""
+    try:
+        token = request.args.get('token')
+        if token and verify_query_token(token, media_id) is None:
+            return jsonify({"detail": "Invalid token"}), 401
+
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            cursor.execute("SELECT metadata FROM media_items WHERE id = %s", (media_id,))
+            row = cursor.fetchone()
+        if not row:
+            return jsonify({"detail": "Media not found"}), 404
+
+        manifest = trickplay_manifest(media_id, _ensure_metadata(row.get('metadata')).get('scannerSignature'))
+        if manifest is None:
+            return jsonify({"detail": "Seek previews have not been generated for this item"}), 404
+
+        manifest["vtt_url"] = url_for(
+            'media.get_media_trickplay_file',
+            media_id=media_id,
+            rendition=manifest["rendition"],
+            filename=TRICKPLAY_INDEX,
+            token=token,
+        )
+        return jsonify(manifest)
+
+    except Exception as e:
+        print(f"Trickplay error: {e}")
+        return jsonify({"detail": f"Trickplay error: {str(e)}"}), 500
+
+
+@router.route('/<media_id>/trickplay/<rendition>/<filename>', methods=['GET', 'HEAD'])
+@jwt_required(optional=True)  # Allow token in query parameter
+def get_media_trickplay_file(media_id, rendition, filename):
+    """Serve a sprite sheet or the WebVTT index that maps times to tiles."""
+    try:
+        token = request.args.get('token')
+        if token and verify_query_token(token, media_id) is None:
+            return jsonify({"detail": "Invalid token"}), 401
+
+        file_path = resolve_trickplay(media_id, rendition, filename)
+        if file_path is None:
+            return jsonify({"detail": "Seek preview not found"}), 404
+
+        if filename == TRICKPLAY_INDEX:
+            index = file_path.read_text(encoding='utf-8')
+            if token:
+                # sheet_000.jpg#xywh=... -> sheet_000.jpg?token=...#xywh=...
+                index = index.replace('#xywh=', f'?token={token}#xywh=')
+            response = Response(index, mimetype='text/vtt')
+        else:
+            mimetype = mimetypes.guess_type(filename)[0] or 'image/jpeg'
+            response = send_file(file_path, mimetype=mimetype, as_attachment=False, conditional=True)
+        response.headers['Cache-Control'] = _TRICKPLAY_CACHE_CONTROL
+        return response
+
+    except Exception as e:
+        print(f"Trickplay file error: {e}")
+        return jsonify({"detail": f"Trickplay file error: {str(e)}"}), 500
+
+
 @router.route('/categories', methods=['GET'])
 @jwt_required()
+@conditional_get(catalog_version.current, _CATEGORIES_CACHE_CONTROL)
 def get_media_categories():
     """Get media categories with counts from `media_items`."""
     try:
@@ -767,112 +1507,71 @@ def get_media_categories():
         print(f"Categories error: {e}")
         return jsonify({"detail": f"Categories error: {str(e)}"}), 500
 
+@router.route('/search/suggest', methods=['GET'])
+@jwt_required()
+def suggest_media():
+    """Prefix autocomplete over titles and series/artist/album names"""
+    try:
+        prefix = (request.args.get('q') or '').strip()
+        if not prefix:
+            return jsonify({"query": prefix, "suggestions": []})
+        limit = request.args.get('limit', 10, type=int)
+        media_type = request.args.get('media_type') or request.args.get('category')
+
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            suggestions = suggest(cursor, prefix, limit=limit, media_type=media_type)
+
+        return jsonify({"query": prefix, "suggestions": suggestions})
+
+    except Exception as e:
+        print(f"Search suggest error: {e}")
+        return jsonify({"detail": f"Search suggest error: {str(e)}"}), 500
+
 @router.route('/scan-unraid', methods=['POST'])
 @jwt_required()
+@superuser_required
 def scan_unraid_media():
-    """Scan Unraid media using direct T: drive access (bypasses Docker mount issues)"""
+    """Queue an in-process Unraid scan; results are imported into media_items"""
     try:
-        # Check admin permissions
-        from flask_jwt_extended import get_jwt_identity
-        user_id = get_jwt_identity()
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT is_superuser FROM users WHERE id = %s", (user_id,))
-        user = cursor.fetchone()
-        
-        if not user or not user['is_superuser']:
-            return jsonify({"detail": "Not enough permissions"}), 403
-        
-        # Get request parameters
-        data = request.get_json() or {}
-        scan_method = data.get('scan_method', 'direct_t_drive')
-        
-        print(f"Starting Unraid scan with method: {scan_method}")
-        
-        # Import and run the unified Unraid scanner
-        import subprocess
-        import os
-        
-        # Run the unified scanner as a subprocess
-        scanner_path = '/app/tools/unified-unraid-scanner.py'
-        
-        # Set environment variables for the scanner
-        env = os.environ.copy()
-        env['ENV_TYPE'] = 'local'
-        env['UNRAID_ACCESS_METHOD'] = 'direct_scanner'
-        env['T_DRIVE_PATH'] = 'T:\\'
-        
-        # Run the scanner with a timeout
-        try:
-            result = subprocess.run([
-                'python', '/app/tools/unified-unraid-scanner.py'
-            ], capture_output=True, text=True, timeout=300, env=env, cwd='/app')
-            
-            if result.returncode == 0:
-                # Parse the output to extract scan results
-                output_lines = result.stdout.strip().split('\n')
-                
-                # Look for the results summary
-                total_files = 0
-                categories_found = {}
-                
-                for line in output_lines:
-                    if 'TOTAL FILES FOUND:' in line:
-                        try:
-                            total_files = int(line.split(':')[1].strip())
-                        except:
-                            pass
-                    elif '|' in line and 'files |' in line:
-                        # Parse category results like "movies | collection | 732 files | [MOUNT]"
-                        parts = line.split('|')
-                        if len(parts) >= 3:
-                            category = parts[0].strip()
-                            files_part = parts[2].strip()
-                            if 'files' in files_part:
-                                try:
-                                    file_count = int(files_part.split()[0])
-                                    categories_found[category] = file_count
-                                except:
-                                    pass
-                
-                return jsonify({
-                    "message": "Unraid media scan completed successfully via direct T: drive access",
-                    "scan_method": scan_method,
-                    "total_files_found": total_files,
-                    "files_added": 0,  # Scanner doesn't update DB directly
-                    "files_updated": 0,
-                    "directories_scanned": len(categories_found),
-                    "scan_results": categories_found,
-                    "scan_status": "completed",
-                    "scanner_output": output_lines[-5:] if len(output_lines) > 5 else output_lines,
-                    "note": "Files scanned from T: drive. Results show available media but are not imported to database."
-                })
-            else:
-                return jsonify({
-                    "detail": f"Unraid scanner failed with return code {result.returncode}",
-                    "error_output": result.stderr[:500] if result.stderr else "No error output",
-                    "scan_method": scan_method
-                }), 500
-                
-        except subprocess.TimeoutExpired:
-            return jsonify({
-                "detail": "Unraid scan timed out (5 minutes)",
-                "scan_method": scan_method
-            }), 408
-        except FileNotFoundError:
-            return jsonify({
-                "detail": "Unraid scanner script not found",
-                "scan_method": scan_method,
-                "note": "Direct T: drive scanner is not available in this container"
-            }), 404
-            
+        data = request.get_json(silent=True) or {}
+        categories = data.get('categories')
+        if categories is not None and not isinstance(categories, list):
+            return jsonify({"detail": "categories must be a list of category keys"}), 400
+        limit = data.get('limit')
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except (TypeError, ValueError):
+                return jsonify({"detail": "limit must be an integer"}), 400
+        dry_run = not data.get('import', True)
+
+        job = submit_job(
+            "unraid_scan",
+            run_unraid_scan,
+            categories=categories,
+            dry_run=dry_run,
+            limit=limit,
+        )
+
+        return jsonify({
+            "message": "Unraid media scan queued",
+            "job_id": job["id"],
+            "status": job["status"],
+            "dry_run": dry_run,
+            "status_url": url_for('media.get_unraid_scan_status', job_id=job["id"]),
+        }), 202
+
     except Exception as e:
         print(f"Unraid scan error: {e}")
         return jsonify({"detail": f"Unraid scan error: {str(e)}"}), 500
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
+
+
+@router.route('/scan-unraid/<int:job_id>', methods=['GET'])
+@jwt_required()
+@superuser_required
+def get_unraid_scan_status(job_id):
+    """Return the state and structured results of a queued Unraid scan"""
+    job = get_job(job_id)
+    if not job or job["job_name"] != "unraid_scan":
+        return jsonify({"detail": "Scan job not found"}), 404
+    return jsonify(job)
@@ -3,9 +3,15 @@ Flask-compatible playlist endpoints extracted from working flask_simple.py,
 updated to match the current frontend API expectations.
 """
 
+from contextlib import closing
+
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from psycopg2.extras import Json
 from postgres_config import get_db_connection
+from app.services.playlist_cache import owner_scope, playlist_cache, playlist_scope
+from app.services.playlist_order import MAX_BATCH, append_items, move_items, remove_items
+from app.services.smart_playlists import SmartFilterError, compile_filters, smart_playlists
 
 
 router = Blueprint('playlists', __name__)
@@ -20,24 +26,104 @@ def _playlist_to_dict(row, include_counts: bool = False):
         'created_at': row['created_at'].isoformat() if row.get('created_at') else None,
         'updated_at': row['updated_at'].isoformat() if row.get('updated_at') else None,
         'owner_id': row.get('owner_id'),
+        'is_smart': bool(row.get('is_smart')),
+        'smart_filters': row.get('smart_filters'),
         **({'items': row.get('items', []), 'item_count': row.get('item_count', 0)} if include_counts else {})
     }
 
 
-@router.route('/', methods=['GET'])
-@jwt_required()
-def list_playlists():
-    """Return all playlists owned by the current user."""
-    try:
-        user_id = get_jwt_identity()
+def _item_to_dict(playlist_id, row):
+    return {
+        'id': row['id'],
+        'playlist_id': playlist_id,
+        'mediaItemId': row['media_id'],
+        'position': row['position'],
+        'addedAt': row['added_at'].isoformat() if row.get('added_at') else None,
+    }
+
+
+def _smart_item_to_dict(playlist_id, position, row):
+    metadata = row.get('metadata') or {}
+    return {
+        'item': {
+            'id': None,
+            'playlist_id': playlist_id,
+            'mediaItemId': row['id'],
+            'position': position,
+            'addedAt': None,
+        },
+        'media': {
+            'id': row['id'],
+            'title': row.get('title'),
+            'filename': metadata.get('filename'),
+            'durationSeconds': row.get('duration_seconds'),
+            'category': metadata.get('category'),
+            'fileSize': metadata.get('fileSize'),
+            'year': row.get('year'),
+        },
+    }
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
 
+def _smart_settings(data, is_smart=False, smart_filters=None):
+    """Apply ``is_smart``/``smart_filters`` from ``data``; returns (is_smart, filters, error)."""
+    is_smart = bool(data.get('is_smart', is_smart))
+    smart_filters = data.get('smart_filters', smart_filters)
+    if is_smart:
+        try:
+            compile_filters(smart_filters)
+        except SmartFilterError as exc:
+            return is_smart, smart_filters, str(exc)
+    return is_smart, smart_filters, None
+
+
+def _media_id_list(data):
+    """Parse ``media_ids`` from a bulk request body; returns (ids, error)."""
+    media_ids = data.get('media_ids')
+    if not isinstance(media_ids, list) or not media_ids:
+        return None, "'media_ids' must be a non-empty list"
+    if len(media_ids) > MAX_BATCH:
+        return None, f"At most {MAX_BATCH} media ids per request"
+    try:
+        return list(dict.fromkeys(int(media_id) for media_id in media_ids)), None
+    except (TypeError, ValueError):
+        return None, "'media_ids' must contain integer ids"
+
+
+def _lock_owned_playlist(cursor, playlist_id, user_id):
+    """Lock a playlist for an item mutation; returns an error response or ``None``.
+
+    The row lock serializes concurrent mutations of one playlist, so appends
+    cannot compute the same tail position.
+    """
+    cursor.execute(
+        "SELECT owner_id, is_smart FROM playlists WHERE id = %s AND is_deleted = FALSE FOR UPDATE",
+        (playlist_id,),
+    )
+    playlist = cursor.fetchone()
+    if not playlist:
+        return jsonify({'detail': 'Playlist not found'}), 404
+    if playlist['owner_id'] != int(user_id):
+        return jsonify({'detail': 'Not authorized to modify this playlist'}), 403
+    if playlist['is_smart']:
+        return jsonify({'detail': 'Smart playlist items are computed from its filters'}), 409
+    return None
+
+
+def _invalidate(conn, cursor, user_id, playlist_id=None):
+    """Drop cached reads touched by a committed mutation."""
+    scopes = [owner_scope(user_id)]
+    if playlist_id is not None:
+        scopes.append(playlist_scope(playlist_id))
+    playlist_cache.invalidate(conn, cursor, scopes)
+
+
+def _load_owner_playlists(user_id):
+    with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
         cursor.execute(
             """
             SELECT p.id, p.name, p.description, p.is_public, p.created_at, p.updated_at,
-                   p.owner_id, COUNT(pi.id) AS item_count
+                   p.owner_id, p.is_smart, p.smart_filters,
+                   CASE WHEN p.is_smart THEN NULL ELSE COUNT(pi.id) END AS item_count
             FROM playlists p
             LEFT JOIN playlist_items pi ON p.id = pi.playlist_id
             WHERE p.owner_id = %s AND p.is_deleted = FALSE
@@ -46,76 +132,28 @@ def list_playlists():
             """,
             (user_id,),
         )
-
-        playlists = [_playlist_to_dict(row, include_counts=True) for row in cursor.fetchall()]
-        return jsonify({'playlists': playlists})
-    except Exception as error:  # noqa: BLE001
-        print(f"Playlists list error: {error}")
-        return jsonify({'detail': 'Failed to load playlists'}), 500
+        return [_playlist_to_dict(row, include_counts=True) for row in cursor.fetchall()]
 
 
-@router.route('/', methods=['POST'])
-@jwt_required()
-def create_playlist():
-    """Create a new playlist for the current user."""
-    try:
-        user_id = get_jwt_identity()
-        data = request.get_json() or {}
-
-        name = (data.get('name') or '').strip()
-        description = (data.get('description') or '').strip() or None
-        is_public = bool(data.get('is_public', False))
-
-        if not name:
-            return jsonify({'detail': 'Playlist name is required'}), 400
-
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
+def _load_playlist(playlist_id):
+    """Playlist payload with its items; smart playlists carry no items here."""
+    with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
         cursor.execute(
             """
-            INSERT INTO playlists (name, description, is_public, owner_id)
-            VALUES (%s, %s, %s, %s)
-            RETURNING id, name, description, is_public, created_at, updated_at, owner_id
-            """,
-            (name, description, is_public, user_id),
-        )
-
-        playlist = cursor.fetchone()
-        conn.commit()
-        return jsonify(_playlist_to_dict(playlist, include_counts=True)), 201
-    except Exception as error:  # noqa: BLE001
-        print(f"Create playlist error: {error}")
-        if 'conn' in locals():
-            conn.rollback()
-        return jsonify({'detail': 'Failed to create playlist'}), 500
-
-
-@router.route('/<playlist_id>', methods=['GET'])
-@jwt_required()
-def get_playlist(playlist_id):
-    """Get a single playlist with items."""
-    try:
-        user_id = get_jwt_identity()
-
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            """
-            SELECT id, name, description, is_public, created_at, updated_at, owner_id
+            SELECT id, name, description, is_public, created_at, updated_at, owner_id,
+                   is_smart, smart_filters
             FROM playlists
             WHERE id = %s AND is_deleted = FALSE
             """,
             (playlist_id,),
         )
-
         playlist = cursor.fetchone()
         if not playlist:
-            return jsonify({'detail': 'Playlist not found'}), 404
+            return None
 
-        if playlist['owner_id'] != int(user_id):
-            return jsonify({'detail': 'Not authorized to view this playlist'}), 403
+        response = _playlist_to_dict(playlist, include_counts=True)
+        if playlist['is_smart']:
+            return response
 
         cursor.execute(
             """
@@ -129,16 +167,9 @@ def get_playlist(playlist_id):
             """,
             (playlist_id,),
         )
-
         items = [
             {
-                'item': {
-                    'id': row['id'],
-                    'playlist_id': playlist_id,
-                    'mediaItemId': row['media_id'],
-                    'position': row['position'],
-                    'addedAt': row['added_at'].isoformat() if row['added_at'] else None,
-                },
+                'item': _item_to_dict(playlist_id, row),
                 'media': {
                     'id': row['media_id'],
                     'title': row.get('title'),
@@ -150,10 +181,89 @@ def get_playlist(playlist_id):
             }
             for row in cursor.fetchall()
         ]
-
-        response = _playlist_to_dict(playlist, include_counts=True)
         response['items'] = items
         response['item_count'] = len(items)
+        return response
+
+
+@router.route('/', methods=['GET'])
+@jwt_required()
+def list_playlists():
+    """Return all playlists owned by the current user."""
+    try:
+        user_id = get_jwt_identity()
+        playlists = playlist_cache.get_or_load(owner_scope(user_id), lambda: _load_owner_playlists(user_id))
+        return jsonify({'playlists': playlists})
+    except Exception as error:  # noqa: BLE001
+        print(f"Playlists list error: {error}")
+        return jsonify({'detail': 'Failed to load playlists'}), 500
+
+
+@router.route('/', methods=['POST'])
+@jwt_required()
+def create_playlist():
+    """Create a new playlist for the current user."""
+    try:
+        user_id = get_jwt_identity()
+        data = request.get_json() or {}
+
+        name = (data.get('name') or '').strip()
+        description = (data.get('description') or '').strip() or None
+        is_public = bool(data.get('is_public', False))
+
+        if not name:
+            return jsonify({'detail': 'Playlist name is required'}), 400
+        is_smart, smart_filters, message = _smart_settings(data)
+        if message:
+            return jsonify({'detail': message}), 400
+
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            cursor.execute(
+                """
+                INSERT INTO playlists (name, description, is_public, owner_id, is_smart, smart_filters)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                RETURNING id, name, description, is_public, created_at, updated_at, owner_id,
+                          is_smart, smart_filters
+                """,
+                (name, description, is_public, user_id, is_smart, Json(smart_filters) if smart_filters is not None else None),
+            )
+
+            playlist = cursor.fetchone()
+            conn.commit()
+            _invalidate(conn, cursor, user_id)
+            return jsonify(_playlist_to_dict(playlist, include_counts=True)), 201
+    except Exception as error:  # noqa: BLE001
+        print(f"Create playlist error: {error}")
+        return jsonify({'detail': 'Failed to create playlist'}), 500
+
+
+@router.route('/<playlist_id>', methods=['GET'])
+@jwt_required()
+def get_playlist(playlist_id):
+    """Get a single playlist with items."""
+    try:
+        user_id = get_jwt_identity()
+
+        cached = playlist_cache.get_or_load(playlist_scope(playlist_id), lambda: _load_playlist(playlist_id))
+        if not cached:
+            return jsonify({'detail': 'Playlist not found'}), 404
+
+        if cached['owner_id'] != int(user_id):
+            return jsonify({'detail': 'Not authorized to view this playlist'}), 403
+
+        if not cached['is_smart']:
+            return jsonify(cached)
+
+        # Smart items depend on the catalog and the viewer: evaluate them per request.
+        response = dict(cached)
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            rows = smart_playlists.items(cursor, response, user_id)
+            conn.commit()
+        response['items'] = [
+            _smart_item_to_dict(playlist_id, position, row)
+            for position, row in enumerate(rows, start=1)
+        ]
+        response['item_count'] = len(rows)
         return jsonify(response)
     except Exception as error:  # noqa: BLE001
         print(f"Get playlist error: {error}")
@@ -168,61 +278,62 @@ def update_playlist(playlist_id):
         user_id = get_jwt_identity()
         data = request.get_json() or {}
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            "SELECT owner_id FROM playlists WHERE id = %s AND is_deleted = FALSE",
-            (playlist_id,),
-        )
-        playlist = cursor.fetchone()
-        if not playlist:
-            return jsonify({'detail': 'Playlist not found'}), 404
-        if playlist['owner_id'] != int(user_id):
-            return jsonify({'detail': 'Not authorized to modify this playlist'}), 403
-
-        updates = []
-        params = []
-        if 'name' in data:
-            new_name = (data.get('name') or '').strip()
-            if not new_name:
-                return jsonify({'detail': 'Playlist name cannot be empty'}), 400
-            updates.append('name = %s')
-            params.append(new_name)
-        if 'description' in data:
-            updates.append('description = %s')
-            params.append((data.get('description') or '').strip() or None)
-        if 'is_public' in data:
-            updates.append('is_public = %s')
-            params.append(bool(data.get('is_public')))
-
-        if not updates:
-            return jsonify({'detail': 'No changes provided'}), 400
-
-        updates.append('updated_at = NOW()')
-        params.append(playlist_id)
-
-        cursor.execute(
-            f"UPDATE playlists SET {', '.join(updates)} WHERE id = %s RETURNING id",
-            params,
-        )
-        if not cursor.fetchone():
-            return jsonify({'detail': 'Playlist update failed'}), 500
-        conn.commit()
-
-        cursor.execute(
-            """
-            SELECT id, name, description, is_public, created_at, updated_at, owner_id
-            FROM playlists WHERE id = %s
-            """,
-            (playlist_id,),
-        )
-        updated = cursor.fetchone()
-        return jsonify(_playlist_to_dict(updated, include_counts=True))
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            cursor.execute(
+                "SELECT owner_id, is_smart, smart_filters FROM playlists WHERE id = %s AND is_deleted = FALSE",
+                (playlist_id,),
+            )
+            playlist = cursor.fetchone()
+            if not playlist:
+                return jsonify({'detail': 'Playlist not found'}), 404
+            if playlist['owner_id'] != int(user_id):
+                return jsonify({'detail': 'Not authorized to modify this playlist'}), 403
+
+            updates = []
+            params = []
+            if 'name' in data:
+                new_name = (data.get('name') or '').strip()
+                if not new_name:
+                    return jsonify({'detail': 'Playlist name cannot be empty'}), 400
+                updates.append('name = %s')
+                params.append(new_name)
+            if 'description' in data:
+                updates.append('description = %s')
+                params.append((data.get('description') or '').strip() or None)
+            if 'is_public' in data:
+                updates.append('is_public = %s')
+                params.append(bool(data.get('is_public')))
+            if 'is_smart' in data or 'smart_filters' in data:
+                is_smart, smart_filters, message = _smart_settings(
+                    data, playlist['is_smart'], playlist['smart_filters']
+                )
+                if message:
+                    return jsonify({'detail': message}), 400
+                updates.extend(['is_smart = %s', 'smart_filters = %s'])
+                params.extend([is_smart, Json(smart_filters) if smart_filters is not None else None])
+
+            if not updates:
+                return jsonify({'detail': 'No changes provided'}), 400
+
+            updates.append('updated_at = NOW()')
+            params.append(playlist_id)
+
+            cursor.execute(
+                f"""
+                UPDATE playlists SET {', '.join(updates)} WHERE id = %s
+                RETURNING id, name, description, is_public, created_at, updated_at, owner_id,
+                          is_smart, smart_filters
+                """,
+                params,
+            )
+            updated = cursor.fetchone()
+            if not updated:
+                return jsonify({'detail': 'Playlist update failed'}), 500
+            conn.commit()
+            _invalidate(conn, cursor, user_id, playlist_id)
+            return jsonify(_playlist_to_dict(updated, include_counts=True))
     except Exception as error:  # noqa: BLE001
         print(f"Update playlist error: {error}")
-        if 'conn' in locals():
-            conn.rollback()
         return jsonify({'detail': 'Failed to update playlist'}), 500
 
 
@@ -233,29 +344,26 @@ def delete_playlist(playlist_id):
     try:
         user_id = get_jwt_identity()
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            "SELECT owner_id FROM playlists WHERE id = %s AND is_deleted = FALSE",
-            (playlist_id,),
-        )
-        playlist = cursor.fetchone()
-        if not playlist:
-            return jsonify({'detail': 'Playlist not found'}), 404
-        if playlist['owner_id'] != int(user_id):
-            return jsonify({'detail': 'Not authorized to delete this playlist'}), 403
-
-        cursor.execute(
-            "UPDATE playlists SET is_deleted = TRUE, updated_at = NOW() WHERE id = %s",
-            (playlist_id,),
-        )
-        conn.commit()
-        return jsonify({'message': 'Playlist deleted'})
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            cursor.execute(
+                "SELECT owner_id FROM playlists WHERE id = %s AND is_deleted = FALSE",
+                (playlist_id,),
+            )
+            playlist = cursor.fetchone()
+            if not playlist:
+                return jsonify({'detail': 'Playlist not found'}), 404
+            if playlist['owner_id'] != int(user_id):
+                return jsonify({'detail': 'Not authorized to delete this playlist'}), 403
+
+            cursor.execute(
+                "UPDATE playlists SET is_deleted = TRUE, updated_at = NOW() WHERE id = %s",
+                (playlist_id,),
+            )
+            conn.commit()
+            _invalidate(conn, cursor, user_id, playlist_id)
+            return jsonify({'message': 'Playlist deleted'})
     except Exception as error:  # noqa: BLE001
         print(f"Delete playlist error: {error}")
-        if 'conn' in locals():
-            conn.rollback()
         return jsonify({'detail': 'Failed to delete playlist'}), 500
 
 
@@ -277,67 +385,135 @@ def add_playlist_item(playlist_id):
         media_id = data.get('mediaItemId') or data.get('media_id')
         if not media_id:
             return jsonify({'detail': 'media_id is required'}), 400
+        try:
+            media_id = int(media_id)
+        except (TypeError, ValueError):
+            return jsonify({'detail': 'Media not found'}), 404
+
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            error = _lock_owned_playlist(cursor, playlist_id, user_id)
+            if error:
+                return error
+
+            added = append_items(cursor, playlist_id, [media_id])
+            if not added:
+                cursor.execute(
+                    "SELECT 1 FROM playlist_items WHERE playlist_id = %s AND media_id = %s",
+                    (playlist_id, media_id),
+                )
+                already_present = cursor.fetchone() is not None
+                conn.rollback()
+                if already_present:
+                    return jsonify({'detail': 'Media already in playlist'}), 409
+                return jsonify({'detail': 'Media not found'}), 404
+
+            conn.commit()
+            _invalidate(conn, cursor, user_id, playlist_id)
+            return jsonify({'item': _item_to_dict(playlist_id, added[0])}), 201
+    except Exception as error:  # noqa: BLE001
+        print(f"Add playlist item error: {error}")
+        return jsonify({'detail': 'Failed to add item to playlist'}), 500
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
 
-        cursor.execute(
-            "SELECT owner_id FROM playlists WHERE id = %s AND is_deleted = FALSE",
-            (playlist_id,),
-        )
-        playlist = cursor.fetchone()
-        if not playlist:
-            return jsonify({'detail': 'Playlist not found'}), 404
-        if playlist['owner_id'] != int(user_id):
-            return jsonify({'detail': 'Not authorized to modify this playlist'}), 403
+@router.route('/<playlist_id>/items/bulk', methods=['POST'])
+@jwt_required()
+def add_playlist_items(playlist_id):
+    """Append several media (``{"media_ids": [...]}``) in one batched insert."""
+    try:
+        user_id = get_jwt_identity()
+        media_ids, message = _media_id_list(request.get_json() or {})
+        if message:
+            return jsonify({'detail': message}), 400
+
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            error = _lock_owned_playlist(cursor, playlist_id, user_id)
+            if error:
+                return error
+
+            added = append_items(cursor, playlist_id, media_ids)
+            conn.commit()
+            _invalidate(conn, cursor, user_id, playlist_id)
+
+            added_ids = {row['media_id'] for row in added}
+            return jsonify({
+                'items': [_item_to_dict(playlist_id, row) for row in added],
+                # Unknown, deleted, or already in the playlist.
+                'skipped': [media_id for media_id in media_ids if media_id not in added_ids],
+            }), 201
+    except Exception as error:  # noqa: BLE001
+        print(f"Bulk add playlist items error: {error}")
+        return jsonify({'detail': 'Failed to add items to playlist'}), 500
 
-        cursor.execute(
-            "SELECT id FROM media_files WHERE id = %s AND is_deleted = FALSE",
-            (media_id,),
-        )
-        if not cursor.fetchone():
-            return jsonify({'detail': 'Media not found'}), 404
 
-        cursor.execute(
-            "SELECT id FROM playlist_items WHERE playlist_id = %s AND media_id = %s",
-            (playlist_id, media_id),
-        )
-        if cursor.fetchone():
-            return jsonify({'detail': 'Media already in playlist'}), 409
+@router.route('/<playlist_id>/items/bulk', methods=['DELETE'])
+@jwt_required()
+def remove_playlist_items(playlist_id):
+    """Remove several media (``{"media_ids": [...]}``) in one statement."""
+    try:
+        user_id = get_jwt_identity()
+        media_ids, message = _media_id_list(request.get_json(silent=True) or {})
+        if message:
+            return jsonify({'detail': message}), 400
+
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            error = _lock_owned_playlist(cursor, playlist_id, user_id)
+            if error:
+                return error
+
+            removed = remove_items(cursor, playlist_id, media_ids)
+            conn.commit()
+            _invalidate(conn, cursor, user_id, playlist_id)
+
+            removed_ids = set(removed)
+            return jsonify({
+                'removed': removed,
+                'not_found': [media_id for media_id in media_ids if media_id not in removed_ids],
+            })
+    except Exception as error:  # noqa: BLE001
+        print(f"Bulk remove playlist items error: {error}")
+        return jsonify({'detail': 'Failed to remove items from playlist'}), 500
 
-        cursor.execute(
-            "SELECT COALESCE(MAX(position), 0) + 1 FROM playlist_items WHERE playlist_id = %s",
-            (playlist_id,),
-        )
-        position = cursor.fetchone()[0]
 
-        cursor.execute(
-            """
-            INSERT INTO playlist_items (playlist_id, media_id, position)
-            VALUES (%s, %s, %s)
-            RETURNING id, added_at
-            """,
-            (playlist_id, media_id, position),
-        )
+@router.route('/<playlist_id>/items/reorder', methods=['POST'])
+@jwt_required()
+def reorder_playlist_items(playlist_id):
+    """Move media (``{"media_ids": [...], "after": <media id> | null}``).
 
-        item = cursor.fetchone()
-        conn.commit()
-        return jsonify(
-            {
-                'item': {
-                    'id': item['id'],
-                    'playlist_id': playlist_id,
-                    'mediaItemId': media_id,
-                    'position': position,
-                    'addedAt': item['added_at'].isoformat() if item['added_at'] else None,
-                }
-            }
-        ), 201
+    The items keep the given order and are placed directly after ``after``,
+    or at the start when it is null; only the moved rows are rewritten.
+    """
+    try:
+        user_id = get_jwt_identity()
+        data = request.get_json() or {}
+        media_ids, message = _media_id_list(data)
+        if message:
+            return jsonify({'detail': message}), 400
+
+        after = data.get('after')
+        if after is not None:
+            try:
+                after = int(after)
+            except (TypeError, ValueError):
+                return jsonify({'detail': "'after' must be a media id or null"}), 400
+            if after in media_ids:
+                return jsonify({'detail': "'after' cannot be one of the moved items"}), 400
+
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            error = _lock_owned_playlist(cursor, playlist_id, user_id)
+            if error:
+                return error
+
+            moved = move_items(cursor, playlist_id, media_ids, after)
+            if moved is None:
+                conn.rollback()
+                return jsonify({'detail': 'Item not found in playlist'}), 404
+
+            conn.commit()
+            _invalidate(conn, cursor, user_id, playlist_id)
+            return jsonify({'items': moved})
     except Exception as error:  # noqa: BLE001
-        print(f"Add playlist item error: {error}")
-        if 'conn' in locals():
-            conn.rollback()
-        return jsonify({'detail': 'Failed to add item to playlist'}), 500
+        print(f"Reorder playlist items error: {error}")
+        return jsonify({'detail': 'Failed to reorder playlist'}), 500
 
 
 @router.route('/<playlist_id>/items/<media_id>', methods=['DELETE'])
@@ -347,31 +523,21 @@ def remove_playlist_item(playlist_id, media_id):
     try:
         user_id = get_jwt_identity()
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            "SELECT owner_id FROM playlists WHERE id = %s AND is_deleted = FALSE",
-            (playlist_id,),
-        )
-        playlist = cursor.fetchone()
-        if not playlist:
-            return jsonify({'detail': 'Playlist not found'}), 404
-        if playlist['owner_id'] != int(user_id):
-            return jsonify({'detail': 'Not authorized to modify this playlist'}), 403
-
-        cursor.execute(
-            "DELETE FROM playlist_items WHERE playlist_id = %s AND media_id = %s RETURNING id",
-            (playlist_id, media_id),
-        )
-        deleted = cursor.fetchone()
-        conn.commit()
-
-        if not deleted:
-            return jsonify({'detail': 'Item not found in playlist'}), 404
-        return jsonify({'message': 'Item removed from playlist'})
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            error = _lock_owned_playlist(cursor, playlist_id, user_id)
+            if error:
+                return error
+
+            cursor.execute(
+                "DELETE FROM playlist_items WHERE playlist_id = %s AND media_id = %s RETURNING id",
+                (playlist_id, media_id),
+            )
+            deleted = cursor.fetchone()
+            if not deleted:
+                return jsonify({'detail': 'Item not found in playlist'}), 404
+            conn.commit()
+            _invalidate(conn, cursor, user_id, playlist_id)
+            return jsonify({'message': 'Item removed from playlist'})
     except Exception as error:  # noqa: BLE001
         print(f"Remove playlist item error: {error}")
-        if 'conn' in locals():
-            conn.rollback()
         return jsonify({'detail': 'Failed to remove item from playlist'}), 500
@@ -4,11 +4,12 @@ with persistence support for selected settings blocks.
 """
 
 import copy
-import json
 
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from postgres_config import get_db_connection
+from app.core.authorization import superuser_required
+from app.services.system_settings import get_setting, invalidate_settings, save_setting
 
 router = Blueprint('settings', __name__)
 
@@ -63,20 +64,9 @@ DEFAULT_SETTINGS = {
     }
 }
 
-PERSISTED_KEYS = ["database"]
+PERSISTED_KEYS = ["database", "playback"]
 
 
-def ensure_settings_table(cursor):
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS system_settings (
-            key TEXT PRIMARY KEY,
-            value JSONB NOT NULL,
-            updated_at TIMESTAMPTZ DEFAULT NOW()
-        )
-        """
-    )
-
 @router.route('/test', methods=['GET'])
 def settings_test():
     """Test settings endpoint"""
@@ -89,36 +79,20 @@ def settings_test():
 
 @router.route('/', methods=['GET'])
 @jwt_required()
+@superuser_required
 def get_settings():
     """Get all settings"""
     try:
-        user_id = get_jwt_identity()
-        
-        # Check if user is superuser
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('SELECT is_superuser FROM users WHERE id = %s', (user_id,))
-            user = cursor.fetchone()
-            if not user or not user['is_superuser']:
-                return jsonify({"detail": "Not enough permissions"}), 403
-
-            ensure_settings_table(cursor)
-
-            settings = copy.deepcopy(DEFAULT_SETTINGS)
-            for key in PERSISTED_KEYS:
-                cursor.execute('SELECT value FROM system_settings WHERE key = %s', (key,))
-                row = cursor.fetchone()
-                if row and row.get('value') and isinstance(row['value'], dict):
-                    settings[key] = {
-                        **settings.get(key, {}),
-                        **row['value']
-                    }
-
-            return jsonify(settings)
-        finally:
-            cursor.close()
-            conn.close()
+        settings = copy.deepcopy(DEFAULT_SETTINGS)
+        for key in PERSISTED_KEYS:
+            value = get_setting(key)
+            if value and isinstance(value, dict):
+                settings[key] = {
+                    **settings.get(key, {}),
+                    **value
+                }
+
+        return jsonify(settings)
         
     except Exception as e:
         print(f"Settings error: {e}")
@@ -126,41 +100,25 @@ def get_settings():
 
 @router.route('/', methods=['PUT'])
 @jwt_required()
+@superuser_required
 def update_settings():
     """Update settings"""
     try:
-        user_id = get_jwt_identity()
-        
-        # Check if user is superuser
         conn = get_db_connection()
         cursor = conn.cursor()
         try:
-            cursor.execute('SELECT is_superuser FROM users WHERE id = %s', (user_id,))
-            user = cursor.fetchone()
-            if not user or not user['is_superuser']:
-                return jsonify({"detail": "Not enough permissions"}), 403
-
             data = request.get_json()
             if not data:
                 return jsonify({"detail": "No settings data provided"}), 400
 
-            ensure_settings_table(cursor)
-
             persisted_payload = {}
             for key in PERSISTED_KEYS:
                 if key in data and isinstance(data[key], dict):
-                    cursor.execute(
-                        """
-                        INSERT INTO system_settings (key, value, updated_at)
-                        VALUES (%s, %s, NOW())
-                        ON CONFLICT (key)
-                        DO UPDATE SET value = EXCLUDED.value, updated_at = NOW()
-                        """,
-                        (key, json.dumps(data[key])),
-                    )
+                    save_setting(cursor, key, data[key])
                     persisted_payload[key] = data[key]
 
             conn.commit()
+            invalidate_settings()
 
             return jsonify({
                 "message": "Settings updated successfully",
@@ -3,8 +3,10 @@ Flask-compatible system and maintenance endpoints
 """
 
 from flask import Blueprint, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from postgres_config import get_db_connection
+from app.core.authorization import superuser_required
+from app.core.compression import compression_stats
 import os
 from datetime import datetime
 
@@ -31,20 +33,13 @@ def get_version():
 
 @router.route('/database-info', methods=['GET'])
 @jwt_required()
+@superuser_required
 def get_database_info():
     """Get database information and statistics"""
     try:
-        user_id = get_jwt_identity()
-        
-        # Check if user is superuser
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT is_superuser FROM users WHERE id = %s', (user_id,))
-        user = cursor.fetchone()
-        
-        if not user or not user['is_superuser']:
-            return jsonify({"detail": "Not enough permissions"}), 403
-        
+
         # Get database statistics
         stats = {}
         
@@ -91,6 +86,13 @@ def get_database_info():
         if 'conn' in locals():
             conn.close()
 
+@router.route('/compression', methods=['GET'])
+@jwt_required()
+@superuser_required
+def get_compression_stats():
+    """Per-endpoint response compression ratios and CPU time"""
+    return jsonify(compression_stats())
+
 @router.route('/health-detailed', methods=['GET'])
 def get_health_detailed():
     """Detailed health check with system information"""
@@ -131,20 +133,10 @@ def get_health_detailed():
 
 @router.route('/maintenance/reset-database', methods=['POST'])
 @jwt_required()
+@superuser_required
 def reset_database():
     """Reset database (superuser only) - DANGEROUS"""
     try:
-        user_id = get_jwt_identity()
-        
-        # Check if user is superuser
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT is_superuser FROM users WHERE id = %s', (user_id,))
-        user = cursor.fetchone()
-        
-        if not user or not user['is_superuser']:
-            return jsonify({"detail": "Not enough permissions"}), 403
-        
         # This is a dangerous operation - just return info for now
         return jsonify({
             "message": "Database reset functionality not implemented for safety",
@@ -155,28 +147,16 @@ def reset_database():
     except Exception as e:
         print(f"Reset database error: {e}")
         return jsonify({"detail": f"Reset error: {str(e)}"}), 500
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
 
 @router.route('/maintenance/seed-sample-data', methods=['POST'])
 @jwt_required()
+@superuser_required
 def seed_sample_data():
     """Add sample data for testing (superuser only)"""
     try:
-        user_id = get_jwt_identity()
-        
-        # Check if user is superuser
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT is_superuser FROM users WHERE id = %s', (user_id,))
-        user = cursor.fetchone()
-        
-        if not user or not user['is_superuser']:
-            return jsonify({"detail": "Not enough permissions"}), 403
-        
+
         # Add sample media files
         sample_media = [
             {
@@ -3,11 +3,18 @@ Flask-compatible user management endpoints.
 """
 
 from contextlib import closing
+from datetime import timedelta
 from typing import Any, Dict, Optional
 
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import get_jwt_identity, jwt_required
-
+from flask_jwt_extended import create_access_token, get_jwt_identity, jwt_required
+
+from app.core.authorization import (
+    build_token_claims,
+    invalidate_user,
+    record_token_version,
+    revoke_user_tokens,
+)
 from postgres_config import get_db_connection
 
 router = Blueprint("users", __name__)
@@ -97,7 +104,15 @@ def update_current_user():
             if not cursor.fetchone():
                 conn.rollback()
                 return jsonify({"detail": "Failed to update user"}), 500
+            token_version = None
+            if "is_active" in data or "email" in data:
+                # Both values are embedded in issued tokens; revoke them.
+                token_version = revoke_user_tokens(cursor, user_id)
             conn.commit()
+            if token_version is not None:
+                record_token_version(user_id, token_version)
+            else:
+                invalidate_user(user_id)
 
             cursor.execute(
                 """
@@ -107,11 +122,25 @@ def update_current_user():
                 """,
                 (user_id,),
             )
-            updated_user = _row_to_user(cursor.fetchone())
+            row = cursor.fetchone()
+            updated_user = _row_to_user(row)
     except Exception as error:  # noqa: BLE001
         print(f"Update user error: {error}")
         return jsonify({"detail": "Failed to update user"}), 500
 
+    if token_version is not None:
+        # The caller's own token was just revoked: hand back a replacement,
+        # or tell an account that deactivated itself to sign in again.
+        if updated_user["is_active"]:
+            updated_user["access_token"] = create_access_token(
+                identity=str(user_id),
+                expires_delta=timedelta(days=8),
+                additional_claims=build_token_claims({**row, "token_version": token_version}),
+            )
+            updated_user["token_type"] = "bearer"
+        else:
+            updated_user["reauthentication_required"] = True
+
     return jsonify(updated_user)
 
 
@@ -0,0 +1,151 @@
+"""
+Flask-compatible viewing history endpoints.
+
+Progress heartbeats are buffered by ``app.services.viewing_progress`` and
+written to ``viewing_history`` in batches rather than one UPDATE per report.
+Statistics are read from the daily aggregates in ``app.services.viewing_stats``.
+"""
+
+from contextlib import closing
+
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import get_jwt_identity, jwt_required
+from pydantic import ValidationError
+
+from app.core.authorization import superuser_required
+from app.schemas.viewing_history import ViewingHistoryCreate, ViewingHistoryUpdate
+from app.services.viewing_progress import build_entry, tracker
+from app.services.viewing_stats import get_category_stats, get_most_watched, get_user_stats
+from postgres_config import get_db_connection
+
+router = Blueprint("viewing_history", __name__)
+
+
+def _validation_error(exc: ValidationError):
+    return jsonify({"detail": exc.errors(include_url=False)}), 422
+
+
+@router.route("/progress", methods=["POST"])
+@jwt_required()
+def report_progress():
+    """Record a playback heartbeat (coalesced and flushed in the background)."""
+    try:
+        payload = ViewingHistoryCreate.model_validate(request.get_json(silent=True) or {})
+    except ValidationError as exc:
+        return _validation_error(exc)
+
+    try:
+        entry = build_entry(get_jwt_identity(), payload.model_dump())
+        tracker.record(entry)
+        return jsonify(entry.to_resume("buffer")), 202
+    except Exception as e:
+        print(f"Progress report error: {e}")
+        return jsonify({"detail": f"Progress report error: {str(e)}"}), 500
+
+
+@router.route("/progress/<media_id>/end", methods=["POST"])
+@jwt_required()
+def end_session(media_id):
+    """Record the final position for a session and flush it immediately."""
+    try:
+        update = ViewingHistoryUpdate.model_validate(request.get_json(silent=True) or {})
+    except ValidationError as exc:
+        return _validation_error(exc)
+
+    try:
+        user_id = get_jwt_identity()
+        final_values = update.model_dump(exclude_none=True)
+        if final_values:
+            current = tracker.resume(user_id, media_id) or {}
+            tracker.record(build_entry(user_id, {**current, **final_values, "media_id": media_id}))
+        flushed = tracker.end_session(user_id, media_id)
+        return jsonify({
+            "media_id": media_id,
+            "flushed": flushed,
+            "resume": tracker.resume(user_id, media_id),
+        })
+    except Exception as e:
+        print(f"End session error: {e}")
+        return jsonify({"detail": f"End session error: {str(e)}"}), 500
+
+
+@router.route("/resume/<media_id>", methods=["GET"])
+@jwt_required()
+def get_resume_position(media_id):
+    """Return where the current user left off in ``media_id``."""
+    try:
+        resume = tracker.resume(get_jwt_identity(), media_id)
+        if resume is None:
+            return jsonify({
+                "media_id": media_id,
+                "current_position": 0,
+                "progress_percentage": 0.0,
+                "completed": "false",
+                "last_watched_at": None,
+                "source": "none",
+            })
+        return jsonify(resume)
+    except Exception as e:
+        print(f"Resume position error: {e}")
+        return jsonify({"detail": f"Resume position error: {str(e)}"}), 500
+
+
+@router.route("/stats", methods=["GET"])
+@jwt_required()
+def get_viewing_stats():
+    """Watch-time totals and completion rate for the current user."""
+    try:
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            return jsonify(get_user_stats(cursor, get_jwt_identity()))
+    except Exception as e:
+        print(f"Viewing stats error: {e}")
+        return jsonify({"detail": f"Viewing stats error: {str(e)}"}), 500
+
+
+@router.route("/most-watched", methods=["GET"])
+@jwt_required()
+def get_most_watched_content():
+    """Top titles by watch time (``?days=7&limit=50&category=``)."""
+    try:
+        days = request.args.get("days", 7, type=int)
+        limit = request.args.get("limit", 50, type=int)
+        category = request.args.get("category") or None
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            items = get_most_watched(cursor, days=days, limit=limit, category=category)
+        return jsonify({"days": days, "items": items})
+    except Exception as e:
+        print(f"Most watched error: {e}")
+        return jsonify({"detail": f"Most watched error: {str(e)}"}), 500
+
+
+@router.route("/categories", methods=["GET"])
+@jwt_required()
+def get_category_watch_stats():
+    """Watch time, viewers and completions per category (``?days=7``)."""
+    try:
+        days = request.args.get("days", 7, type=int)
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            return jsonify({"days": days, "categories": get_category_stats(cursor, days=days)})
+    except Exception as e:
+        print(f"Category watch stats error: {e}")
+        return jsonify({"detail": f"Category watch stats error: {str(e)}"}), 500
+
+
+@router.route("/buffer", methods=["GET"])
+@jwt_required()
+@superuser_required
+def get_buffer_stats():
+    """Expose write-behind buffer counters."""
+    return jsonify(tracker.buffer_stats())
+
+
+@router.route("/buffer/flush", methods=["POST"])
+@jwt_required()
+@superuser_required
+def flush_buffer():
+    """Flush every pending heartbeat now."""
+    try:
+        return jsonify({"flushed": tracker.flush()})
+    except Exception as e:
+        print(f"Progress flush error: {e}")
+        return jsonify({"detail": f"Progress flush error: {str(e)}"}), 500
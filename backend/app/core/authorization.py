@@ -0,0 +1,211 @@
+"""Shared authorization helpers for the Flask blueprints.
+
+Access tokens carry signed role claims (``is_superuser``, ``is_active``,
+``email``, ``created_at`` and the token version ``tv``). When the claim
+version matches the per-user token version the claims are trusted as-is, so
+permission checks do not touch Postgres on the hot path. Token versions are
+held in a map refreshed in bulk every few seconds; bumping a user's version
+with :func:`revoke_user_tokens` (then :func:`record_token_version` once the
+bump is committed) rejects every token issued before it.
+
+Tokens without claims (issued before claims existed) fall back to a user row
+lookup that is resolved at most once per request and held in a short-TTL
+cache. Call :func:`invalidate_user` whenever a user row changes.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from contextlib import closing
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+
+from flask import g, jsonify
+from flask_jwt_extended import get_jwt, get_jwt_identity, verify_jwt_in_request
+
+from app.core.cache import TTLCache
+from postgres_config import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_TTL_SECONDS = float(os.getenv("AUTH_USER_CACHE_TTL", "30"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_USER_CACHE_SIZE", "1024"))
+TOKEN_VERSION_REFRESH_SECONDS = float(os.getenv("AUTH_TOKEN_VERSION_REFRESH", "30"))
+
+TOKEN_VERSION_CLAIM = "tv"
+
+_user_cache = TTLCache(maxsize=USER_CACHE_MAX_ENTRIES, ttl=USER_CACHE_TTL_SECONDS)
+_MISSING = object()
+
+
+class _TokenVersionMap:
+    """Process-wide ``user_id -> token_version`` map refreshed in one query."""
+
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self._versions: Dict[str, int] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, user_id: Any) -> int:
+        if time.monotonic() - self._loaded_at >= self.refresh_seconds:
+            self._refresh()
+        return self._versions.get(str(user_id), 0)
+
+    def set(self, user_id: Any, version: int) -> None:
+        with self._lock:
+            self._versions[str(user_id)] = int(version)
+
+    def _refresh(self) -> None:
+        with self._lock:
+            if time.monotonic() - self._loaded_at < self.refresh_seconds:
+                return
+            try:
+                with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+                    cursor.execute("SELECT id, token_version FROM users WHERE token_version > 0")
+                    self._versions = {
+                        str(row["id"]): int(row["token_version"]) for row in cursor.fetchall() or []
+                    }
+            except Exception as exc:  # column missing before migration 002, DB down, ...
+                logger.warning("Token version refresh failed: %s", exc)
+            self._loaded_at = time.monotonic()
+
+
+_token_versions = _TokenVersionMap(TOKEN_VERSION_REFRESH_SECONDS)
+
+
+def _isoformat(value: Any) -> Optional[str]:
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def _load_user(user_id: str) -> Optional[Dict[str, Any]]:
+    with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+        cursor.execute(
+            "SELECT id, email, is_active, is_superuser, created_at FROM users WHERE id = %s",
+            (user_id,),
+        )
+        row = cursor.fetchone()
+    if not row:
+        return None
+    return {
+        "id": row["id"],
+        "email": row["email"],
+        "is_active": row["is_active"],
+        "is_superuser": row["is_superuser"],
+        "created_at": _isoformat(row.get("created_at")),
+    }
+
+
+def get_user(user_id: Any) -> Optional[Dict[str, Any]]:
+    """Return the cached user row for ``user_id`` (loading it on a miss)."""
+    if user_id is None:
+        return None
+    key = str(user_id)
+    return _user_cache.get_or_load(key, lambda: _load_user(key))
+
+
+def invalidate_user(user_id: Any) -> None:
+    """Drop a user from the cache after its row has been modified."""
+    if user_id is not None:
+        _user_cache.pop(str(user_id))
+
+
+def build_token_claims(user: Dict[str, Any]) -> Dict[str, Any]:
+    """Additional claims embedded in access tokens issued for ``user``."""
+    return {
+        "is_superuser": bool(user.get("is_superuser")),
+        "is_active": bool(user.get("is_active", True)),
+        "email": user.get("email"),
+        "created_at": _isoformat(user.get("created_at")),
+        TOKEN_VERSION_CLAIM: int(user.get("token_version") or 0),
+    }
+
+
+def current_token_version(user_id: Any) -> int:
+    return _token_versions.get(user_id)
+
+
+def is_token_revoked(jwt_payload: Dict[str, Any]) -> bool:
+    """True when the token's version is older than the user's current one."""
+    claimed_version = jwt_payload.get(TOKEN_VERSION_CLAIM)
+    if claimed_version is None:
+        return False
+    return int(claimed_version) < current_token_version(jwt_payload.get("sub"))
+
+
+def revoke_user_tokens(cursor, user_id: Any) -> Optional[int]:
+    """Bump ``users.token_version`` so previously issued tokens stop working.
+
+    Runs on the caller's cursor and returns the new version. The caller
+    passes it to :func:`record_token_version` after committing; other workers
+    pick it up on their next version refresh.
+    """
+    cursor.execute(
+        "UPDATE users SET token_version = token_version + 1 WHERE id = %s RETURNING token_version",
+        (user_id,),
+    )
+    row = cursor.fetchone()
+    return row["token_version"] if row else None
+
+
+def record_token_version(user_id: Any, version: Optional[int]) -> None:
+    """Apply a committed token version bump to this worker immediately."""
+    if version is not None:
+        _token_versions.set(user_id, version)
+    invalidate_user(user_id)
+
+
+def init_token_revocation(jwt_manager) -> None:
+    """Reject revoked tokens in every ``@jwt_required`` endpoint."""
+
+    @jwt_manager.token_in_blocklist_loader
+    def _check_token_version(jwt_header, jwt_payload):
+        return is_token_revoked(jwt_payload)
+
+
+def _user_from_claims(claims: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if TOKEN_VERSION_CLAIM not in claims or "is_superuser" not in claims:
+        return None
+    subject = claims.get("sub")
+    return {
+        "id": int(subject) if isinstance(subject, str) and subject.isdigit() else subject,
+        "email": claims.get("email"),
+        "is_active": bool(claims.get("is_active", True)),
+        "is_superuser": bool(claims.get("is_superuser")),
+        "created_at": claims.get("created_at"),
+    }
+
+
+def get_current_user() -> Optional[Dict[str, Any]]:
+    """Return the authenticated user for this request, resolved only once."""
+    cached = g.get("_watch2_current_user", _MISSING)
+    if cached is not _MISSING:
+        return cached
+
+    verify_jwt_in_request()
+    user = _user_from_claims(get_jwt())
+    if user is None:
+        user = get_user(get_jwt_identity())
+    g._watch2_current_user = user
+    return user
+
+
+def superuser_required(view: Callable) -> Callable:
+    """Reject the request with 403 unless the JWT belongs to an active superuser."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        user = get_current_user()
+        if not user or not user["is_superuser"] or not user["is_active"]:
+            return jsonify({"detail": "Not enough permissions"}), 403
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def user_cache_stats() -> Dict[str, Any]:
+    return _user_cache.stats()
@@ -0,0 +1,199 @@
+"""Response compression for JSON/text API responses.
+
+Registered in ``create_app`` as an ``after_request`` hook. A response is
+compressed only when it is a complete (non-streamed, non-passthrough) 200
+body of a compressible type and at least ``COMPRESSION_MIN_SIZE`` bytes.
+Media streams, byte ranges and images are never touched. The encoding is
+picked from ``Accept-Encoding``: brotli or zstd when their modules are
+installed, otherwise gzip.
+
+Bodies of ETag-tagged responses are cached per (ETag, encoding), so a
+repeated full fetch of an unchanged catalog page is not recompressed.
+Per-endpoint bytes, ratios and CPU time are available from
+:func:`compression_stats`.
+"""
+from __future__ import annotations
+
+import gzip
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from flask import Flask, request
+
+from app.core.cache import TTLCache
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+
+COMPRESSIBLE_MIMETYPES = frozenset({
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "text/html",
+    "text/plain",
+    "text/css",
+    "text/csv",
+    "text/vtt",
+    "text/xml",
+})
+
+# Never compressed regardless of content type: byte-range streaming.
+EXCLUDED_ENDPOINTS = frozenset({"media.stream_media"})
+
+_body_cache = TTLCache(maxsize=int(os.getenv("COMPRESSION_CACHE_SIZE", "256")), ttl=300)
+
+
+def _gzip(data: bytes) -> bytes:
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _brotli(data: bytes) -> bytes:
+    return brotli.compress(data, quality=BROTLI_QUALITY)
+
+
+_zstd_local = threading.local()
+
+
+def _zstd(data: bytes) -> bytes:
+    compressor = getattr(_zstd_local, "compressor", None)
+    if compressor is None:
+        compressor = _zstd_local.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+    return compressor.compress(data)
+
+
+# Server preference order; only encodings whose module is importable.
+ENCODERS: List[Tuple[str, Callable[[bytes], bytes]]] = [
+    *([("br", _brotli)] if brotli is not None else []),
+    *([("zstd", _zstd)] if zstandard is not None else []),
+    ("gzip", _gzip),
+]
+
+
+class _EndpointStats:
+    __slots__ = ("responses", "bytes_in", "bytes_out", "cpu_seconds", "cache_hits", "skipped")
+
+    def __init__(self):
+        self.responses = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_seconds = 0.0
+        self.cache_hits = 0
+        self.skipped = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "responses": self.responses,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else None,
+            "cpu_ms": round(self.cpu_seconds * 1000, 2),
+            "cache_hits": self.cache_hits,
+            "skipped_small": self.skipped,
+        }
+
+
+_stats: Dict[str, _EndpointStats] = {}
+_stats_lock = threading.Lock()
+
+
+def _endpoint_stats(endpoint: str) -> _EndpointStats:
+    with _stats_lock:
+        stats = _stats.get(endpoint)
+        if stats is None:
+            stats = _stats[endpoint] = _EndpointStats()
+        return stats
+
+
+def _choose_encoding() -> Optional[Tuple[str, Callable[[bytes], bytes]]]:
+    accepted = request.accept_encodings
+    best = None
+    best_quality = 0.0
+    for name, encoder in ENCODERS:
+        quality = accepted.quality(name)
+        if quality > best_quality:
+            best, best_quality = (name, encoder), quality
+    return best
+
+
+def _compressible(response) -> bool:
+    if request.method == "HEAD" or response.status_code != 200:
+        return False
+    if response.direct_passthrough or response.is_streamed:
+        return False
+    if "Content-Encoding" in response.headers or "Content-Range" in response.headers:
+        return False
+    if request.endpoint in EXCLUDED_ENDPOINTS:
+        return False
+    return response.mimetype in COMPRESSIBLE_MIMETYPES
+
+
+def compress_response(response):
+    """``after_request`` hook; returns ``response`` compressed in place when eligible."""
+    if not _compressible(response):
+        return response
+    response.vary.add("Accept-Encoding")
+    choice = _choose_encoding()
+    if choice is None:
+        return response
+
+    encoding, encoder = choice
+    stats = _endpoint_stats(request.endpoint or "unknown")
+    data = response.get_data()
+    if len(data) < MIN_SIZE:
+        with _stats_lock:
+            stats.skipped += 1
+        return response
+
+    etag, _ = response.get_etag()
+    cache_key = (request.endpoint, etag, encoding) if etag else None
+    compressed = _body_cache.get(cache_key) if cache_key else None
+    cpu_seconds = 0.0
+    cache_hit = compressed is not None
+    if not cache_hit:
+        started = time.thread_time()
+        compressed = encoder(data)
+        cpu_seconds = time.thread_time() - started
+        if cache_key:
+            _body_cache.set(cache_key, compressed)
+
+    with _stats_lock:
+        stats.cache_hits += int(cache_hit)
+        stats.responses += 1
+        stats.bytes_in += len(data)
+        stats.bytes_out += len(compressed)
+        stats.cpu_seconds += cpu_seconds
+
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def compression_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        endpoints = {name: stats.as_dict() for name, stats in sorted(_stats.items())}
+    return {
+        "encodings": [name for name, _ in ENCODERS],
+        "min_size": MIN_SIZE,
+        "cache": _body_cache.stats(),
+        "endpoints": endpoints,
+    }
+
+
+def init_compression(app: Flask) -> None:
+    if os.getenv("COMPRESSION_ENABLED", "true").lower() in ("0", "false", "no"):
+        return
+    app.after_request(compress_response)
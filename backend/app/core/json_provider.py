@@ -0,0 +1,59 @@
+"""Flask JSON provider backed by ``orjson`` when it is installed.
+
+``jsonify`` output is otherwise unchanged: datetimes still go through Flask's
+default (HTTP date) formatting, ``Decimal``/``date``/dataclasses use the same
+fallbacks, and debug mode still pretty-prints. Without ``orjson`` the stock
+provider is used as-is.
+"""
+from __future__ import annotations
+
+from typing import Any
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+ORJSON_AVAILABLE = orjson is not None
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Serialize with ``orjson``; fall back to ``json`` for unsupported kwargs."""
+
+    sort_keys = False
+
+    def _encode(self, obj: Any, indent: bool = False) -> bytes:
+        options = _OPTIONS | orjson.OPT_INDENT_2 if indent else _OPTIONS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=options)
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if orjson is None or kwargs:
+            kwargs.setdefault("sort_keys", self.sort_keys)
+            return super().dumps(obj, **kwargs)
+        try:
+            return self._encode(obj).decode("utf-8")
+        except TypeError:
+            return super().dumps(obj, sort_keys=self.sort_keys)
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        try:
+            body = self._encode(obj, indent=indent)
+        except TypeError:
+            return super().response(obj)
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
@@ -0,0 +1,104 @@
+"""Cheap validation for the ``?token=`` query parameter used by media tags.
+
+``<video>``/``<audio>`` elements cannot send an Authorization header, so the
+player passes the access token in the query string and every range request
+re-presents it. Two paths keep that cheap:
+
+* Full JWTs are verified once and remembered in a bounded cache keyed by the
+  token's SHA-256, expiring with the token's ``exp`` (capped so revocation is
+  noticed promptly).
+* Scoped stream tokens (``st1.<user>.<exp>.<tv>.<sig>``) are HMACs bound to a
+  single media id; validating one is a string split and one HMAC.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import os
+import time
+from typing import Any, Dict, Optional
+
+from flask import current_app
+from flask_jwt_extended import decode_token
+
+from app.core.authorization import current_token_version, is_token_revoked
+from app.core.cache import TTLCache
+
+STREAM_TOKEN_PREFIX = "st1"
+STREAM_TOKEN_TTL_SECONDS = int(os.getenv("STREAM_TOKEN_TTL", str(6 * 3600)))
+VERIFIED_TOKEN_CACHE_SIZE = int(os.getenv("STREAM_TOKEN_CACHE_SIZE", "4096"))
+VERIFIED_TOKEN_MAX_AGE_SECONDS = float(os.getenv("STREAM_TOKEN_CACHE_TTL", "300"))
+
+_verified_tokens = TTLCache(maxsize=VERIFIED_TOKEN_CACHE_SIZE, ttl=VERIFIED_TOKEN_MAX_AGE_SECONDS)
+
+
+def _signing_key() -> bytes:
+    secret = current_app.config["JWT_SECRET_KEY"].encode("utf-8")
+    return hmac.new(secret, b"watch2-stream-token", hashlib.sha256).digest()
+
+
+def _signature(media_id: Any, user_id: str, expires_at: int, token_version: int) -> str:
+    message = f"{media_id}:{user_id}:{expires_at}:{token_version}".encode("utf-8")
+    digest = hmac.new(_signing_key(), message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:24]).decode("ascii")
+
+
+def issue_stream_token(media_id: Any, user_id: Any, ttl: Optional[int] = None) -> Dict[str, Any]:
+    """Create a short-lived token that only authorises streaming ``media_id``."""
+    user = str(user_id)
+    expires_at = int(time.time()) + int(ttl or STREAM_TOKEN_TTL_SECONDS)
+    token_version = current_token_version(user)
+    signature = _signature(media_id, user, expires_at, token_version)
+    return {
+        "token": f"{STREAM_TOKEN_PREFIX}.{user}.{expires_at}.{token_version}.{signature}",
+        "expires_at": expires_at,
+    }
+
+
+def _verify_scoped_token(token: str, media_id: Any) -> Optional[Dict[str, Any]]:
+    try:
+        _, user, expires_raw, version_raw, signature = token.split(".")
+        expires_at = int(expires_raw)
+        token_version = int(version_raw)
+    except ValueError:
+        return None
+    if expires_at <= time.time():
+        return None
+    expected = _signature(media_id, user, expires_at, token_version)
+    if not hmac.compare_digest(expected, signature):
+        return None
+    if token_version < current_token_version(user):
+        return None
+    return {"sub": user, "exp": expires_at, "scope": "stream"}
+
+
+def _verify_jwt(token: str) -> Optional[Dict[str, Any]]:
+    key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    claims = _verified_tokens.get(key)
+    if claims is None:
+        try:
+            claims = decode_token(token)
+        except Exception:
+            return None
+        remaining = claims.get("exp", 0) - time.time()
+        if remaining <= 0:
+            return None
+        _verified_tokens.set(key, claims, expires_at=time.monotonic() + remaining)
+    if is_token_revoked(claims):
+        _verified_tokens.pop(key)
+        return None
+    return claims
+
+
+def verify_query_token(token: str, media_id: Any) -> Optional[Dict[str, Any]]:
+    """Return the token's claims if it may stream ``media_id``, else ``None``."""
+    if not token:
+        return None
+    if token.startswith(STREAM_TOKEN_PREFIX + "."):
+        return _verify_scoped_token(token, media_id)
+    return _verify_jwt(token)
+
+
+def verified_token_cache_stats() -> Dict[str, Any]:
+    return _verified_tokens.stats()
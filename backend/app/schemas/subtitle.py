@@ -9,10 +9,12 @@ class SubtitleInfo(BaseModel):
     """Subtitle information"""
     id: str
     filename: str
-    language: str
+    language: Optional[str] = None
     format: str  # .srt, .vtt, .ass, etc.
     size: int
     url: str
+    forced: bool = False
+    hearing_impaired: bool = False
 
 class SubtitleUpload(BaseModel):
     """Subtitle upload request"""
@@ -0,0 +1,145 @@
+"""Library statistics served from the rollup tables of migration 003.
+
+``media_category_rollups``, ``media_daily_additions`` and
+``analytics_counters`` are maintained by statement-level triggers on
+``media_items`` and ``playlists``, so reading the dashboard numbers is one
+query over a handful of rows. Whether the rollups are installed is
+discovered once (at startup via :func:`discover_rollup_schema`); databases
+without them fall back to a single aggregate over ``media_items``.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from contextlib import closing
+from typing import Any, Dict, Optional
+
+from postgres_config import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+RECENT_DAYS = 30
+
+_ROLLUP_TRIGGERS = ("media_items_rollup_insert", "media_items_rollup_update", "media_items_rollup_delete")
+
+_schema_lock = threading.Lock()
+_rollups_available: Optional[bool] = None
+
+
+def discover_rollup_schema(force: bool = False) -> bool:
+    """Detect (once) whether the rollup tables and triggers are installed."""
+    global _rollups_available
+    with _schema_lock:
+        if _rollups_available is not None and not force:
+            return _rollups_available
+        try:
+            with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+                cursor.execute(
+                    """
+                    SELECT to_regclass('public.media_category_rollups') IS NOT NULL
+                           AND to_regclass('public.media_daily_additions') IS NOT NULL
+                           AND to_regclass('public.analytics_counters') IS NOT NULL AS tables,
+                           (SELECT COUNT(*) FROM pg_trigger WHERE tgname = ANY(%s)) AS triggers
+                    """,
+                    (list(_ROLLUP_TRIGGERS),),
+                )
+                row = cursor.fetchone()
+            _rollups_available = bool(row and row["tables"] and row["triggers"] == len(_ROLLUP_TRIGGERS))
+        except Exception as exc:
+            logger.warning("Analytics rollup discovery failed: %s", exc)
+            return False
+        if not _rollups_available:
+            logger.info("Analytics rollups not installed; dashboard will aggregate media_items directly")
+        return _rollups_available
+
+
+def _empty_summary() -> Dict[str, Any]:
+    return {
+        "total_media": 0,
+        "categories": {},
+        "total_size_bytes": 0,
+        "total_duration_seconds": 0,
+        "recent_additions": 0,
+        "total_playlists": 0,
+    }
+
+
+def _read_rollups(cursor) -> Dict[str, Any]:
+    cursor.execute(
+        """
+        SELECT 'category' AS kind, category AS key, item_count AS count,
+               total_size_bytes AS size, total_duration_seconds AS duration
+        FROM media_category_rollups
+        WHERE item_count > 0
+        UNION ALL
+        SELECT 'recent', NULL, COALESCE(SUM(item_count), 0), 0, 0
+        FROM media_daily_additions
+        WHERE day > CURRENT_DATE - %s
+        UNION ALL
+        SELECT 'playlists', NULL, COALESCE(MAX(value), 0), 0, 0
+        FROM analytics_counters
+        WHERE name = 'playlists'
+        """,
+        (RECENT_DAYS,),
+    )
+    summary = _empty_summary()
+    for row in cursor.fetchall() or []:
+        if row["kind"] == "category":
+            summary["categories"][row["key"]] = int(row["count"])
+            summary["total_media"] += int(row["count"])
+            summary["total_size_bytes"] += int(row["size"] or 0)
+            summary["total_duration_seconds"] += int(row["duration"] or 0)
+        elif row["kind"] == "recent":
+            summary["recent_additions"] = int(row["count"] or 0)
+        else:
+            summary["total_playlists"] = int(row["count"] or 0)
+    return summary
+
+
+def _aggregate_live(cursor) -> Dict[str, Any]:
+    cursor.execute(
+        """
+        SELECT COALESCE(NULLIF(media_type, ''), 'uncategorized') AS category,
+               COUNT(*) AS count,
+               COALESCE(SUM(CASE
+                   WHEN COALESCE(metadata->>'fileSize', metadata->>'sizeBytes', metadata->>'size') ~ '^[0-9]+(\\.[0-9]+)?$'
+                   THEN COALESCE(metadata->>'fileSize', metadata->>'sizeBytes', metadata->>'size')::numeric
+                   ELSE 0
+               END), 0)::bigint AS size,
+               COALESCE(SUM(duration_seconds), 0)::bigint AS duration,
+               COUNT(*) FILTER (WHERE created_at > NOW() - make_interval(days => %s)) AS recent
+        FROM media_items
+        WHERE status IS DISTINCT FROM 'deleted'
+        GROUP BY 1
+        """,
+        (RECENT_DAYS,),
+    )
+    summary = _empty_summary()
+    for row in cursor.fetchall() or []:
+        summary["categories"][row["category"]] = int(row["count"])
+        summary["total_media"] += int(row["count"])
+        summary["total_size_bytes"] += int(row["size"] or 0)
+        summary["total_duration_seconds"] += int(row["duration"] or 0)
+        summary["recent_additions"] += int(row["recent"] or 0)
+
+    cursor.execute("SELECT COUNT(*) AS count FROM playlists WHERE is_deleted = FALSE")
+    playlist_row = cursor.fetchone()
+    summary["total_playlists"] = int(playlist_row["count"]) if playlist_row else 0
+    return summary
+
+
+def get_library_summary(cursor) -> Dict[str, Any]:
+    """Return media/playlist totals, per-category counts and recent additions."""
+    if discover_rollup_schema():
+        return _read_rollups(cursor)
+    return _aggregate_live(cursor)
+
+
+def rebuild_rollups() -> Dict[str, Any]:
+    """Recompute every rollup row from the base tables."""
+    with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+        cursor.execute("SELECT refresh_analytics_rollups()")
+        conn.commit()
+        summary = _read_rollups(cursor)
+    discover_rollup_schema(force=True)
+    return summary
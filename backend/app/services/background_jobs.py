@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = int(os.getenv("BACKGROUND_JOB_WORKERS", "4"))
+
+# Simple in-process job tracking shared by the admin and media endpoints.
+jobs_db: Dict[int, Dict[str, Any]] = {}
+
+_job_counter = 1
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _utcnow() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def create_job(job_name: str, status: str = "queued") -> Dict[str, Any]:
+    """Create a new job record."""
+    global _job_counter
+    with _lock:
+        job_id = _job_counter
+        _job_counter += 1
+
+    job = {
+        "id": job_id,
+        "job_name": job_name,
+        "status": status,
+        "details": None,
+        "started_at": _utcnow(),
+        "finished_at": None,
+        "duration_seconds": None,
+        "result": None,
+        "running": status == "running",
+    }
+
+    jobs_db[job_id] = job
+    return job
+
+
+def complete_job(job_id: int, status: str = "success", result: Any = None) -> None:
+    """Mark a job as finished and record its result."""
+    job = jobs_db.get(job_id)
+    if job is None:
+        return
+    job["status"] = status
+    job["finished_at"] = _utcnow()
+    job["running"] = False
+    job["result"] = result
+
+    started = datetime.fromisoformat(job["started_at"].replace("Z", "+00:00"))
+    finished = datetime.fromisoformat(job["finished_at"].replace("Z", "+00:00"))
+    job["duration_seconds"] = (finished - started).total_seconds()
+
+
+def get_job(job_id: int) -> Optional[Dict[str, Any]]:
+    return jobs_db.get(job_id)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="watch2-job")
+        return _executor
+
+
+def submit_job(job_name: str, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Dict[str, Any]:
+    """Run ``func`` on the background pool and track it as a job.
+
+    The function's return value becomes the job result; exceptions mark the
+    job as failed with the error message.
+    """
+    job = create_job(job_name, "queued")
+
+    def _run() -> None:
+        job["status"] = "running"
+        job["running"] = True
+        try:
+            result = func(*args, **kwargs)
+        except Exception as exc:
+            logger.exception("Background job %s (%s) failed: %s", job["id"], job_name, exc)
+            complete_job(job["id"], "failed", {"error": str(exc)})
+            return
+        if job["status"] != "cancelled":
+            complete_job(job["id"], "success", result)
+
+    _get_executor().submit(_run)
+    return job
+
+
+def worker_stats() -> Dict[str, Any]:
+    running = [job["id"] for job in jobs_db.values() if job["running"]]
+    queued = [job["id"] for job in jobs_db.values() if job["status"] == "queued"]
+    return {
+        "max_workers": MAX_WORKERS,
+        "running": len(running),
+        "pending_jobs": queued,
+        "completed_result_cache": len(jobs_db) - len(running) - len(queued),
+    }
@@ -0,0 +1,317 @@
+"""Optional per-worker in-memory index of ``media_items`` for browse queries.
+
+Enabled with ``CATALOG_INDEX_ENABLED=true``. The whole catalog is loaded into
+columnar arrays (type/status codes, size, duration, created_at) with one
+precomputed ordering per sortable column and one bitmap per ``status`` and
+``media_type`` value. A filter is a bitmap AND, the total is a popcount, and
+a page is a walk along the requested ordering, so ``GET /media`` without a
+search term never touches Postgres.
+
+Freshness comes from the ``watch2_catalog`` notification sent by the
+statement trigger of migration 007: any change marks the index stale and
+schedules a debounced rebuild. The index is only consulted while it is
+current and the notification listener is connected; otherwise callers fall
+back to SQL.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import os
+import threading
+import time
+from array import array
+from contextlib import closing
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.services import notifications
+from postgres_config import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+CATALOG_CHANNEL = "watch2_catalog"
+REBUILD_DELAY_SECONDS = float(os.getenv("CATALOG_INDEX_REBUILD_DELAY", "1"))
+
+SORT_KEYS = ("created_at", "title", "duration", "status", "filename", "file_size")
+
+_ROW_COLUMNS = (
+    "id, title, description, media_type, source_path, status, "
+    "metadata, duration_seconds, created_at, updated_at"
+)
+
+
+def _popcount(value: int) -> int:
+    return bin(value).count("1")
+
+
+def _number(value: Any) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(number) else number
+
+
+def text_sort_key(value: Any) -> Optional[Tuple[str, str]]:
+    """Sort key for text columns, identical to :func:`text_order_sql`.
+
+    Case-insensitive first, then code point order as a tie-break, so the
+    result never depends on the database collation.
+    """
+    return (value.lower(), value) if isinstance(value, str) else None
+
+
+def text_order_sql(expression: str, direction: str) -> str:
+    """``ORDER BY`` terms for a text column, matching :func:`text_sort_key`."""
+    return f'lower({expression}) COLLATE "C" {direction}, ({expression}) COLLATE "C" {direction}'
+
+
+def _metadata(row: Dict[str, Any]) -> Dict[str, Any]:
+    metadata = row.get("metadata")
+    return metadata if isinstance(metadata, dict) else {}
+
+
+class _Snapshot:
+    """Immutable columnar view of the catalog built from one full read."""
+
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self.rows = rows
+        self.size = len(rows)
+        self.all_bits = (1 << self.size) - 1
+
+        self.media_type_names: List[Optional[str]] = []
+        self.status_names: List[Optional[str]] = []
+        media_type_codes: Dict[Optional[str], int] = {}
+        status_codes: Dict[Optional[str], int] = {}
+
+        self.media_type = array("H")
+        self.status = array("H")
+        self.file_size = array("d")
+        self.duration = array("d")
+        self.created_at = array("d")
+        title_keys: List[Optional[Tuple[str, str]]] = []
+        filename_keys: List[Optional[Tuple[str, str]]] = []
+
+        type_bits: Dict[Optional[str], int] = {}
+        status_bits: Dict[Optional[str], int] = {}
+
+        for position, row in enumerate(rows):
+            metadata = _metadata(row)
+            media_type = row.get("media_type")
+            status = row.get("status")
+            if media_type not in media_type_codes:
+                media_type_codes[media_type] = len(self.media_type_names)
+                self.media_type_names.append(media_type)
+            if status not in status_codes:
+                status_codes[status] = len(self.status_names)
+                self.status_names.append(status)
+            self.media_type.append(media_type_codes[media_type])
+            self.status.append(status_codes[status])
+            type_bits[media_type] = type_bits.get(media_type, 0) | (1 << position)
+            status_bits[status] = status_bits.get(status, 0) | (1 << position)
+
+            size = _number(metadata.get("fileSize"))
+            duration = _number(row.get("duration_seconds"))
+            created = row.get("created_at")
+            self.file_size.append(size if size is not None else math.nan)
+            self.duration.append(duration if duration is not None else math.nan)
+            self.created_at.append(created.timestamp() if hasattr(created, "timestamp") else math.nan)
+
+            title = row.get("title")
+            title_keys.append(text_sort_key(title))
+            filename = metadata.get("filename") or title
+            filename_keys.append(text_sort_key(filename))
+
+        self.type_bits = type_bits
+        self.status_bits = status_bits
+
+        # Ascending orders with NULLs last, matching Postgres' default.
+        self.orders: Dict[str, array] = {
+            "created_at": self._order_numeric(self.created_at),
+            "duration": self._order_numeric(self.duration),
+            "file_size": self._order_numeric(self.file_size, nulls_as_zero=True),
+            "title": self._order_keys(title_keys),
+            "filename": self._order_keys(filename_keys),
+            "status": self._order_keys([text_sort_key(self.status_names[code]) for code in self.status]),
+        }
+
+    def _order_numeric(self, column: array, nulls_as_zero: bool = False) -> array:
+        def key(position: int) -> Tuple[int, float]:
+            value = column[position]
+            if math.isnan(value):
+                return (0, 0.0) if nulls_as_zero else (1, 0.0)
+            return (0, value)
+
+        return array("I", sorted(range(self.size), key=key))
+
+    def _order_keys(self, keys: List[Optional[Tuple[str, str]]]) -> array:
+        return array("I", sorted(range(self.size), key=lambda p: (keys[p] is None, keys[p] or ("", ""))))
+
+    def category_counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for media_type, bits in self.type_bits.items():
+            name = media_type or "unknown"
+            counts[name] = counts.get(name, 0) + _popcount(bits)
+        return dict(sorted(counts.items()))
+
+    def query(
+        self,
+        *,
+        status: Optional[str],
+        media_type: Optional[str],
+        sort_by: str,
+        descending: bool,
+        offset: int,
+        limit: int,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        mask = self.all_bits
+        if status:
+            mask &= self.status_bits.get(status, 0)
+        if media_type:
+            mask &= self.type_bits.get(media_type, 0)
+        total = _popcount(mask)
+        if total == 0 or offset >= total:
+            return [], total
+
+        order = self.orders.get(sort_by, self.orders["created_at"])
+        positions = reversed(order) if descending else iter(order)
+
+        if mask == self.all_bits:
+            page = []
+            for index, position in enumerate(positions):
+                if index >= offset + limit:
+                    break
+                if index >= offset:
+                    page.append(self.rows[position])
+            return page, total
+
+        bitmap = mask.to_bytes((self.size + 7) // 8, "little")
+        page = []
+        seen = 0
+        for position in positions:
+            if not (bitmap[position >> 3] >> (position & 7)) & 1:
+                continue
+            if seen >= offset:
+                page.append(self.rows[position])
+                if len(page) >= limit:
+                    break
+            seen += 1
+        return page, total
+
+
+class CatalogIndex:
+    def __init__(self, loader: Optional[Callable[[], List[Dict[str, Any]]]] = None):
+        self._loader = loader or self._load_rows
+        self._snapshot: Optional[_Snapshot] = None
+        self._generation = 0
+        self._built_generation = -1
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self.enabled = False
+        self.stats = {"builds": 0, "last_build_ms": 0.0, "hits": 0, "fallbacks": 0, "invalidations": 0}
+
+    @staticmethod
+    def _load_rows() -> List[Dict[str, Any]]:
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            cursor.execute(f"SELECT {_ROW_COLUMNS} FROM media_items")
+            return list(cursor.fetchall() or [])
+
+    def start(self) -> None:
+        """Subscribe to catalog changes and build the first snapshot in the background."""
+        self.enabled = True
+        notifications.subscribe(CATALOG_CHANNEL, lambda payload: self.invalidate())
+        self._schedule(0)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self.stats["invalidations"] += 1
+        self._schedule(REBUILD_DELAY_SECONDS)
+
+    def _schedule(self, delay: float) -> None:
+        with self._lock:
+            if self._timer is not None and self._timer.is_alive():
+                return
+            self._timer = threading.Timer(delay, self.rebuild)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def rebuild(self) -> None:
+        with self._lock:
+            generation = self._generation
+        started = time.perf_counter()
+        try:
+            snapshot = _Snapshot(self._loader())
+        except Exception as exc:
+            logger.warning("Catalog index rebuild failed: %s", exc)
+            with self._lock:
+                self._timer = None
+            self._schedule(max(REBUILD_DELAY_SECONDS, 5.0))
+            return
+        with self._lock:
+            self._snapshot = snapshot
+            self._built_generation = generation
+            self._timer = None
+            self.stats["builds"] += 1
+            self.stats["last_build_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            stale = generation != self._generation
+        if stale:
+            self._schedule(REBUILD_DELAY_SECONDS)
+
+    def current(self) -> Optional[_Snapshot]:
+        """The snapshot if it reflects every committed change, else ``None``."""
+        with self._lock:
+            snapshot = self._snapshot
+            fresh = self._built_generation == self._generation
+        if snapshot is None or not fresh or not notifications.is_listening():
+            self.stats["fallbacks"] += 1
+            return None
+        self.stats["hits"] += 1
+        return snapshot
+
+    def describe(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "items": snapshot.size if snapshot else 0,
+            "current": snapshot is not None and self._built_generation == self._generation,
+            "listening": notifications.is_listening(),
+        }
+
+
+catalog_index = CatalogIndex()
+
+
+def start_catalog_index() -> None:
+    """Called from ``create_app``; a no-op unless ``CATALOG_INDEX_ENABLED``."""
+    if os.getenv("CATALOG_INDEX_ENABLED", "false").lower() in ("1", "true", "yes"):
+        catalog_index.start()
+
+
+def query_catalog(
+    *,
+    status: Optional[str],
+    media_type: Optional[str],
+    sort_by: str,
+    descending: bool,
+    offset: int,
+    limit: int,
+) -> Optional[Dict[str, Any]]:
+    """Answer a browse query from the index, or ``None`` to fall back to SQL."""
+    if not catalog_index.enabled or sort_by not in SORT_KEYS:
+        return None
+    snapshot = catalog_index.current()
+    if snapshot is None:
+        return None
+    rows, total = snapshot.query(
+        status=status,
+        media_type=media_type,
+        sort_by=sort_by,
+        descending=descending,
+        offset=offset,
+        limit=limit,
+    )
+    return {"rows": rows, "total": total, "categories": snapshot.category_counts()}
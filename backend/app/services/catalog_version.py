@@ -0,0 +1,77 @@
+"""Process-local catalog version (migration 008).
+
+Every statement that writes ``media_items`` publishes a fresh value of
+``catalog_version_seq`` on ``watch2_catalog``. The values are unique but not
+ordered by commit, so the version is the *last* payload received, never the
+largest: notifications arrive in commit order, and each committed write
+changes the version. After the listener (re)connects, a fresh sequence value
+stands in until the next notification. ``current()`` returns ``None`` while
+the listener is disconnected or when the sequence is missing, which disables
+ETags.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from contextlib import closing
+from typing import Optional
+
+from app.services import notifications
+from app.services.catalog_index import CATALOG_CHANNEL
+from postgres_config import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogVersion:
+    def __init__(self):
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self) -> None:
+        if self._started:
+            return
+        self._started = True
+        notifications.subscribe(CATALOG_CHANNEL, self._on_notify)
+
+    def _on_notify(self, payload: Optional[str]) -> None:
+        with self._lock:
+            if payload and payload.isdigit():
+                self._version = int(payload)
+            else:
+                # Reconnect (or pre-008 payload): draw a fresh version.
+                self._version = None
+
+    def _load(self) -> Optional[int]:
+        try:
+            with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+                cursor.execute("SELECT nextval('catalog_version_seq') AS version")
+                row = cursor.fetchone()
+        except Exception as exc:
+            logger.debug("Catalog version unavailable: %s", exc)
+            return None
+        return int(row["version"]) if row else None
+
+    def current(self) -> Optional[int]:
+        if not (self._started and notifications.is_listening()):
+            return None
+        with self._lock:
+            if self._version is not None:
+                return self._version
+        version = self._load()
+        if version is None:
+            return None
+        with self._lock:
+            # A notification that arrived meanwhile is newer than the draw.
+            if self._version is None:
+                self._version = version
+            return self._version
+
+
+catalog_version = CatalogVersion()
+
+
+def start_catalog_version() -> None:
+    """Called from ``create_app`` to keep the version current via NOTIFY."""
+    catalog_version.start()
@@ -0,0 +1,388 @@
+"""Resumable, chunked uploads (tus-style: create, PATCH at offsets, complete).
+
+Each session stages its data in ``<category root>/.uploads/<id>.part`` so
+completing it is a rename on the same filesystem, with a ``<id>.json``
+sidecar recording the byte ranges received so far; sessions therefore
+survive a restart and a dropped connection only loses the chunk in flight.
+
+Chunks may arrive out of order and in parallel as long as they do not
+overlap. The SHA-256 is computed incrementally: a chunk that starts at the
+end of the hashed prefix is hashed while it is written, and chunks that
+arrived early are read back once the gap before them is filled. Completion
+hands the digest to ``generate_file_metadata`` so the file is never re-read
+in full (unless the process restarted mid-upload and lost the hash state).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+from app.services.media_ingestion import UPLOAD_BUFFER_SIZE, StoredUpload, move_into_library
+from config_loader import MediaCategory, load_media_config
+
+logger = logging.getLogger(__name__)
+
+STAGING_DIRNAME = ".uploads"
+MAX_UPLOAD_SIZE = int(os.getenv("CHUNKED_UPLOAD_MAX_SIZE", str(200 * 1024 ** 3)))
+SESSION_TTL_SECONDS = float(os.getenv("CHUNKED_UPLOAD_TTL_HOURS", "24")) * 3600
+
+
+class UploadError(Exception):
+    """Raised for invalid upload operations; ``status`` is the HTTP status to return."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class UploadSession:
+    id: str
+    owner: str
+    filename: str
+    size: int
+    category: str
+    title: Optional[str] = None
+    description: Optional[str] = None
+    mime_type: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    ranges: List[List[int]] = field(default_factory=list)
+
+    @property
+    def offset(self) -> int:
+        """End of the contiguous prefix received from byte 0."""
+        if self.ranges and self.ranges[0][0] == 0:
+            return self.ranges[0][1]
+        return 0
+
+    @property
+    def complete(self) -> bool:
+        return self.offset == self.size
+
+    def missing(self) -> List[List[int]]:
+        gaps, cursor = [], 0
+        for start, end in self.ranges:
+            if start > cursor:
+                gaps.append([cursor, start])
+            cursor = end
+        if cursor < self.size:
+            gaps.append([cursor, self.size])
+        return gaps
+
+    def add_range(self, start: int, end: int) -> None:
+        if end <= start:
+            return
+        merged: List[List[int]] = []
+        for existing in sorted(self.ranges + [[start, end]]):
+            if merged and existing[0] <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], existing[1])
+            else:
+                merged.append(list(existing))
+        self.ranges = merged
+
+    def overlaps(self, start: int, end: int) -> bool:
+        return any(start < r_end and r_start < end for r_start, r_end in self.ranges)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "category": self.category,
+            "size": self.size,
+            "offset": self.offset,
+            "received": sum(end - start for start, end in self.ranges),
+            "missing": self.missing(),
+            "complete": self.complete,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class _SessionState:
+    """In-process bookkeeping for one session: locks, in-flight chunks and hash."""
+
+    def __init__(self, session: UploadSession, staging_dir: Path):
+        self.session = session
+        self.staging_dir = staging_dir
+        self.lock = threading.Lock()
+        self.in_flight: List[Tuple[int, int]] = []
+        self.sha = hashlib.sha256()
+        self.hashed = 0
+        self.hash_busy = False
+
+    @property
+    def data_path(self) -> Path:
+        return self.staging_dir / f"{self.session.id}.part"
+
+    @property
+    def meta_path(self) -> Path:
+        return self.staging_dir / f"{self.session.id}.json"
+
+    def persist(self) -> None:
+        tmp = self.meta_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(asdict(self.session)), encoding="utf-8")
+        os.replace(tmp, self.meta_path)
+
+
+def _staging_dir(category: MediaCategory) -> Path:
+    return Path(category.root_path) / STAGING_DIRNAME
+
+
+class ChunkedUploadManager:
+    def __init__(self):
+        self._sessions: Dict[str, _SessionState] = {}
+        self._lock = threading.Lock()
+
+    # -- sessions -----------------------------------------------------------
+
+    def create(
+        self,
+        *,
+        owner: str,
+        filename: str,
+        size: int,
+        category: MediaCategory,
+        title: Optional[str] = None,
+        description: Optional[str] = None,
+        mime_type: Optional[str] = None,
+    ) -> UploadSession:
+        if size <= 0:
+            raise UploadError("size must be a positive number of bytes")
+        if size > MAX_UPLOAD_SIZE:
+            raise UploadError(f"size exceeds the {MAX_UPLOAD_SIZE} byte limit", status=413)
+        self.expire_stale()
+
+        session = UploadSession(
+            id=uuid.uuid4().hex,
+            owner=str(owner),
+            filename=filename,
+            size=size,
+            category=category.key,
+            title=title,
+            description=description,
+            mime_type=mime_type,
+        )
+        staging_dir = _staging_dir(category)
+        staging_dir.mkdir(parents=True, exist_ok=True)
+        state = _SessionState(session, staging_dir)
+        with state.data_path.open("wb") as stream:
+            stream.truncate(size)
+        state.persist()
+        with self._lock:
+            self._sessions[session.id] = state
+        return session
+
+    def _state(self, upload_id: str, owner: str) -> _SessionState:
+        with self._lock:
+            state = self._sessions.get(upload_id)
+        if state is None:
+            state = self._load(upload_id)
+        if state is None:
+            raise UploadError("Upload not found", status=404)
+        if state.session.owner != str(owner):
+            raise UploadError("Upload not found", status=404)
+        return state
+
+    def _load(self, upload_id: str) -> Optional[_SessionState]:
+        """Recover a session persisted by an earlier process."""
+        if not upload_id.isalnum():
+            return None
+        for category in load_media_config().categories:
+            meta_path = _staging_dir(category) / f"{upload_id}.json"
+            if not meta_path.exists():
+                continue
+            try:
+                session = UploadSession(**json.loads(meta_path.read_text(encoding="utf-8")))
+            except (OSError, TypeError, ValueError) as exc:
+                logger.warning("Unreadable upload session %s: %s", meta_path, exc)
+                return None
+            state = _SessionState(session, meta_path.parent)
+            with self._lock:
+                return self._sessions.setdefault(upload_id, state)
+        return None
+
+    def get(self, upload_id: str, owner: str) -> UploadSession:
+        return self._state(upload_id, owner).session
+
+    def abort(self, upload_id: str, owner: str) -> None:
+        state = self._state(upload_id, owner)
+        with state.lock:
+            if state.in_flight:
+                raise UploadError("Upload has chunks in progress", status=409)
+            self._discard(state)
+
+    def _discard(self, state: _SessionState) -> None:
+        with self._lock:
+            self._sessions.pop(state.session.id, None)
+        for path in (state.data_path, state.meta_path):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def expire_stale(self) -> int:
+        cutoff = time.time() - SESSION_TTL_SECONDS
+        with self._lock:
+            stale = [
+                state for state in self._sessions.values()
+                if state.session.updated_at < cutoff and not state.in_flight
+            ]
+        for state in stale:
+            self._discard(state)
+        return len(stale) + self._sweep_staging(cutoff)
+
+    def _sweep_staging(self, cutoff: float) -> int:
+        """Remove sessions left on disk by earlier processes, plus orphaned files.
+
+        Orphaned ``.part`` and ``.json.tmp`` files are only removed once they are
+        older than the TTL, so a session being created right now is left alone.
+        """
+        removed = 0
+        for category in load_media_config().categories:
+            staging_dir = _staging_dir(category)
+            try:
+                paths = list(staging_dir.iterdir())
+            except OSError:
+                continue
+            for path in paths:
+                upload_id = path.name.split(".", 1)[0]
+                with self._lock:
+                    if upload_id in self._sessions:
+                        continue
+                try:
+                    if path.name.endswith(".json"):
+                        try:
+                            updated_at = float(json.loads(path.read_text(encoding="utf-8"))["updated_at"])
+                        except (KeyError, TypeError, ValueError):
+                            updated_at = path.stat().st_mtime
+                        if updated_at >= cutoff:
+                            continue
+                        for leftover in (path.with_suffix(".part"), path.with_suffix(".json.tmp")):
+                            leftover.unlink(missing_ok=True)
+                        path.unlink()
+                        removed += 1
+                    elif path.name.endswith((".part", ".json.tmp")):
+                        if path.with_name(f"{upload_id}.json").exists() or path.stat().st_mtime >= cutoff:
+                            continue
+                        path.unlink()
+                except FileNotFoundError:
+                    continue
+                except OSError as exc:
+                    logger.warning("Could not sweep upload staging file %s: %s", path, exc)
+        return removed
+
+    # -- chunks -------------------------------------------------------------
+
+    def write_chunk(self, upload_id: str, owner: str, offset: int, stream: BinaryIO, length: int) -> UploadSession:
+        state = self._state(upload_id, owner)
+        session = state.session
+        end = offset + length
+        if offset < 0 or length <= 0 or end > session.size:
+            raise UploadError("Chunk lies outside the declared upload size")
+
+        with state.lock:
+            if session.overlaps(offset, end) or any(
+                offset < f_end and f_start < end for f_start, f_end in state.in_flight
+            ):
+                raise UploadError("Chunk overlaps data already received", status=409)
+            state.in_flight.append((offset, end))
+            hash_inline = offset == state.hashed and not state.hash_busy
+            if hash_inline:
+                state.hash_busy = True
+
+        written = 0
+        try:
+            fd = os.open(state.data_path, os.O_WRONLY)
+            try:
+                while written < length:
+                    chunk = stream.read(min(UPLOAD_BUFFER_SIZE, length - written))
+                    if not chunk:
+                        break
+                    os.pwrite(fd, chunk, offset + written)
+                    if hash_inline:
+                        state.sha.update(chunk)
+                    written += len(chunk)
+            finally:
+                os.close(fd)
+        finally:
+            # Keep whatever made it to disk so a dropped connection can resume.
+            with state.lock:
+                state.in_flight.remove((offset, end))
+                session.add_range(offset, offset + written)
+                session.updated_at = time.time()
+                if hash_inline:
+                    state.hashed = offset + written
+                    state.hash_busy = False
+                state.persist()
+
+        if written < length:
+            raise UploadError(f"Chunk truncated after {written} of {length} bytes", status=400)
+        self._advance_hash(state)
+        return session
+
+    def _advance_hash(self, state: _SessionState) -> None:
+        """Hash chunks that arrived ahead of the hashed prefix once the gap is filled."""
+        while True:
+            with state.lock:
+                if state.hash_busy:
+                    return
+                target = state.session.offset
+                start = state.hashed
+                if target <= start:
+                    return
+                state.hash_busy = True
+            remaining = target - start
+            try:
+                with state.data_path.open("rb") as stream:
+                    stream.seek(start)
+                    while remaining > 0:
+                        chunk = stream.read(min(UPLOAD_BUFFER_SIZE, remaining))
+                        if not chunk:
+                            break
+                        state.sha.update(chunk)
+                        remaining -= len(chunk)
+            finally:
+                with state.lock:
+                    state.hashed = target - remaining
+                    state.hash_busy = False
+
+    # -- completion ---------------------------------------------------------
+
+    def complete(self, upload_id: str, owner: str, category: MediaCategory) -> Tuple[UploadSession, StoredUpload]:
+        """Move a fully received upload into the category root."""
+        state = self._state(upload_id, owner)
+        session = state.session
+        if not session.complete:
+            raise UploadError("Upload is missing data", status=409)
+        self._advance_hash(state)
+        with state.lock:
+            if state.in_flight or state.hash_busy or state.hashed != session.size:
+                raise UploadError("Upload is still being processed", status=409)
+            digest = state.sha.hexdigest()
+            final_path = move_into_library(
+                state.data_path,
+                destination_dir=category.root_path,
+                filename=session.filename,
+            )
+            self._discard(state)
+        return session, StoredUpload(path=final_path, size=session.size, sha256=digest)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {
+            "active_sessions": len(sessions),
+            "bytes_pending": sum(s.session.size - s.session.offset for s in sessions),
+        }
+
+
+uploads = ChunkedUploadManager()
@@ -0,0 +1,57 @@
+"""Shared ffmpeg invocation for the HLS packager, transcoder and trickplay sheets."""
+from __future__ import annotations
+
+import os
+import shutil
+import subprocess
+from pathlib import Path
+from typing import Callable, List, Optional
+
+FFMPEG_PATH = shutil.which(os.getenv("FFMPEG_PATH", "ffmpeg"))
+
+
+class FfmpegError(RuntimeError):
+    """ffmpeg exited non-zero; the message carries the tail of its log."""
+
+
+def run_ffmpeg(
+    arguments: List[str],
+    *,
+    log_path: Path,
+    duration: Optional[float] = None,
+    on_progress: Optional[Callable[[int], None]] = None,
+) -> None:
+    """Run ffmpeg with ``arguments``, reporting whole-percent progress.
+
+    ``-progress pipe:1`` is appended so progress arrives on stdout; errors go
+    to ``log_path``, which is removed on success.
+    """
+    if FFMPEG_PATH is None:
+        raise FfmpegError("ffmpeg is not available on this server")
+    command = [FFMPEG_PATH, "-nostdin", "-y", "-loglevel", "error", *arguments[:-1],
+               "-progress", "pipe:1", arguments[-1]]
+    last = -1
+    with log_path.open("wb") as log:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=log)
+        for raw in process.stdout:
+            name, _, value = raw.decode("ascii", "replace").strip().partition("=")
+            if on_progress is None or name != "out_time_us" or not duration or not value.isdigit():
+                continue
+            percent = min(int(int(value) / 1e6 / duration * 100), 99)
+            if percent != last:
+                last = percent
+                on_progress(percent)
+        returncode = process.wait()
+
+    if returncode != 0:
+        tail = _log_tail(log_path)
+        raise FfmpegError(f"ffmpeg exited with {returncode}: {tail}")
+    log_path.unlink()
+
+
+def _log_tail(path: Path, size: int = 400) -> str:
+    try:
+        return path.read_bytes()[-size:].decode("utf-8", "replace").strip()
+    except OSError:
+        return ""
+
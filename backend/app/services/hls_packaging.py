@@ -0,0 +1,343 @@
+"""On-demand HLS packaging for categories with ``playback.allow_hls``.
+
+Sources are remuxed (``-c copy``, no re-encode) with a local ffmpeg into
+fMP4 (or MPEG-TS) segments plus a VOD playlist under
+``HLS_CACHE_ROOT/<media id>/<rendition>/``. The rendition key is derived from
+the item's ``scannerSignature``, so every file below it is immutable and can
+be served with far-future caching; a changed source gets a new directory.
+
+Packaging runs on a small background queue; a request for an item that is
+not packaged yet enqueues it and reports progress. Outputs are recorded in
+``transcoded_files`` (``format='hls'``, migration 010) and the least recently
+played renditions are evicted once the cache exceeds ``HLS_CACHE_MAX_GB``.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.services.ffmpeg import FFMPEG_PATH, FfmpegError, run_ffmpeg
+from app.services.renditions import (
+    ProgressWriter,
+    claim_rendition,
+    fail_rendition,
+    finish_rendition,
+    load_rendition,
+)
+from config_loader import load_media_config
+from postgres_config import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+HLS_ROOT = Path(os.getenv("HLS_CACHE_ROOT", os.path.join(os.getenv("DATA_ROOT", "/app/data"), "hls")))
+SEGMENT_SECONDS = int(os.getenv("HLS_SEGMENT_SECONDS", "6"))
+SEGMENT_TYPE = os.getenv("HLS_SEGMENT_TYPE", "fmp4").lower()
+CACHE_MAX_BYTES = int(float(os.getenv("HLS_CACHE_MAX_GB", "50")) * 1024 ** 3)
+WORKERS = int(os.getenv("HLS_WORKERS", "1"))
+
+HLS_FORMAT = "hls"
+HLS_QUALITY = "source"
+PLAYLIST_NAME = "index.m3u8"
+# last_accessed_at is written at most this often per item.
+TOUCH_INTERVAL_SECONDS = 300
+
+# Codecs HLS players accept as-is; anything else needs a transcode.
+_REMUXABLE_VIDEO = {"h264", "hevc"}
+_REMUXABLE_AUDIO = {"aac", "mp3", "ac3", "eac3"}
+_SAFE_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+
+class HlsError(Exception):
+    """Raised when an item cannot be packaged; ``status`` is the HTTP status to return."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def rendition_key(signature: Optional[str]) -> str:
+    return hashlib.sha1((signature or "").encode("utf-8")).hexdigest()[:16]
+
+
+def hls_allowed(category_key: Optional[str]) -> bool:
+    try:
+        category = load_media_config().get_category(category_key)
+    except (KeyError, TypeError):
+        return False
+    return bool((category.playback or {}).get("allow_hls"))
+
+
+def _directory_size(path: Path) -> int:
+    return sum(entry.stat().st_size for entry in path.iterdir() if entry.is_file())
+
+
+class HlsPackager:
+    def __init__(self):
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: Dict[str, Future] = {}
+        self._progress: Dict[str, int] = {}
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return FFMPEG_PATH is not None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=max(WORKERS, 1), thread_name_prefix="watch2-hls")
+            return self._executor
+
+    # -- lookups ------------------------------------------------------------
+
+    def _load_item(self, cursor, media_id: str) -> Dict[str, Any]:
+        cursor.execute(
+            """
+            SELECT id::text AS id, source_path, duration_seconds, metadata
+            FROM media_items
+            WHERE id = %s AND status IS DISTINCT FROM 'deleted'
+            """,
+            (media_id,),
+        )
+        row = cursor.fetchone()
+        if not row:
+            raise HlsError("Media not found", status=404)
+        metadata = row.get("metadata") or {}
+        if not hls_allowed(metadata.get("category")):
+            raise HlsError("HLS is not enabled for this media category", status=409)
+        if not row.get("source_path"):
+            raise HlsError("Media source path unavailable", status=404)
+        return row
+
+    def status(self, media_id: str, *, enqueue: bool = True) -> Dict[str, Any]:
+        """Current packaging state of ``media_id``.
+
+        When not packaged it is enqueued, unless ``enqueue`` is false; the
+        state is then ``missing``.
+        """
+        if not _SAFE_NAME.match(media_id or ""):
+            raise HlsError("Media not found", status=404)
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            item = self._load_item(cursor, media_id)
+            signature = (item.get("metadata") or {}).get("scannerSignature")
+            key = rendition_key(signature)
+            rendition = load_rendition(cursor, media_id, HLS_FORMAT, HLS_QUALITY)
+
+        current = rendition is not None and rendition["source_signature"] == signature
+        if current and rendition["is_ready"] and Path(rendition["file_path"]).exists():
+            self.touch(media_id)
+            return {"status": "ready", "rendition": key, "progress": 100}
+        if current and rendition["error"] and media_id not in self._pending:
+            return {"status": "failed", "rendition": key, "error": rendition["error"]}
+        if not self.available:
+            raise HlsError("ffmpeg is not available on this server", status=503)
+
+        with self._lock:
+            running = media_id in self._pending
+            if not running and not enqueue:
+                return {"status": "missing", "rendition": key, "progress": 0}
+            if not running:
+                self._progress[media_id] = 0
+                self._pending[media_id] = self._get_executor().submit(self._run, item)
+            progress = self._progress.get(media_id, 0)
+        return {"status": "packaging" if running else "queued", "rendition": key, "progress": progress}
+
+    def resolve(self, media_id: str, rendition: str, filename: str) -> Optional[Path]:
+        """Path of a packaged file, or ``None`` for unknown or unsafe names."""
+        if not all(_SAFE_NAME.match(part or "") for part in (media_id, rendition, filename)):
+            return None
+        path = HLS_ROOT / media_id / rendition / filename
+        return path if path.is_file() else None
+
+    def touch(self, media_id: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            last = self._touched.get(media_id)
+            if last is not None and now - last < TOUCH_INTERVAL_SECONDS:
+                return
+            self._touched[media_id] = now
+        try:
+            with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+                cursor.execute(
+                    """
+                    UPDATE transcoded_files SET last_accessed_at = NOW()
+                    WHERE media_item_id = %s AND format = %s
+                    """,
+                    (media_id, HLS_FORMAT),
+                )
+                conn.commit()
+        except Exception as exc:
+            logger.debug("HLS access time update failed for %s: %s", media_id, exc)
+
+    # -- packaging ----------------------------------------------------------
+
+    def _run(self, item: Dict[str, Any]) -> None:
+        media_id = item["id"]
+        try:
+            self._package(item)
+        except Exception as exc:
+            logger.exception("HLS packaging failed for %s: %s", media_id, exc)
+        finally:
+            with self._lock:
+                self._pending.pop(media_id, None)
+                self._progress.pop(media_id, None)
+        try:
+            self.enforce_budget()
+        except Exception as exc:
+            logger.warning("HLS cache eviction failed: %s", exc)
+
+    def _arguments(self, source: str, output_dir: Path, segment_type: str) -> List[str]:
+        extension = "m4s" if segment_type == "fmp4" else "ts"
+        arguments = [
+            "-i", source,
+            "-map", "0:v:0", "-map", "0:a:0?",
+            "-c", "copy",
+            "-f", "hls",
+            "-hls_time", str(SEGMENT_SECONDS),
+            "-hls_playlist_type", "vod",
+            "-hls_segment_type", segment_type,
+            "-hls_segment_filename", str(output_dir / f"seg_%05d.{extension}"),
+        ]
+        if segment_type == "fmp4":
+            arguments += ["-hls_fmp4_init_filename", "init.mp4"]
+        else:
+            arguments += ["-bsf:v", "h264_mp4toannexb"]
+        return arguments + [str(output_dir / PLAYLIST_NAME)]
+
+    def _package(self, item: Dict[str, Any]) -> None:
+        media_id = item["id"]
+        metadata = item.get("metadata") or {}
+        signature = metadata.get("scannerSignature")
+        key = rendition_key(signature)
+        final_dir = HLS_ROOT / media_id / key
+        work_dir = HLS_ROOT / media_id / f"{key}.tmp"
+        duration = float(item.get("duration_seconds") or metadata.get("durationSeconds") or 0)
+
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            row_id = claim_rendition(
+                cursor, media_id, HLS_FORMAT, HLS_QUALITY, str(final_dir / PLAYLIST_NAME), signature
+            )
+            conn.commit()
+
+            def _fail(message: str) -> None:
+                fail_rendition(cursor, row_id, message)
+                conn.commit()
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+            probe = metadata.get("probe") or {}
+            video_codec, audio_codec = probe.get("video_codec"), probe.get("audio_codec")
+            if video_codec and video_codec not in _REMUXABLE_VIDEO:
+                _fail(f"Video codec {video_codec} cannot be remuxed to HLS; a transcode is required")
+                return
+            if audio_codec and audio_codec not in _REMUXABLE_AUDIO:
+                _fail(f"Audio codec {audio_codec} cannot be remuxed to HLS; a transcode is required")
+                return
+            # HEVC is only valid in fMP4 segments.
+            segment_type = "fmp4" if SEGMENT_TYPE == "fmp4" or video_codec == "hevc" else "mpegts"
+
+            shutil.rmtree(work_dir, ignore_errors=True)
+            work_dir.mkdir(parents=True)
+            write_progress = ProgressWriter(conn, cursor, row_id)
+
+            def _progress(percent: int) -> None:
+                with self._lock:
+                    self._progress[media_id] = percent
+                write_progress(percent)
+
+            try:
+                run_ffmpeg(
+                    self._arguments(item["source_path"], work_dir, segment_type),
+                    log_path=work_dir / "ffmpeg.log",
+                    duration=duration,
+                    on_progress=_progress,
+                )
+            except FfmpegError as exc:
+                _fail(str(exc))
+                return
+
+            shutil.rmtree(final_dir, ignore_errors=True)
+            os.replace(work_dir, final_dir)
+            for stale in (HLS_ROOT / media_id).iterdir():
+                if stale.name != key:
+                    shutil.rmtree(stale, ignore_errors=True)
+
+            finish_rendition(cursor, row_id, file_size=_directory_size(final_dir), duration=duration or None)
+            conn.commit()
+        logger.info("Packaged HLS for %s into %s", media_id, final_dir)
+
+    # -- cache budget -------------------------------------------------------
+
+    def enforce_budget(self, max_bytes: Optional[int] = None) -> Dict[str, Any]:
+        """Evict least recently played renditions until the cache fits ``max_bytes``."""
+        budget = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            cursor.execute(
+                """
+                SELECT id, media_item_id, file_path, COALESCE(file_size, 0) AS file_size
+                FROM transcoded_files
+                WHERE format = %s AND is_ready
+                ORDER BY last_accessed_at DESC NULLS LAST, completed_at DESC NULLS LAST
+                """,
+                (HLS_FORMAT,),
+            )
+            rows = cursor.fetchall() or []
+            total = 0
+            evicted: List[Dict[str, Any]] = []
+            with self._lock:
+                busy = set(self._pending)
+            for row in rows:
+                total += int(row["file_size"])
+                if total > budget and row["media_item_id"] not in busy:
+                    evicted.append(row)
+            for row in evicted:
+                shutil.rmtree(Path(row["file_path"]).parent, ignore_errors=True)
+            if evicted:
+                cursor.execute(
+                    "DELETE FROM transcoded_files WHERE id = ANY(%s)",
+                    ([row["id"] for row in evicted],),
+                )
+                conn.commit()
+
+        freed = sum(int(row["file_size"]) for row in evicted)
+        if evicted:
+            logger.info("Evicted %d HLS renditions (%d bytes)", len(evicted), freed)
+        return {"evicted": len(evicted), "freed_bytes": freed, "cached_bytes": total - freed}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = dict(self._progress)
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            cursor.execute(
+                """
+                SELECT COUNT(*) FILTER (WHERE is_ready) AS ready,
+                       COUNT(*) FILTER (WHERE error IS NOT NULL) AS failed,
+                       COALESCE(SUM(file_size) FILTER (WHERE is_ready), 0) AS cached_bytes
+                FROM transcoded_files
+                WHERE format = %s
+                """,
+                (HLS_FORMAT,),
+            )
+            row = cursor.fetchone() or {}
+        return {
+            "ffmpeg": FFMPEG_PATH,
+            "segment_type": SEGMENT_TYPE,
+            "segment_seconds": SEGMENT_SECONDS,
+            "budget_bytes": CACHE_MAX_BYTES,
+            "cached_bytes": int(row.get("cached_bytes") or 0),
+            "ready": int(row.get("ready") or 0),
+            "failed": int(row.get("failed") or 0),
+            "in_progress": pending,
+        }
+
+
+hls_packager = HlsPackager()
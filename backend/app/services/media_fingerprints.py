@@ -0,0 +1,290 @@
+"""Staged content fingerprints and the duplicate report.
+
+Identifying a file by its bytes is done in stages so that almost nothing is
+read in full:
+
+1. ``file_size_bytes`` (a generated column, migration 009) - files with a
+   size no other item shares cannot be duplicates.
+2. ``fingerprint_sample`` - a hash of the size plus ``SAMPLE_BYTES`` read at
+   the head, middle and tail, computed only for size collisions.
+3. ``content_hash`` - full SHA-256, computed only when samples collide.
+
+Work is keyed on ``metadata.scannerSignature``: a row is re-fingerprinted
+only after the scanner saw its size, mtime or path change. Files are read on
+a thread pool (hashing releases the GIL) and results are written in batches.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+from postgres_config import column_type, get_db_connection
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_BYTES = int(os.getenv("FINGERPRINT_SAMPLE_BYTES", str(64 * 1024)))
+HASH_BUFFER_BYTES = 4 * 1024 * 1024
+WORKERS = int(os.getenv("FINGERPRINT_WORKERS", "4"))
+BATCH_SIZE = 500
+
+_schema_lock = threading.Lock()
+_columns_available: Optional[bool] = None
+
+
+def fingerprints_available(force: bool = False) -> bool:
+    """Whether migration 009's columns exist (checked once per process)."""
+    global _columns_available
+    with _schema_lock:
+        if _columns_available is not None and not force:
+            return _columns_available
+        try:
+            with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+                cursor.execute(
+                    """
+                    SELECT COUNT(*) AS columns
+                    FROM information_schema.columns
+                    WHERE table_schema = 'public'
+                      AND table_name = 'media_items'
+                      AND column_name IN ('file_size_bytes', 'fingerprint_sample', 'content_hash')
+                    """
+                )
+                row = cursor.fetchone()
+            _columns_available = bool(row and row["columns"] == 3)
+        except Exception as exc:
+            logger.warning("Fingerprint column discovery failed: %s", exc)
+            return False
+        return _columns_available
+
+
+def sample_fingerprint(path: str, size: Optional[int] = None) -> str:
+    """Hash of the size and three ``SAMPLE_BYTES`` blocks (head, middle, tail)."""
+    if size is None:
+        size = os.path.getsize(path)
+    digest = hashlib.blake2b(str(size).encode("ascii"), digest_size=16)
+    with open(path, "rb") as stream:
+        if size <= SAMPLE_BYTES * 3:
+            digest.update(stream.read())
+        else:
+            for offset in (0, size // 2 - SAMPLE_BYTES // 2, size - SAMPLE_BYTES):
+                stream.seek(offset)
+                digest.update(stream.read(SAMPLE_BYTES))
+    return digest.hexdigest()
+
+
+def content_hash(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as stream:
+        for chunk in iter(lambda: stream.read(HASH_BUFFER_BYTES), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _compute_parallel(
+    rows: List[Dict[str, Any]],
+    compute: Callable[[Dict[str, Any]], str],
+) -> Tuple[List[Tuple[Any, str]], int]:
+    """Run ``compute`` per row on the pool; returns ``[(id, value)]`` and the error count."""
+    results: List[Tuple[Any, str]] = []
+    errors = 0
+
+    def _one(row: Dict[str, Any]) -> Optional[Tuple[Any, str]]:
+        try:
+            return row["id"], compute(row)
+        except OSError as exc:
+            logger.debug("Fingerprint skipped for %s: %s", row.get("source_path"), exc)
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(WORKERS, 1), thread_name_prefix="watch2-fingerprint") as pool:
+        for result in pool.map(_one, rows):
+            if result is None:
+                errors += 1
+            else:
+                results.append(result)
+    return results, errors
+
+
+def _write_column(cursor, column: str, values: List[Tuple[Any, str]]) -> None:
+    """Write ``(media id, value)`` pairs; ids keep the type they were selected with."""
+    if not values:
+        return
+    template = f"(%s::{column_type(cursor, 'media_items', 'id')}, %s)"
+    for start in range(0, len(values), BATCH_SIZE):
+        batch = values[start:start + BATCH_SIZE]
+        execute_values(
+            cursor,
+            f"""
+            UPDATE media_items AS m
+            SET {column} = v.value, fingerprinted_at = NOW()
+            FROM (VALUES %s) AS v(id, value)
+            WHERE m.id = v.id
+            """,
+            batch,
+            template=template,
+            page_size=len(batch),
+        )
+
+
+def refresh_fingerprints(limit: Optional[int] = None) -> Dict[str, Any]:
+    """Bring fingerprints up to date for every non-deleted item."""
+    if not fingerprints_available():
+        raise RuntimeError("Fingerprint columns missing; apply migrations/009_add_media_fingerprints.sql")
+
+    summary: Dict[str, Any] = {"reset": 0, "sampled": 0, "hashed": 0, "unreadable": 0}
+    row_limit = int(limit) if limit else None
+    with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+        # Stage 0: forget fingerprints of files the scanner saw change. An
+        # upload's own SHA-256 stays valid while its signature is unchanged.
+        cursor.execute(
+            """
+            UPDATE media_items
+            SET fingerprint_sample = NULL,
+                content_hash = metadata->>'fileHash',
+                fingerprint_signature = metadata->>'scannerSignature',
+                fingerprinted_at = NOW()
+            WHERE status IS DISTINCT FROM 'deleted'
+              AND fingerprint_signature IS DISTINCT FROM metadata->>'scannerSignature'
+            """
+        )
+        summary["reset"] = cursor.rowcount
+        conn.commit()
+
+        # Stage 1 -> 2: sample only files whose size is shared.
+        cursor.execute(
+            """
+            SELECT id, source_path, file_size_bytes
+            FROM media_items m
+            WHERE status = 'available'
+              AND fingerprint_sample IS NULL
+              AND file_size_bytes > 0
+              AND EXISTS (
+                  SELECT 1 FROM media_items o
+                  WHERE o.file_size_bytes = m.file_size_bytes
+                    AND o.id <> m.id
+                    AND o.status IS DISTINCT FROM 'deleted'
+              )
+            LIMIT %s
+            """,
+            (row_limit,),
+        )
+        rows = cursor.fetchall() or []
+        samples, errors = _compute_parallel(
+            rows, lambda row: sample_fingerprint(row["source_path"], row["file_size_bytes"])
+        )
+        _write_column(cursor, "fingerprint_sample", samples)
+        conn.commit()
+        summary["sampled"] = len(samples)
+        summary["unreadable"] += errors
+
+        # Stage 2 -> 3: full hash only where size and sample both collide.
+        cursor.execute(
+            """
+            SELECT id, source_path
+            FROM media_items m
+            WHERE status = 'available'
+              AND content_hash IS NULL
+              AND fingerprint_sample IS NOT NULL
+              AND EXISTS (
+                  SELECT 1 FROM media_items o
+                  WHERE o.file_size_bytes = m.file_size_bytes
+                    AND o.fingerprint_sample = m.fingerprint_sample
+                    AND o.id <> m.id
+                    AND o.status IS DISTINCT FROM 'deleted'
+              )
+            LIMIT %s
+            """,
+            (row_limit,),
+        )
+        rows = cursor.fetchall() or []
+        hashes, errors = _compute_parallel(rows, lambda row: content_hash(row["source_path"]))
+        _write_column(cursor, "content_hash", hashes)
+        conn.commit()
+        summary["hashed"] = len(hashes)
+        summary["unreadable"] += errors
+
+    return summary
+
+
+def duplicates_report(cursor, *, limit: int = 100, media_type: Optional[str] = None) -> Dict[str, Any]:
+    """Groups of non-deleted items with identical content, largest waste first."""
+    params: List[Any] = []
+    type_filter = ""
+    if media_type:
+        type_filter = "AND media_type = %s"
+        params.append(media_type)
+
+    cursor.execute(
+        f"""
+        SELECT content_hash,
+               MAX(file_size_bytes) AS size_bytes,
+               COUNT(*) AS copies,
+               MAX(file_size_bytes) * (COUNT(*) - 1) AS wasted_bytes,
+               json_agg(json_build_object(
+                   'id', id::text,
+                   'title', title,
+                   'source_path', source_path,
+                   'status', status,
+                   'media_type', media_type
+               ) ORDER BY created_at) AS items
+        FROM media_items
+        WHERE content_hash IS NOT NULL
+          AND status IS DISTINCT FROM 'deleted'
+          {type_filter}
+        GROUP BY content_hash
+        HAVING COUNT(*) > 1
+        ORDER BY wasted_bytes DESC NULLS LAST
+        LIMIT %s
+        """,
+        params + [max(1, min(int(limit), 1000))],
+    )
+    groups = cursor.fetchall() or []
+
+    cursor.execute(
+        f"""
+        SELECT COUNT(*) AS pending
+        FROM media_items
+        WHERE status = 'available'
+          AND fingerprint_signature IS DISTINCT FROM metadata->>'scannerSignature'
+          {type_filter}
+        """,
+        params,
+    )
+    pending = cursor.fetchone() or {"pending": 0}
+
+    return {
+        "groups": [
+            {
+                "content_hash": group["content_hash"],
+                "size_bytes": int(group["size_bytes"] or 0),
+                "copies": int(group["copies"]),
+                "wasted_bytes": int(group["wasted_bytes"] or 0),
+                "items": group["items"],
+            }
+            for group in groups
+        ],
+        "wasted_bytes": sum(int(group["wasted_bytes"] or 0) for group in groups),
+        "items_pending_fingerprint": int(pending["pending"] or 0),
+    }
+
+
+def matching_sample(path: str, size: int, candidates: Iterable[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """First candidate whose stored ``fingerprint_sample`` matches the file at ``path``."""
+    sample: Optional[str] = None
+    for candidate in candidates:
+        stored = candidate.get("fingerprint_sample")
+        if not stored:
+            continue
+        if sample is None:
+            try:
+                sample = sample_fingerprint(path, size)
+            except OSError:
+                return None
+        if stored == sample:
+            return candidate
+    return None
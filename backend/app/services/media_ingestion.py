@@ -1,13 +1,14 @@
 from __future__ import annotations
 
 import hashlib
+import json
 import os
 import uuid
+from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, BinaryIO, Dict, Optional
 
-from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
 
 from config_loader import MediaCategory
@@ -34,6 +35,9 @@ AUDIO_EXTENSIONS = {
     ".wma",
     ".m4b",
 }
+# Uploads are copied and hashed in one pass using buffers of this size.
+UPLOAD_BUFFER_SIZE = int(os.getenv("UPLOAD_BUFFER_SIZE", str(8 * 1024 * 1024)))
+
 IMAGE_EXTENSIONS = {
     ".jpg",
     ".jpeg",
@@ -46,17 +50,16 @@ IMAGE_EXTENSIONS = {
 }
 
 
-def save_uploaded_file(
-    file_storage: FileStorage,
-    *,
-    destination_dir: Path | str,
-    preferred_name: Optional[str] = None,
-) -> Path:
-    """Persist an uploaded file to the destination directory and return its path."""
-    dest_dir = Path(destination_dir)
-    dest_dir.mkdir(parents=True, exist_ok=True)
+@dataclass(frozen=True)
+class StoredUpload:
+    """A file written by :func:`store_upload_stream` with its size and SHA-256."""
+
+    path: Path
+    size: int
+    sha256: str
+
 
-    original_name = preferred_name or file_storage.filename or "uploaded_file"
+def _unique_target(dest_dir: Path, original_name: str) -> Path:
     safe_name = secure_filename(original_name)
     if not safe_name:
         safe_name = f"upload_{uuid.uuid4().hex}"
@@ -67,11 +70,83 @@ def save_uploaded_file(
     while target_path.exists():
         target_path = dest_dir / f"{stem}_{counter}{suffix}"
         counter += 1
+    return target_path
+
 
-    file_storage.save(target_path)
+def move_into_library(source: Path, *, destination_dir: Path | str, filename: str) -> Path:
+    """Rename a completed staging file into ``destination_dir`` under a unique name."""
+    dest_dir = Path(destination_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    target_path = _unique_target(dest_dir, filename or "uploaded_file")
+    os.replace(source, target_path)
     return target_path
 
 
+def store_upload_stream(
+    stream: BinaryIO,
+    *,
+    destination_dir: Path | str,
+    filename: str,
+) -> StoredUpload:
+    """Copy ``stream`` into the destination directory, hashing it on the way.
+
+    The data is written to a hidden ``.part`` file next to the target and
+    renamed into place once complete, so scanners never see partial files.
+    """
+    dest_dir = Path(destination_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    partial_path = dest_dir / f".{uuid.uuid4().hex}.part"
+
+    sha = hashlib.sha256()
+    size = 0
+    try:
+        with partial_path.open("wb", buffering=0) as output:
+            while True:
+                chunk = stream.read(UPLOAD_BUFFER_SIZE)
+                if not chunk:
+                    break
+                sha.update(chunk)
+                output.write(chunk)
+                size += len(chunk)
+        target_path = move_into_library(partial_path, destination_dir=dest_dir, filename=filename)
+    except BaseException:
+        try:
+            partial_path.unlink()
+        except OSError:
+            pass
+        raise
+
+    return StoredUpload(path=target_path, size=size, sha256=sha.hexdigest())
+
+
+def insert_uploaded_item(
+    cursor,
+    metadata: Dict[str, Any],
+    *,
+    status: str,
+    description: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Insert the ``media_items`` row for an uploaded file and return it."""
+    cursor.execute(
+        """
+        INSERT INTO media_items (title, description, media_type, source_path, status, metadata, duration_seconds)
+        VALUES (%s, %s, %s, %s, %s, %s::jsonb, %s)
+        RETURNING id, title, description, media_type, source_path, status,
+                  metadata, duration_seconds, created_at, updated_at
+        """,
+        (
+            metadata.get("title"),
+            description or metadata.get("description"),
+            metadata.get("mediaType"),
+            metadata.get("sourcePath"),
+            status,
+            json.dumps(metadata),
+            metadata.get("durationSeconds"),
+        ),
+    )
+    return cursor.fetchone()
+
+
 def delete_media_file_record(cursor, media_id: str) -> bool:
     """Delete a media record from the database."""
     cursor.execute("DELETE FROM media_items WHERE id = %s RETURNING id", (media_id,))
@@ -88,15 +163,21 @@ def generate_file_metadata(
     media_type: Optional[str] = None,
     mime_type: Optional[str] = None,
     original_filename: Optional[str] = None,
+    file_hash: Optional[str] = None,
 ) -> Dict[str, Any]:
-    """Create metadata payload for an uploaded file aligned with maintenance scanner output."""
+    """Create metadata payload for an uploaded file aligned with maintenance scanner output.
+
+    Pass ``file_hash`` when the SHA-256 is already known (e.g. computed while
+    the upload was written) to avoid reading the file again.
+    """
     path = Path(file_path)
     stat = path.stat()
     file_size = stat.st_size
     modified_iso = datetime.utcfromtimestamp(stat.st_mtime).isoformat() + "Z"
     scanned_at = datetime.utcnow().isoformat() + "Z"
 
-    file_hash = _compute_sha256(path)
+    if file_hash is None:
+        file_hash = _compute_sha256(path)
     signature_source = f"{file_size}:{int(stat.st_mtime)}:{path}"
     scanner_signature = hashlib.sha1(signature_source.encode("utf-8")).hexdigest()
 
@@ -144,7 +225,7 @@ def _detect_media_type(extension: str, fallback: Optional[str]) -> str:
 def _compute_sha256(path: Path) -> str:
     sha = hashlib.sha256()
     with path.open("rb") as stream:
-        for chunk in iter(lambda: stream.read(8192), b""):
+        for chunk in iter(lambda: stream.read(UPLOAD_BUFFER_SIZE), b""):
             sha.update(chunk)
     return sha.hexdigest()
 
@@ -9,9 +9,17 @@ from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
+from psycopg2.extras import execute_values
+
 from app.core.enhanced_scanner import EnhancedMediaScanner
+from app.services.background_jobs import submit_job
+from app.services.media_fingerprints import fingerprints_available, matching_sample
+from app.services.media_probe import preserved_probe_fields, run_probe_stage
+from app.services.smart_playlists import prune_changes as prune_smart_playlist_changes
+from app.services.subtitles import refresh_subtitles, subtitles_available
+from app.services.system_settings import get_setting, invalidate_settings, save_setting
 from config_loader import load_media_config, MediaCategory
-from postgres_config import get_db_connection
+from postgres_config import column_type, get_db_connection
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +29,16 @@ LOG_FILE = LOG_DIR / "media_deletions.log"
 STATUS_AVAILABLE = "available"
 STATUS_MISSING = "missing"
 
+# Probe embedded metadata for new/changed files after each committed scan.
+PROBE_ON_SCAN = os.getenv("PROBE_ON_SCAN", "true").lower() not in ("0", "false", "no")
+PROBE_MAX_PER_SCAN = int(os.getenv("PROBE_MAX_PER_SCAN", "2000"))
+
+# Re-index sidecar subtitles for the scanned categories after each committed scan.
+SUBTITLES_ON_SCAN = os.getenv("SUBTITLES_ON_SCAN", "true").lower() not in ("0", "false", "no")
+
+# Confirm inode-matched moves against the stored sample fingerprint, if any.
+MOVE_VERIFY_SAMPLE = os.getenv("MOVE_VERIFY_SAMPLE", "true").lower() not in ("0", "false", "no")
+
 
 class MediaMaintenanceError(RuntimeError):
     """Raised when the media maintenance scanner cannot complete."""
@@ -35,6 +53,7 @@ class CategoryResult:
     added: int = 0
     updated: int = 0
     unchanged: int = 0
+    moved: int = 0
     missing: int = 0
     missing_paths: List[str] = field(default_factory=list)
     errors: List[str] = field(default_factory=list)
@@ -52,6 +71,7 @@ class CategoryResult:
             "added": self.added,
             "updated": self.updated,
             "unchanged": self.unchanged,
+            "moved": self.moved,
             "missing": self.missing,
             "missing_paths": self.missing_paths,
             "errors": self.errors,
@@ -74,6 +94,22 @@ def run_media_maintenance_scan(
     if not category_models:
         raise MediaMaintenanceError("No categories matched the requested selection")
 
+    return scan_categories(
+        category_models,
+        dry_run=dry_run,
+        limit=limit,
+        config_version=config.version,
+    )
+
+
+def scan_categories(
+    category_models: Sequence[MediaCategory],
+    *,
+    dry_run: bool = False,
+    limit: Optional[int] = None,
+    config_version: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Scan the given categories and reconcile them with ``media_items``."""
     if limit is not None and limit <= 0:
         raise MediaMaintenanceError("limit must be a positive integer when provided")
 
@@ -84,6 +120,7 @@ def run_media_maintenance_scan(
         "added": 0,
         "updated": 0,
         "unchanged": 0,
+        "moved": 0,
         "missing": 0,
         "files_scanned": 0,
         "files_found": 0,
@@ -94,7 +131,7 @@ def run_media_maintenance_scan(
     summary: Dict[str, Any] = {
         "scanned_at": scanned_at,
         "dry_run": dry_run,
-        "config_version": config.version,
+        "config_version": config_version,
         "selected_categories": [cat.key for cat in category_models],
         "categories": {},
         "totals": totals,
@@ -118,6 +155,7 @@ def run_media_maintenance_scan(
             totals["added"] += category_result.added
             totals["updated"] += category_result.updated
             totals["unchanged"] += category_result.unchanged
+            totals["moved"] += category_result.moved
             totals["missing"] += category_result.missing
             totals["files_scanned"] += category_result.files_scanned
             totals["files_found"] += category_result.files_found
@@ -130,6 +168,7 @@ def run_media_maintenance_scan(
         else:
             _sync_media_settings(cursor, category_models)
             conn.commit()
+            invalidate_settings()
             totals["logged_missing"] = len(deletion_logs)
             if deletion_logs:
                 _write_deletion_log(deletion_logs)
@@ -141,6 +180,29 @@ def run_media_maintenance_scan(
         cursor.close()
         conn.close()
 
+    if PROBE_ON_SCAN and not dry_run:
+        # Probing can take minutes; the scan only queues it.
+        job = submit_job(
+            "Media metadata probe",
+            run_probe_stage,
+            categories=[cat.key for cat in category_models],
+            limit=PROBE_MAX_PER_SCAN,
+        )
+        summary["probe"] = {"job_id": job["id"], "status": job["status"]}
+
+    if not dry_run:
+        try:
+            summary["smart_playlist_changes_pruned"] = prune_smart_playlist_changes()
+        except Exception as exc:
+            logger.warning("Smart playlist change log pruning failed: %s", exc)
+
+    if SUBTITLES_ON_SCAN and not dry_run and subtitles_available():
+        try:
+            summary["subtitles"] = refresh_subtitles(categories=[cat.key for cat in category_models])
+        except Exception as exc:
+            logger.warning("Subtitle indexing failed: %s", exc)
+            summary["subtitles"] = {"error": str(exc)}
+
     return summary
 
 
@@ -190,6 +252,7 @@ def _scan_category(
     existing_records = _load_existing_records(cursor, category.key)
     processed_paths: set[str] = set()
     deletion_logs: List[Dict[str, Any]] = []
+    new_entries: List[Dict[str, Any]] = []
 
     for item in items:
         normalized_path = _normalise_path(item.file_path)
@@ -211,25 +274,12 @@ def _scan_category(
             scanned_at=scanned_at,
         )
         existing = existing_records.pop(normalized_path, None)
+        if existing is not None:
+            metadata.update(preserved_probe_fields(existing["metadata"], metadata["scannerSignature"]))
 
         if existing is None:
-            result.added += 1
-            if not dry_run:
-                cursor.execute(
-                    """
-                    INSERT INTO media_items (title, description, media_type, source_path, status, metadata, duration_seconds)
-                    VALUES (%s, %s, %s, %s, %s, %s::jsonb, %s)
-                    """,
-                    (
-                        metadata["title"],
-                        None,
-                        metadata["mediaType"],
-                        metadata["sourcePath"],
-                        STATUS_AVAILABLE,
-                        json.dumps(metadata),
-                        metadata.get("durationSeconds"),
-                    ),
-                )
+            # Inserted after the loop, once moved files have been matched.
+            new_entries.append(metadata)
             continue
 
         needs_update = _record_needs_update(existing, metadata)
@@ -274,6 +324,35 @@ def _scan_category(
                     ),
                 )
 
+    if new_entries and existing_records:
+        moves = _match_moved_files(new_entries, existing_records)
+        moved_entries = {id(metadata) for metadata, _ in moves}
+        new_entries = [metadata for metadata in new_entries if id(metadata) not in moved_entries]
+        for _, (path_key, _) in moves:
+            existing_records.pop(path_key)
+        result.moved = len(moves)
+        if moves and not dry_run:
+            _repoint_moved_items(cursor, moves)
+
+    for metadata in new_entries:
+        result.added += 1
+        if not dry_run:
+            cursor.execute(
+                """
+                INSERT INTO media_items (title, description, media_type, source_path, status, metadata, duration_seconds)
+                VALUES (%s, %s, %s, %s, %s, %s::jsonb, %s)
+                """,
+                (
+                    metadata["title"],
+                    None,
+                    metadata["mediaType"],
+                    metadata["sourcePath"],
+                    STATUS_AVAILABLE,
+                    json.dumps(metadata),
+                    metadata.get("durationSeconds"),
+                ),
+            )
+
     if existing_records:
         missing_paths = [_original_path(row) for row in existing_records.values()]
         result.missing = len(missing_paths)
@@ -323,9 +402,10 @@ def _select_categories(
 
 
 def _load_existing_records(cursor, category_key: str) -> Dict[str, Dict[str, Any]]:
+    fingerprint_column = ", fingerprint_sample" if fingerprints_available() else ""
     cursor.execute(
-        """
-        SELECT id, title, media_type, status, source_path, metadata, duration_seconds
+        f"""
+        SELECT id, title, media_type, status, source_path, metadata, duration_seconds{fingerprint_column}
         FROM media_items
         WHERE metadata->>'category' = %s
         """,
@@ -341,6 +421,130 @@ def _load_existing_records(cursor, category_key: str) -> Dict[str, Dict[str, Any
     return records
 
 
+def _file_identity(metadata: Dict[str, Any]) -> Optional[Tuple[Any, ...]]:
+    """(device, inode, size, mtime) recorded by the scanner, if complete."""
+    identity = (
+        metadata.get("fileDevice"),
+        metadata.get("fileInode"),
+        metadata.get("fileSize"),
+        metadata.get("mtimeNs"),
+    )
+    return identity if all(value is not None for value in identity) else None
+
+
+def _match_moved_files(
+    new_entries: Sequence[Dict[str, Any]],
+    unmatched_records: Dict[str, Dict[str, Any]],
+) -> List[Tuple[Dict[str, Any], Tuple[str, Dict[str, Any]]]]:
+    """Pair newly found files with records whose file disappeared.
+
+    A rename or move within a filesystem keeps the inode, so records are
+    first matched on (device, inode, size, mtime); a stored
+    ``fingerprint_sample`` must also agree when ``MOVE_VERIFY_SAMPLE`` is on,
+    guarding against inode reuse. Moves across filesystems fall back to the
+    size plus the stored sample, or a unique filename + mtime match.
+    """
+    by_identity: Dict[Tuple[Any, ...], Tuple[str, Dict[str, Any]]] = {}
+    by_size: Dict[int, List[Tuple[str, Dict[str, Any]]]] = {}
+    for path_key, row in unmatched_records.items():
+        if row.get("status") == "deleted" or os.path.exists(row.get("source_path") or ""):
+            continue
+        identity = _file_identity(row["metadata"])
+        if identity is not None:
+            by_identity[identity] = (path_key, row)
+        size = row["metadata"].get("fileSize")
+        if isinstance(size, int) and size > 0:
+            by_size.setdefault(size, []).append((path_key, row))
+
+    matches = []
+    used: set = set()
+    for metadata in new_entries:
+        identity = _file_identity(metadata)
+        candidate = by_identity.get(identity) if identity is not None else None
+        if candidate is not None and candidate[0] not in used:
+            path_key, row = candidate
+            verified = (
+                not MOVE_VERIFY_SAMPLE
+                or not row.get("fingerprint_sample")
+                or matching_sample(metadata["sourcePath"], metadata["fileSize"], [row]) is not None
+            )
+            if verified:
+                used.add(path_key)
+                matches.append((metadata, candidate))
+                continue
+
+        candidates = [
+            (path_key, row)
+            for path_key, row in by_size.get(metadata["fileSize"], [])
+            if path_key not in used
+        ]
+        if not candidates:
+            continue
+
+        rows = [row for _, row in candidates]
+        match = matching_sample(metadata["sourcePath"], metadata["fileSize"], rows)
+        if match is None:
+            same_file = [
+                row for row in rows
+                if row["metadata"].get("filename") == metadata["filename"]
+                and row["metadata"].get("lastModified") == metadata["lastModified"]
+            ]
+            match = same_file[0] if len(same_file) == 1 else None
+        if match is None:
+            continue
+
+        path_key = next(key for key, row in candidates if row is match)
+        used.add(path_key)
+        matches.append((metadata, (path_key, match)))
+    return matches
+
+
+def _repoint_moved_items(
+    cursor,
+    moves: Sequence[Tuple[Dict[str, Any], Tuple[str, Dict[str, Any]]]],
+) -> None:
+    """Point existing rows at their files' new paths in one batched UPDATE."""
+    values = []
+    for metadata, (_, row) in moves:
+        moved_metadata = {
+            key: value
+            for key, value in row["metadata"].items()
+            if key not in ("missing_since", "last_seen")
+        }
+        previous_signature = moved_metadata.get("scannerSignature")
+        moved_metadata.update(metadata)
+        moved_metadata["movedFrom"] = row["source_path"]
+        if previous_signature and moved_metadata.get("probeSignature") == previous_signature:
+            # Same bytes at a new path: the earlier probe still applies.
+            moved_metadata["probeSignature"] = metadata["scannerSignature"]
+        values.append((
+            row["id"],
+            metadata["title"],
+            metadata["mediaType"],
+            metadata["sourcePath"],
+            STATUS_AVAILABLE,
+            json.dumps(moved_metadata),
+        ))
+
+    execute_values(
+        cursor,
+        """
+        UPDATE media_items AS m
+        SET title = v.title,
+            media_type = v.media_type,
+            source_path = v.source_path,
+            status = v.status,
+            metadata = v.metadata::jsonb,
+            updated_at = NOW()
+        FROM (VALUES %s) AS v(id, title, media_type, source_path, status, metadata)
+        WHERE m.id = v.id
+        """,
+        values,
+        template=f"(%s::{column_type(cursor, 'media_items', 'id')}, %s, %s, %s, %s, %s)",
+        page_size=500,
+    )
+
+
 def _build_metadata(
     *,
     item,
@@ -368,6 +572,9 @@ def _build_metadata(
             "scannerSignature": scanner_signature,
             "scannedAt": scanned_at,
             "sourcePath": item.file_path,
+            "fileDevice": file_stat.st_dev,
+            "fileInode": file_stat.st_ino,
+            "mtimeNs": file_stat.st_mtime_ns,
         }
     )
     metadata.pop("media_type", None)
@@ -389,6 +596,9 @@ def _record_needs_update(existing: Dict[str, Any], metadata: Dict[str, Any]) ->
         return True
     if existing_meta.get("relativePath") != metadata.get("relativePath"):
         return True
+    # Records scanned before move detection lack the file identity.
+    if _file_identity(existing_meta) != _file_identity(metadata):
+        return True
     return False
 
 
@@ -416,26 +626,8 @@ def _original_path(row: Dict[str, Any]) -> str:
 
 
 def _sync_media_settings(cursor, categories: Sequence[MediaCategory]) -> None:
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS system_settings (
-            key TEXT PRIMARY KEY,
-            value JSONB NOT NULL,
-            updated_at TIMESTAMPTZ DEFAULT NOW()
-        )
-        """
-    )
-
-    cursor.execute("SELECT value FROM system_settings WHERE key = %s", ("database",))
-    row = cursor.fetchone()
-    if row and isinstance(row.get("value"), dict):
-        settings = row["value"]
-    elif row and isinstance(row.get("value"), str):
-        try:
-            settings = json.loads(row["value"])
-        except json.JSONDecodeError:
-            settings = {}
-    else:
+    settings = get_setting("database", {})
+    if not isinstance(settings, dict):
         settings = {}
 
     directories = settings.get("media_scan_directories") or {}
@@ -449,15 +641,7 @@ def _sync_media_settings(cursor, categories: Sequence[MediaCategory]) -> None:
     if "media_scan_root" not in settings and categories:
         settings["media_scan_root"] = categories[0].root_path
 
-    cursor.execute(
-        """
-        INSERT INTO system_settings (key, value, updated_at)
-        VALUES (%s, %s::jsonb, NOW())
-        ON CONFLICT (key)
-        DO UPDATE SET value = EXCLUDED.value, updated_at = NOW()
-        """,
-        ("database", json.dumps(settings)),
-    )
+    save_setting(cursor, "database", settings)
 
 
 def _write_deletion_log(entries: Iterable[Dict[str, Any]]) -> None:
@@ -0,0 +1,284 @@
+"""Embedded metadata extraction (duration, bitrate, codecs, tags).
+
+Audio files and MP4-family containers are read with ``mutagen``; other video
+containers use ``ffprobe`` when it is on ``PATH``. Probing runs in a thread
+pool: ffprobe is a subprocess and mutagen only reads container headers, so
+workers mostly wait on I/O, and the server never forks its threads.
+
+Results are stored in ``metadata.probe`` together with ``probeSignature``,
+the ``scannerSignature`` the file had when it was probed. A row is only
+probed again after the scanner reports a different signature. A probe that
+fails (timeout, I/O error, corrupt file) is recorded in ``probeError``
+instead and retried with exponential backoff, at most
+``PROBE_MAX_ATTEMPTS`` times per signature. The
+maintenance scan carries probe results over when it rewrites metadata for
+an unchanged file. ``duration_seconds`` is filled from the probe, which is
+what the analytics rollups sum.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+from psycopg2.extras import execute_values
+
+from postgres_config import column_type, get_db_connection
+
+try:
+    import mutagen
+except ImportError:  # pragma: no cover - optional dependency
+    mutagen = None
+
+logger = logging.getLogger(__name__)
+
+PROBE_WORKERS = int(os.getenv("PROBE_WORKERS", str(max((os.cpu_count() or 2) - 1, 1))))
+PROBE_BATCH_SIZE = int(os.getenv("PROBE_BATCH_SIZE", "200"))
+PROBE_TIMEOUT_SECONDS = float(os.getenv("PROBE_TIMEOUT_SECONDS", "60"))
+FFPROBE_PATH = shutil.which(os.getenv("FFPROBE_PATH", "ffprobe"))
+PROBE_MAX_ATTEMPTS = int(os.getenv("PROBE_MAX_ATTEMPTS", "5"))
+PROBE_RETRY_BASE_SECONDS = float(os.getenv("PROBE_RETRY_BASE_SECONDS", "3600"))
+
+_MUTAGEN_TAGS = ("title", "artist", "album", "albumartist", "genre", "date", "tracknumber", "discnumber")
+_MUTAGEN_VIDEO_EXTENSIONS = {".mp4", ".m4v", ".mov"}
+_FFPROBE_EXTENSIONS = {".mkv", ".avi", ".wmv", ".flv", ".webm", ".mpg", ".mpeg", ".ts", ".m2ts"}
+
+# Probe results the maintenance scan preserves for files whose signature is unchanged.
+PRESERVED_KEYS = ("probe", "probeSignature", "durationSeconds")
+
+
+def _number_pair(value: Any) -> tuple:
+    """``'3/12'`` -> ``(3, 12)``; missing parts are ``None``."""
+    if value in (None, ""):
+        return None, None
+    number, _, total = str(value).partition("/")
+    try:
+        first = int(number)
+    except ValueError:
+        first = None
+    try:
+        second = int(total) if total else None
+    except ValueError:
+        second = None
+    return first, second
+
+
+def _probe_mutagen(path: str) -> Optional[Dict[str, Any]]:
+    if mutagen is None:
+        return None
+    media = mutagen.File(path, easy=True)
+    if media is None:
+        return None
+    info = media.info
+    result: Dict[str, Any] = {
+        "source": "mutagen",
+        "duration": round(float(getattr(info, "length", 0) or 0), 3) or None,
+        "bitrate": getattr(info, "bitrate", None) or None,
+        "sample_rate": getattr(info, "sample_rate", None),
+        "channels": getattr(info, "channels", None),
+        "codec": getattr(info, "codec", None) or getattr(info, "codec_description", None),
+        "container": type(media).__name__,
+    }
+    tags: Dict[str, Any] = {}
+    source_tags = media.tags if media.tags is not None else {}
+    for key in _MUTAGEN_TAGS:
+        values = source_tags.get(key)
+        if values:
+            tags[key] = values[0] if isinstance(values, list) else values
+    track, track_total = _number_pair(tags.pop("tracknumber", None))
+    disc, disc_total = _number_pair(tags.pop("discnumber", None))
+    result.update({
+        "tags": tags,
+        "track_number": track,
+        "track_total": track_total,
+        "disc_number": disc,
+        "disc_total": disc_total,
+    })
+    return result
+
+
+def _probe_ffprobe(path: str) -> Optional[Dict[str, Any]]:
+    if FFPROBE_PATH is None:
+        return None
+    completed = subprocess.run(
+        [FFPROBE_PATH, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path],
+        capture_output=True,
+        timeout=PROBE_TIMEOUT_SECONDS,
+        check=True,
+    )
+    data = json.loads(completed.stdout or b"{}")
+    fmt = data.get("format") or {}
+    streams = data.get("streams") or []
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), {})
+    tags = {key.lower(): value for key, value in (fmt.get("tags") or {}).items()}
+
+    def _float(value: Any) -> Optional[float]:
+        try:
+            return round(float(value), 3)
+        except (TypeError, ValueError):
+            return None
+
+    return {
+        "source": "ffprobe",
+        "duration": _float(fmt.get("duration")),
+        "bitrate": int(fmt["bit_rate"]) if str(fmt.get("bit_rate", "")).isdigit() else None,
+        "container": fmt.get("format_name"),
+        "codec": video.get("codec_name") or audio.get("codec_name"),
+        "video_codec": video.get("codec_name"),
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "audio_codec": audio.get("codec_name"),
+        "sample_rate": int(audio["sample_rate"]) if str(audio.get("sample_rate", "")).isdigit() else None,
+        "channels": audio.get("channels"),
+        "tags": {key: tags[key] for key in ("title", "artist", "album", "genre", "date") if key in tags},
+    }
+
+
+def probe_file(path: str) -> Dict[str, Any]:
+    """Extract embedded metadata from ``path``; runs on a pool thread."""
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        result = None
+        if extension in _FFPROBE_EXTENSIONS:
+            result = _probe_ffprobe(path)
+        elif extension not in _MUTAGEN_VIDEO_EXTENSIONS or FFPROBE_PATH is None:
+            result = _probe_mutagen(path)
+        else:
+            result = _probe_mutagen(path) or _probe_ffprobe(path)
+        return result or {"source": None, "error": "unsupported"}
+    except Exception as exc:  # a corrupt file must not fail the batch
+        return {"source": None, "error": f"{type(exc).__name__}: {exc}"[:200]}
+
+
+def preserved_probe_fields(existing_metadata: Dict[str, Any], scanner_signature: Optional[str]) -> Dict[str, Any]:
+    """Probe results (or the retry state of a failed probe) still valid for ``scanner_signature``."""
+    if not scanner_signature:
+        return {}
+    preserved: Dict[str, Any] = {}
+    if existing_metadata.get("probeSignature") == scanner_signature:
+        preserved = {key: existing_metadata[key] for key in PRESERVED_KEYS if key in existing_metadata}
+    error = existing_metadata.get("probeError")
+    if isinstance(error, dict) and error.get("signature") == scanner_signature:
+        preserved["probeError"] = error
+    return preserved
+
+
+def _pending_rows(cursor, categories: Optional[Sequence[str]], limit: Optional[int]) -> List[Dict[str, Any]]:
+    category_filter = ""
+    params: List[Any] = []
+    if categories:
+        category_filter = "AND metadata->>'category' = ANY(%s)"
+        params.append(list(categories))
+    cursor.execute(
+        f"""
+        SELECT id, source_path, metadata->>'scannerSignature' AS signature,
+               metadata->'probeError' AS probe_error
+        FROM media_items
+        WHERE status = 'available'
+          AND metadata->>'scannerSignature' IS NOT NULL
+          AND metadata->>'probeSignature' IS DISTINCT FROM metadata->>'scannerSignature'
+          AND NOT (
+              metadata->'probeError'->>'signature' IS NOT DISTINCT FROM metadata->>'scannerSignature'
+              AND (
+                  (metadata->'probeError'->>'attempts')::int >= %s
+                  OR (metadata->'probeError'->>'retryAt')::timestamptz > NOW()
+              )
+          )
+          {category_filter}
+        ORDER BY id
+        LIMIT %s
+        """,
+        [PROBE_MAX_ATTEMPTS] + params + [limit],
+    )
+    return cursor.fetchall() or []
+
+
+def _probe_patch(probe: Dict[str, Any], row: Dict[str, Any]) -> Dict[str, Any]:
+    """Metadata patch for a probe result; failures only record their retry state."""
+    signature = row["signature"]
+    if probe.get("error") and probe["error"] != "unsupported":
+        previous = row.get("probe_error")
+        attempts = 1
+        if isinstance(previous, dict) and previous.get("signature") == signature:
+            attempts = int(previous.get("attempts") or 0) + 1
+        retry_at = datetime.now(timezone.utc) + timedelta(seconds=PROBE_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+        return {"probeError": {
+            "signature": signature,
+            "error": probe["error"],
+            "attempts": attempts,
+            "retryAt": retry_at.isoformat(),
+        }}
+    patch: Dict[str, Any] = {"probe": probe, "probeSignature": signature, "probeError": None}
+    if probe.get("duration"):
+        patch["durationSeconds"] = probe["duration"]
+    return patch
+
+
+def _write_batch(cursor, batch: List[tuple]) -> None:
+    """Merge probe results into metadata, skipping rows whose file changed meanwhile.
+
+    Tagged artist/album are copied to the top level only where the scanner did
+    not already derive them from the folder layout; the search index reads them.
+    """
+    execute_values(
+        cursor,
+        """
+        UPDATE media_items AS m
+        SET metadata = m.metadata || v.patch::jsonb
+                || jsonb_strip_nulls(jsonb_build_object(
+                       'artist', COALESCE(m.metadata->>'artist', v.patch::jsonb->'probe'->'tags'->>'artist'),
+                       'album', COALESCE(m.metadata->>'album', v.patch::jsonb->'probe'->'tags'->>'album'))),
+            duration_seconds = COALESCE(v.duration::numeric, m.duration_seconds),
+            updated_at = NOW()
+        FROM (VALUES %s) AS v(id, signature, patch, duration)
+        WHERE m.id = v.id
+          AND m.metadata->>'scannerSignature' = v.signature
+        """,
+        batch,
+        template=f"(%s::{column_type(cursor, 'media_items', 'id')}, %s, %s, %s)",
+        page_size=len(batch),
+    )
+
+
+def run_probe_stage(
+    *,
+    categories: Optional[Sequence[str]] = None,
+    limit: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Probe every available item whose signature changed since its last probe."""
+    summary = {"pending": 0, "probed": 0, "with_duration": 0, "unsupported": 0, "errors": 0}
+    with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+        rows = _pending_rows(cursor, categories, limit)
+        summary["pending"] = len(rows)
+        if not rows:
+            return summary
+
+        batch: List[tuple] = []
+        with ThreadPoolExecutor(max_workers=max(PROBE_WORKERS, 1), thread_name_prefix="watch2-probe") as pool:
+            paths = [row["source_path"] for row in rows]
+            for row, probe in zip(rows, pool.map(probe_file, paths)):
+                if probe.get("error") == "unsupported":
+                    summary["unsupported"] += 1
+                elif probe.get("error"):
+                    summary["errors"] += 1
+                else:
+                    summary["probed"] += 1
+                    if probe.get("duration"):
+                        summary["with_duration"] += 1
+                patch = _probe_patch(probe, row)
+                batch.append((row["id"], row["signature"], json.dumps(patch), patch.get("durationSeconds")))
+                if len(batch) >= PROBE_BATCH_SIZE:
+                    _write_batch(cursor, batch)
+                    conn.commit()
+                    batch = []
+        if batch:
+            _write_batch(cursor, batch)
+            conn.commit()
+    return summary
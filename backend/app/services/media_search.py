@@ -0,0 +1,159 @@
+"""Ranked search and autocomplete over ``media_items``.
+
+Migration 006 maintains ``search_vector`` (weighted tsvector: title, then
+series/artist/album, then filenames/season, then description) and
+``search_document`` (lower-cased plain text with a trigram index) for every
+row. Searches match either a prefix tsquery built from the user's words or a
+trigram-accelerated substring of the document, and rank by ``ts_rank_cd``
+plus trigram similarity. When the columns are missing the old ``ILIKE``
+filter is used instead; that check runs once per process.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import threading
+from contextlib import closing
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from postgres_config import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+TS_CONFIG = "simple"
+MAX_QUERY_TERMS = 8
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_schema_lock = threading.Lock()
+_search_available: Optional[bool] = None
+
+
+@dataclass
+class SearchClause:
+    """SQL fragments for filtering and ranking ``media_items`` by a search term."""
+
+    where: str
+    params: List[Any] = field(default_factory=list)
+    rank: Optional[str] = None
+    rank_params: List[Any] = field(default_factory=list)
+
+
+def search_index_available(force: bool = False) -> bool:
+    global _search_available
+    with _schema_lock:
+        if _search_available is not None and not force:
+            return _search_available
+        try:
+            with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+                cursor.execute(
+                    """
+                    SELECT COUNT(*) AS columns
+                    FROM information_schema.columns
+                    WHERE table_schema = 'public'
+                      AND table_name = 'media_items'
+                      AND column_name IN ('search_document', 'search_vector')
+                    """
+                )
+                row = cursor.fetchone()
+            _search_available = bool(row and row["columns"] == 2)
+        except Exception as exc:
+            logger.warning("Media search index discovery failed: %s", exc)
+            return False
+        if not _search_available:
+            logger.info("Media search columns missing; falling back to ILIKE search")
+        return _search_available
+
+
+def prefix_tsquery(term: str) -> Optional[str]:
+    """``'star wa'`` -> ``'star:* & wa:*'``; ``None`` if no searchable words."""
+    tokens = _TOKEN_RE.findall(term.lower())[:MAX_QUERY_TERMS]
+    if not tokens:
+        return None
+    return " & ".join(f"{token}:*" for token in tokens)
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def build_search_clause(term: str) -> SearchClause:
+    term = term.strip()
+    like_term = f"%{_escape_like(term.lower())}%"
+
+    if not search_index_available():
+        like_term = f"%{term}%"
+        return SearchClause(
+            where=(
+                "(title ILIKE %s OR description ILIKE %s OR "
+                "metadata->>'filename' ILIKE %s OR metadata->>'originalFilename' ILIKE %s)"
+            ),
+            params=[like_term] * 4,
+        )
+
+    tsquery = prefix_tsquery(term)
+    if tsquery is None:
+        return SearchClause(
+            where="search_document LIKE %s",
+            params=[like_term],
+            rank="similarity(search_document, %s)",
+            rank_params=[term.lower()],
+        )
+    return SearchClause(
+        where=f"(search_vector @@ to_tsquery('{TS_CONFIG}', %s) OR search_document LIKE %s)",
+        params=[tsquery, like_term],
+        rank=(
+            f"ts_rank_cd(search_vector, to_tsquery('{TS_CONFIG}', %s)) "
+            "+ similarity(search_document, %s)"
+        ),
+        rank_params=[tsquery, term.lower()],
+    )
+
+
+def suggest(cursor, prefix: str, *, limit: int = 10, media_type: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Autocomplete candidates whose words start with the typed prefix."""
+    tsquery = prefix_tsquery(prefix)
+    if tsquery is None:
+        return []
+
+    filters = []
+    params: List[Any] = []
+    if search_index_available():
+        filters.append(f"search_vector @@ to_tsquery('{TS_CONFIG}', %s)")
+        params.append(tsquery)
+        rank = f"ts_rank_cd(search_vector, to_tsquery('{TS_CONFIG}', %s))"
+        rank_params: List[Any] = [tsquery]
+    else:
+        filters.append("title ILIKE %s")
+        params.append(f"%{prefix.strip()}%")
+        rank = "0"
+        rank_params = []
+    filters.append("status IS DISTINCT FROM 'deleted'")
+    if media_type:
+        filters.append("media_type = %s")
+        params.append(media_type)
+
+    cursor.execute(
+        f"""
+        SELECT id, title, media_type,
+               metadata->>'series' AS series,
+               metadata->>'artist' AS artist,
+               metadata->>'album' AS album
+        FROM media_items
+        WHERE {' AND '.join(filters)}
+        ORDER BY {rank} DESC, length(title), title
+        LIMIT %s
+        """,
+        params + rank_params + [max(1, min(int(limit), 50))],
+    )
+    suggestions = []
+    for row in cursor.fetchall() or []:
+        suggestions.append({
+            "id": str(row["id"]),
+            "title": row["title"],
+            "media_type": row["media_type"],
+            "series": row.get("series"),
+            "artist": row.get("artist"),
+            "album": row.get("album"),
+        })
+    return suggestions
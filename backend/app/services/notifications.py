@@ -0,0 +1,130 @@
+"""Cross-worker cache invalidation over Postgres ``LISTEN/NOTIFY``.
+
+A single daemon thread per process holds a dedicated autocommit connection,
+``LISTEN``s on every subscribed channel and dispatches payloads to the
+registered callbacks. Writers call :func:`notify` on their own cursor so the
+notification is only delivered once their transaction commits.
+
+Callbacks receive ``None`` instead of a payload after the listener
+(re)connects, since notifications sent while it was disconnected are lost;
+subscribers should treat that as "drop everything".
+"""
+from __future__ import annotations
+
+import logging
+import os
+import select
+import threading
+from collections import defaultdict
+from typing import Callable, DefaultDict, List, Optional
+
+from psycopg2 import sql
+
+from postgres_config import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+POLL_TIMEOUT_SECONDS = 5.0
+RECONNECT_DELAY_SECONDS = float(os.getenv("NOTIFY_RECONNECT_DELAY", "5"))
+
+Callback = Callable[[Optional[str]], None]
+
+_subscribers: DefaultDict[str, List[Callback]] = defaultdict(list)
+_lock = threading.Lock()
+_listener: Optional["_Listener"] = None
+
+
+class _Listener(threading.Thread):
+    def __init__(self):
+        super().__init__(name="watch2-pg-listener", daemon=True)
+        self.pid = os.getpid()
+        self.connected = threading.Event()
+        self._listening: set = set()
+        self._stopping = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopping.is_set():
+            conn = None
+            try:
+                conn = get_db_connection()
+                conn.autocommit = True
+                self._listening = set()
+                self._sync_channels(conn)
+                self.connected.set()
+                _dispatch_all(None)
+                while not self._stopping.is_set():
+                    self._sync_channels(conn)
+                    if select.select([conn], [], [], POLL_TIMEOUT_SECONDS) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        note = conn.notifies.pop(0)
+                        _dispatch(note.channel, note.payload)
+            except Exception as exc:
+                logger.warning("Postgres listener disconnected: %s", exc)
+            finally:
+                self.connected.clear()
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._stopping.wait(RECONNECT_DELAY_SECONDS)
+
+    def _sync_channels(self, conn) -> None:
+        with _lock:
+            pending = [channel for channel in _subscribers if channel not in self._listening]
+        if not pending:
+            return
+        with conn.cursor() as cursor:
+            for channel in pending:
+                cursor.execute(sql.SQL("LISTEN {}").format(sql.Identifier(channel)))
+                self._listening.add(channel)
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+
+def _dispatch(channel: str, payload: Optional[str]) -> None:
+    with _lock:
+        callbacks = list(_subscribers.get(channel, ()))
+    for callback in callbacks:
+        try:
+            callback(payload)
+        except Exception as exc:
+            logger.warning("Notification callback for %s failed: %s", channel, exc)
+
+
+def _dispatch_all(payload: Optional[str]) -> None:
+    with _lock:
+        channels = list(_subscribers)
+    for channel in channels:
+        _dispatch(channel, payload)
+
+
+def ensure_listener() -> None:
+    """Start the listener thread for this process if it is not running."""
+    global _listener
+    with _lock:
+        if _listener is not None and _listener.is_alive() and _listener.pid == os.getpid():
+            return
+        _listener = _Listener()
+        _listener.start()
+
+
+def subscribe(channel: str, callback: Callback) -> None:
+    """Call ``callback(payload)`` for every notification on ``channel``."""
+    with _lock:
+        _subscribers[channel].append(callback)
+    ensure_listener()
+
+
+def is_listening() -> bool:
+    """True when invalidations are currently being received."""
+    listener = _listener
+    return bool(listener and listener.is_alive() and listener.connected.is_set())
+
+
+def notify(cursor, channel: str, payload: str = "") -> None:
+    """Queue a notification on ``cursor``'s transaction (sent on commit)."""
+    cursor.execute("SELECT pg_notify(%s, %s)", (channel, payload))
@@ -0,0 +1,188 @@
+"""Read cache for the playlist endpoints.
+
+Two read models are cached: the playlist summaries of one owner
+(``GET /playlists``) and the full payload of one playlist with its items
+(``GET /playlists/<id>``). Entries are stored under generation-stamped keys
+and mutations bump the generation after they commit. A reader that loaded
+before the commit therefore stores an entry that is never looked up again.
+
+By default the cache is in-process: a bounded LRU of ``PLAYLIST_CACHE_SIZE``
+entries. Other workers learn about mutations from ``watch2_playlists``
+notifications, and the cache is bypassed while the listener is
+disconnected. When ``REDIS_URL`` is set and the ``redis`` package is
+installed, entries and generations live in Redis and every worker shares
+them.
+
+For smart playlists only the playlist itself is cached. Their items depend on
+the catalog and on the viewer, so they are read per request from the
+materialized membership (see ``app/services/smart_playlists.py``).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+from app.core.cache import TTLCache
+from app.services import notifications
+
+try:  # Optional dependency
+    import redis
+except ImportError:  # pragma: no cover - redis is optional
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+PLAYLIST_CHANNEL = "watch2_playlists"
+CACHE_BACKEND = os.getenv("PLAYLIST_CACHE_BACKEND", "auto").lower()
+CACHE_SIZE = int(os.getenv("PLAYLIST_CACHE_SIZE", "2048"))
+CACHE_TTL_SECONDS = float(os.getenv("PLAYLIST_CACHE_TTL", "300"))
+
+
+def owner_scope(owner_id: Any) -> str:
+    return f"owner:{owner_id}"
+
+
+def playlist_scope(playlist_id: Any) -> str:
+    return f"playlist:{playlist_id}"
+
+
+class LocalPlaylistCache:
+    """Per-worker cache kept coherent through ``LISTEN/NOTIFY``."""
+
+    backend = "memory"
+
+    def __init__(self):
+        self._entries = TTLCache(maxsize=CACHE_SIZE, ttl=CACHE_TTL_SECONDS)
+        self._generations: Dict[str, int] = {}
+        # Bumped when the listener reconnects: every earlier key is dropped.
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self._subscribed = False
+        self.bypassed = 0
+
+    def _ensure_subscribed(self) -> None:
+        if not self._subscribed:
+            self._subscribed = True
+            notifications.subscribe(PLAYLIST_CHANNEL, self._on_notify)
+
+    def _on_notify(self, payload: Optional[str]) -> None:
+        if payload is None:
+            with self._lock:
+                self._epoch += 1
+            self._entries.clear()
+            return
+        self._bump(payload.split(","))
+
+    def _bump(self, scopes: Iterable[str]) -> None:
+        with self._lock:
+            for scope in scopes:
+                self._generations[scope] = self._generations.get(scope, 0) + 1
+
+    def _key(self, scope: str) -> Hashable:
+        with self._lock:
+            return (scope, self._epoch, self._generations.get(scope, 0))
+
+    def get_or_load(self, scope: str, loader: Callable[[], Any]) -> Any:
+        self._ensure_subscribed()
+        if not notifications.is_listening():
+            self.bypassed += 1
+            return loader()
+        return self._entries.get_or_load(self._key(scope), loader)
+
+    def invalidate(self, conn, cursor, scopes: Iterable[str]) -> None:
+        """Drop ``scopes`` here and, via a notification, in other workers.
+
+        Called after the mutation committed; the notification is sent in a
+        follow-up transaction on the same connection.
+        """
+        scopes = list(scopes)
+        self._bump(scopes)
+        notifications.notify(cursor, PLAYLIST_CHANNEL, ",".join(scopes))
+        conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            **self._entries.stats(),
+            "bypassed": self.bypassed,
+            "listening": notifications.is_listening(),
+        }
+
+
+class RedisPlaylistCache:
+    """Cache shared by all workers; generations are Redis counters."""
+
+    backend = "redis"
+    PREFIX = "watch2:playlists"
+
+    def __init__(self, client):
+        self.client = client
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _generation_key(self, scope: str) -> str:
+        return f"{self.PREFIX}:generation:{scope}"
+
+    def get_or_load(self, scope: str, loader: Callable[[], Any]) -> Any:
+        try:
+            generation = int(self.client.get(self._generation_key(scope)) or 0)
+            key = f"{self.PREFIX}:{scope}:{generation}"
+            cached = self.client.get(key)
+        except Exception as exc:
+            self.errors += 1
+            logger.warning("Playlist cache read failed: %s", exc)
+            return loader()
+        if cached is not None:
+            self.hits += 1
+            return json.loads(cached)
+
+        self.misses += 1
+        value = loader()
+        if value is not None:
+            try:
+                self.client.set(key, json.dumps(value, default=str), ex=max(int(CACHE_TTL_SECONDS), 1))
+            except Exception as exc:
+                self.errors += 1
+                logger.warning("Playlist cache write failed: %s", exc)
+        return value
+
+    def invalidate(self, conn, cursor, scopes: Iterable[str]) -> None:
+        """Bump the shared generations of ``scopes`` (after the mutation committed)."""
+        try:
+            pipe = self.client.pipeline()
+            for scope in scopes:
+                pipe.incr(self._generation_key(scope))
+            pipe.execute()
+        except Exception as exc:
+            # Stale entries then live until PLAYLIST_CACHE_TTL at most.
+            self.errors += 1
+            logger.warning("Playlist cache invalidation failed: %s", exc)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "ttl_seconds": CACHE_TTL_SECONDS,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+        }
+
+
+def _create_cache():
+    redis_url = os.getenv("REDIS_URL")
+    if CACHE_BACKEND != "memory" and redis is not None and redis_url:
+        try:
+            client = redis.Redis.from_url(redis_url, socket_timeout=2)
+            client.ping()
+            logger.info("Playlist cache using Redis at %s", redis_url)
+            return RedisPlaylistCache(client)
+        except Exception as exc:
+            logger.warning("Redis unavailable for playlist cache, using memory: %s", exc)
+    return LocalPlaylistCache()
+
+
+playlist_cache = _create_cache()
@@ -0,0 +1,156 @@
+"""Gap-based ordering for ``playlist_items``.
+
+Positions are spaced ``POSITION_GAP`` apart (migration 012), so appending
+takes the tail position plus a gap and moving items rewrites only the moved
+rows: they get positions spread between their new neighbours. The playlist is
+renumbered (``respace``) only when a gap runs out, again in one statement.
+
+Callers lock the playlist row (``SELECT ... FOR UPDATE``) before using these
+helpers, so concurrent appends to the same playlist cannot pick the same
+position.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence
+
+from psycopg2.extras import execute_values
+
+POSITION_GAP = 1024
+# Largest id list accepted per call; after a respace any gap fits a full batch.
+MAX_BATCH = 1000
+# playlist_items.position is an INTEGER column.
+_MAX_POSITION = 2**31 - 1
+
+
+def respace(cursor, playlist_id) -> None:
+    """Renumber a playlist to ``POSITION_GAP`` multiples, keeping its order."""
+    cursor.execute(
+        """
+        UPDATE playlist_items pi
+        SET position = ranked.rank * %s
+        FROM (
+            SELECT id, row_number() OVER (ORDER BY position, id) AS rank
+            FROM playlist_items
+            WHERE playlist_id = %s
+        ) AS ranked
+        WHERE pi.id = ranked.id AND pi.position IS DISTINCT FROM ranked.rank * %s
+        """,
+        (POSITION_GAP, playlist_id, POSITION_GAP),
+    )
+
+
+def _tail_position(cursor, playlist_id) -> int:
+    cursor.execute(
+        "SELECT COALESCE(MAX(position), 0) AS tail FROM playlist_items WHERE playlist_id = %s",
+        (playlist_id,),
+    )
+    return cursor.fetchone()["tail"]
+
+
+def append_items(cursor, playlist_id, media_ids: Sequence[int]) -> List[Dict[str, Any]]:
+    """Append media in the given order, skipping unknown, deleted and present ids.
+
+    All rows are written by one ``INSERT``; returns the inserted rows
+    (``id``, ``media_id``, ``position``, ``added_at``) in playlist order.
+    """
+    if not media_ids:
+        return []
+    tail = _tail_position(cursor, playlist_id)
+    if tail + (len(media_ids) + 1) * POSITION_GAP > _MAX_POSITION:
+        respace(cursor, playlist_id)
+        tail = _tail_position(cursor, playlist_id)
+
+    cursor.execute(
+        """
+        WITH wanted AS (
+            SELECT media_id, MIN(ord) AS ord
+            FROM unnest(%s::integer[]) WITH ORDINALITY AS w(media_id, ord)
+            GROUP BY media_id
+        ), fresh AS (
+            SELECT m.id AS media_id, row_number() OVER (ORDER BY w.ord) AS rank
+            FROM wanted w
+            JOIN media_files m ON m.id = w.media_id AND m.is_deleted = FALSE
+            WHERE NOT EXISTS (
+                SELECT 1 FROM playlist_items pi
+                WHERE pi.playlist_id = %s AND pi.media_id = m.id
+            )
+        )
+        INSERT INTO playlist_items (playlist_id, media_id, position)
+        SELECT %s, media_id, %s + rank * %s
+        FROM fresh
+        RETURNING id, media_id, position, added_at
+        """,
+        (list(media_ids), playlist_id, playlist_id, tail, POSITION_GAP),
+    )
+    return sorted(cursor.fetchall(), key=lambda row: row["position"])
+
+
+def remove_items(cursor, playlist_id, media_ids: Sequence[int]) -> List[int]:
+    """Delete the given media from a playlist; returns the removed media ids."""
+    if not media_ids:
+        return []
+    cursor.execute(
+        "DELETE FROM playlist_items WHERE playlist_id = %s AND media_id = ANY(%s) RETURNING media_id",
+        (playlist_id, list(media_ids)),
+    )
+    return [row["media_id"] for row in cursor.fetchall()]
+
+
+def _neighbours(cursor, playlist_id, media_ids: List[int], after: Optional[int]) -> Dict[str, Any]:
+    cursor.execute(
+        """
+        WITH anchor AS (
+            SELECT position FROM playlist_items
+            WHERE playlist_id = %(playlist_id)s AND media_id = %(after)s
+        )
+        SELECT
+            (SELECT position FROM anchor) AS lower,
+            (SELECT MIN(position) FROM playlist_items
+             WHERE playlist_id = %(playlist_id)s
+               AND NOT (media_id = ANY(%(media_ids)s))
+               AND (%(after)s IS NULL OR position > (SELECT position FROM anchor))) AS upper,
+            (SELECT COUNT(DISTINCT media_id) FROM playlist_items
+             WHERE playlist_id = %(playlist_id)s AND media_id = ANY(%(media_ids)s)) AS found
+        """,
+        {"playlist_id": playlist_id, "media_ids": media_ids, "after": after},
+    )
+    return cursor.fetchone()
+
+
+def move_items(cursor, playlist_id, media_ids: Sequence[int], after: Optional[int] = None) -> Optional[List[Dict[str, int]]]:
+    """Place ``media_ids`` (in that order) directly after ``after``, or first.
+
+    Only the moved rows are written, in one ``UPDATE``. Returns their new
+    positions, or ``None`` when a moved item or the anchor is not in the
+    playlist.
+    """
+    media_ids = list(dict.fromkeys(media_ids))
+    if not media_ids:
+        return []
+
+    for _ in range(2):
+        bounds = _neighbours(cursor, playlist_id, media_ids, after)
+        if bounds["found"] != len(media_ids) or (after is not None and bounds["lower"] is None):
+            return None
+        lower = bounds["lower"] if after is not None else 0
+        upper = bounds["upper"] if bounds["upper"] is not None else lower + (len(media_ids) + 1) * POSITION_GAP
+        if upper - lower > len(media_ids) and upper <= _MAX_POSITION:
+            break
+        # No room between the neighbours: renumber once (every gap then fits
+        # MAX_BATCH items) and recompute.
+        respace(cursor, playlist_id)
+
+    step = (upper - lower) // (len(media_ids) + 1)
+    moves = [(media_id, lower + step * offset) for offset, media_id in enumerate(media_ids, start=1)]
+    execute_values(
+        cursor,
+        """
+        UPDATE playlist_items pi
+        SET position = moved.position
+        FROM (VALUES %s) AS moved(playlist_id, media_id, position)
+        WHERE pi.playlist_id = moved.playlist_id AND pi.media_id = moved.media_id
+        """,
+        [(playlist_id, media_id, position) for media_id, position in moves],
+        template="(%s::integer, %s::integer, %s::integer)",
+    )
+    return [{"media_id": media_id, "position": position} for media_id, position in moves]
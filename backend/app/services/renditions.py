@@ -0,0 +1,86 @@
+"""``transcoded_files`` bookkeeping shared by the HLS packager and the transcoder.
+
+A rendition row is keyed on (``media_item_id``, ``format``, ``quality``)
+(migration 010) and records the ``scannerSignature`` it was built from, so a
+changed source makes it stale without any explicit invalidation.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+# processing_progress is written in steps of at least this many percent.
+PROGRESS_STEP = 5
+
+
+def claim_rendition(cursor, media_id: str, fmt: str, quality: str, file_path: str, signature: Optional[str]) -> int:
+    """Create or reset the row for a rendition about to be built; returns its id."""
+    cursor.execute(
+        """
+        INSERT INTO transcoded_files (
+            media_item_id, file_path, quality, format, source_signature,
+            is_ready, processing_progress, error, created_at, completed_at
+        )
+        VALUES (%s, %s, %s, %s, %s, FALSE, 0, NULL, NOW(), NULL)
+        ON CONFLICT (media_item_id, format, quality) WHERE media_item_id IS NOT NULL
+        DO UPDATE SET file_path = EXCLUDED.file_path,
+                      source_signature = EXCLUDED.source_signature,
+                      is_ready = FALSE, processing_progress = 0, error = NULL,
+                      completed_at = NULL
+        RETURNING id
+        """,
+        (media_id, file_path, quality, fmt, signature),
+    )
+    return cursor.fetchone()["id"]
+
+
+def load_rendition(cursor, media_id: str, fmt: str, quality: str) -> Optional[Dict[str, Any]]:
+    cursor.execute(
+        """
+        SELECT id, file_path, source_signature, is_ready, processing_progress, error
+        FROM transcoded_files
+        WHERE media_item_id = %s AND format = %s AND quality = %s
+        """,
+        (media_id, fmt, quality),
+    )
+    return cursor.fetchone()
+
+
+class ProgressWriter:
+    """Writes ``processing_progress`` for one row, throttled to ``PROGRESS_STEP``."""
+
+    def __init__(self, conn, cursor, row_id: int):
+        self._conn = conn
+        self._cursor = cursor
+        self._row_id = row_id
+        self._reported = 0
+
+    def __call__(self, percent: int) -> None:
+        if percent < self._reported + PROGRESS_STEP:
+            return
+        self._reported = percent
+        self._cursor.execute(
+            "UPDATE transcoded_files SET processing_progress = %s WHERE id = %s",
+            (percent, self._row_id),
+        )
+        self._conn.commit()
+
+
+def fail_rendition(cursor, row_id: int, message: str) -> None:
+    cursor.execute(
+        "UPDATE transcoded_files SET error = %s, processing_progress = 0 WHERE id = %s",
+        (message[:500], row_id),
+    )
+
+
+def finish_rendition(cursor, row_id: int, **fields: Any) -> None:
+    """Mark a rendition ready; ``fields`` are extra columns (file_size, duration, ...)."""
+    assignments = "".join(f", {column} = %s" for column in fields)
+    cursor.execute(
+        f"""
+        UPDATE transcoded_files
+        SET is_ready = TRUE, processing_progress = 100, error = NULL,
+            completed_at = NOW(), last_accessed_at = NOW(){assignments}
+        WHERE id = %s
+        """,
+        (*fields.values(), row_id),
+    )
@@ -0,0 +1,339 @@
+"""Smart playlist evaluation.
+
+``playlists.smart_filters`` is compiled into one parameterized query over
+``media_items``. The catalog predicates (categories, media types, year and
+duration ranges) are served by the expression indexes of migration 013, and
+their result is materialized in ``smart_playlist_members``.
+
+Membership is kept current incrementally. While at least one smart
+playlist exists, ``media_item_changes`` records the ids touched by every
+``media_items`` statement together with the writing transaction. Each
+playlist stores the snapshot its membership reflects, and a refresh
+re-checks only the ids written by transactions that snapshot did not see.
+This follows commit order, which neither row ids nor catalog versions do.
+While the notification listener is connected, a playlist evaluated at the
+current ``catalog_version`` is known to be unchanged without a query, so
+opening it reads its members and nothing else. A full evaluation happens
+only when the filters change or when the state is older than the change log
+retention. The maintenance scan prunes the change log (``prune_changes``).
+
+Predicates that depend on the clock or the viewer (``added_within_days``,
+``unwatched``), as well as ``sort`` and ``limit``, are applied when members
+are read and are never materialized.
+
+Supported filters::
+
+    {"categories": ["movies"], "media_types": ["video"],
+     "year_min": 1990, "year_max": 1999,
+     "duration_min": 1200, "duration_max": 7200,   # seconds
+     "added_within_days": 30, "unwatched": true,
+     "sort": "created_at" | "title" | "duration" | "year",
+     "order": "asc" | "desc", "limit": 100}
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.catalog_version import catalog_version
+from postgres_config import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+CHANGE_RETENTION_DAYS = int(os.getenv("SMART_PLAYLIST_CHANGE_RETENTION_DAYS", "7"))
+MAX_LIMIT = int(os.getenv("SMART_PLAYLIST_MAX_ITEMS", "5000"))
+
+SORT_COLUMNS = {
+    "created_at": "m.created_at",
+    "title": "lower(m.title)",
+    "duration": "m.duration_seconds",
+    "year": "media_item_year(m.metadata)",
+}
+_LIST_KEYS = {"categories": ("categories", "category"), "media_types": ("media_types", "media_type")}
+_RANGE_KEYS = ("year_min", "year_max", "duration_min", "duration_max")
+_KNOWN_KEYS = {
+    *(alias for aliases in _LIST_KEYS.values() for alias in aliases),
+    *_RANGE_KEYS,
+    "added_within_days", "unwatched", "sort", "order", "limit",
+}
+
+_MEMBER_COLUMNS = (
+    "m.id::text AS id, m.title, m.media_type, m.duration_seconds, m.metadata, "
+    "m.created_at, media_item_year(m.metadata) AS year"
+)
+
+
+class SmartFilterError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass(frozen=True)
+class CompiledFilters:
+    """SQL fragments for one playlist; every fragment uses the ``m`` alias."""
+
+    match_sql: str
+    match_params: Tuple[Any, ...]
+    added_within_days: Optional[int]
+    unwatched: bool
+    order_sql: str
+    limit: int
+    fingerprint: str
+
+
+def _string_list(filters: Dict[str, Any], name: str) -> List[str]:
+    values: List[str] = []
+    for key in _LIST_KEYS[name]:
+        value = filters.get(key)
+        if value is None:
+            continue
+        for entry in value if isinstance(value, list) else [value]:
+            if not isinstance(entry, str) or not entry.strip():
+                raise SmartFilterError(f"'{key}' must be a string or a list of strings")
+            values.append(entry.strip())
+    return sorted(set(values))
+
+
+def _whole_number(filters: Dict[str, Any], key: str) -> Optional[int]:
+    value = filters.get(key)
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise SmartFilterError(f"'{key}' must be a non-negative integer")
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise SmartFilterError(f"'{key}' must be a non-negative integer") from None
+    if number < 0:
+        raise SmartFilterError(f"'{key}' must be a non-negative integer")
+    return number
+
+
+def compile_filters(filters: Optional[Dict[str, Any]]) -> CompiledFilters:
+    """Validate ``smart_filters`` and build the query fragments for them."""
+    filters = filters or {}
+    if not isinstance(filters, dict):
+        raise SmartFilterError("'smart_filters' must be an object")
+    unknown = sorted(set(filters) - _KNOWN_KEYS)
+    if unknown:
+        raise SmartFilterError(f"Unknown smart filter(s): {', '.join(unknown)}")
+
+    clauses = ["m.status = 'available'"]
+    params: List[Any] = []
+    categories = _string_list(filters, "categories")
+    if categories:
+        clauses.append("m.metadata->>'category' = ANY(%s)")
+        params.append(categories)
+    media_types = _string_list(filters, "media_types")
+    if media_types:
+        clauses.append("m.media_type = ANY(%s)")
+        params.append(media_types)
+
+    ranges = {key: _whole_number(filters, key) for key in _RANGE_KEYS}
+    for prefix, expression in (("year", "media_item_year(m.metadata)"), ("duration", "m.duration_seconds")):
+        low, high = ranges[f"{prefix}_min"], ranges[f"{prefix}_max"]
+        if low is not None and high is not None and low > high:
+            raise SmartFilterError(f"'{prefix}_min' is greater than '{prefix}_max'")
+        if low is not None:
+            clauses.append(f"{expression} >= %s")
+            params.append(low)
+        if high is not None:
+            clauses.append(f"{expression} <= %s")
+            params.append(high)
+
+    sort = filters.get("sort") or "created_at"
+    if sort not in SORT_COLUMNS:
+        raise SmartFilterError(f"'sort' must be one of: {', '.join(SORT_COLUMNS)}")
+    order = str(filters.get("order") or ("asc" if sort == "title" else "desc")).lower()
+    if order not in ("asc", "desc"):
+        raise SmartFilterError("'order' must be 'asc' or 'desc'")
+    limit = _whole_number(filters, "limit")
+    if limit == 0:
+        raise SmartFilterError("'limit' must be a positive integer")
+
+    match_sql = " AND ".join(clauses)
+    fingerprint = hashlib.sha1(
+        json.dumps([match_sql, params], sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+    return CompiledFilters(
+        match_sql=match_sql,
+        match_params=tuple(params),
+        added_within_days=_whole_number(filters, "added_within_days"),
+        unwatched=bool(filters.get("unwatched")),
+        order_sql=f"{SORT_COLUMNS[sort]} {order.upper()} NULLS LAST, m.id",
+        limit=min(limit or MAX_LIMIT, MAX_LIMIT),
+        fingerprint=fingerprint,
+    )
+
+
+class SmartPlaylists:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {"cached": 0, "incremental": 0, "full": 0}
+
+    def _count(self, mode: str) -> str:
+        with self._lock:
+            self.stats[mode] += 1
+        return mode
+
+    def refresh(self, cursor, playlist_id: int, compiled: CompiledFilters) -> str:
+        """Bring ``smart_playlist_members`` up to date; the caller commits.
+
+        Returns how the membership was obtained: ``cached``, ``incremental``
+        or ``full``.
+        """
+        # Read before the snapshot below: a write committed later either is
+        # in that snapshot or has changed the version by the next request.
+        version = catalog_version.current()
+        state_sql = """
+            SELECT filters_hash, catalog_version, snapshot::text AS snapshot,
+                   evaluated_at < now() - make_interval(days => %s) AS expired
+            FROM smart_playlist_state WHERE playlist_id = %s
+        """
+        retention = max(CHANGE_RETENTION_DAYS // 2, 1)
+        cursor.execute(state_sql, (retention, playlist_id))
+        state = cursor.fetchone()
+        if self._current(state, compiled, version):
+            return self._count("cached")
+
+        # Serialize evaluation of this playlist across workers, then re-check.
+        cursor.execute(
+            "INSERT INTO smart_playlist_state (playlist_id) VALUES (%s) ON CONFLICT (playlist_id) DO NOTHING",
+            (playlist_id,),
+        )
+        cursor.execute(state_sql + " FOR UPDATE", (retention, playlist_id))
+        state = cursor.fetchone()
+        if self._current(state, compiled, version):
+            return self._count("cached")
+
+        # Later statements see at least what this snapshot sees; anything it
+        # does not see is re-checked by the next refresh.
+        cursor.execute("SELECT pg_current_snapshot()::text AS snapshot")
+        snapshot = cursor.fetchone()["snapshot"]
+
+        if state["filters_hash"] != compiled.fingerprint or state["expired"] or not state["snapshot"]:
+            cursor.execute("DELETE FROM smart_playlist_members WHERE playlist_id = %s", (playlist_id,))
+            cursor.execute(
+                f"""
+                INSERT INTO smart_playlist_members (playlist_id, media_item_id)
+                SELECT %s, m.id::text FROM media_items m WHERE {compiled.match_sql}
+                """,
+                (playlist_id, *compiled.match_params),
+            )
+            mode = "full"
+        else:
+            changed = """
+                SELECT DISTINCT media_item_id FROM media_item_changes
+                WHERE txid >= pg_snapshot_xmin(%s::pg_snapshot)
+                  AND NOT pg_visible_in_snapshot(txid, %s::pg_snapshot)
+            """
+            since = (state["snapshot"], state["snapshot"])
+            cursor.execute(
+                f"""
+                DELETE FROM smart_playlist_members s
+                USING ({changed}) AS c
+                WHERE s.playlist_id = %s AND s.media_item_id = c.media_item_id
+                  AND NOT EXISTS (
+                      SELECT 1 FROM media_items m
+                      WHERE m.id::text = c.media_item_id AND {compiled.match_sql}
+                  )
+                """,
+                (*since, playlist_id, *compiled.match_params),
+            )
+            cursor.execute(
+                f"""
+                INSERT INTO smart_playlist_members (playlist_id, media_item_id)
+                SELECT %s, m.id::text
+                FROM ({changed}) AS c
+                JOIN media_items m ON m.id::text = c.media_item_id
+                WHERE {compiled.match_sql}
+                ON CONFLICT DO NOTHING
+                """,
+                (playlist_id, *since, *compiled.match_params),
+            )
+            mode = "incremental"
+
+        cursor.execute(
+            """
+            UPDATE smart_playlist_state
+            SET filters_hash = %s, snapshot = %s::pg_snapshot, catalog_version = %s, evaluated_at = now()
+            WHERE playlist_id = %s
+            """,
+            (compiled.fingerprint, snapshot, version, playlist_id),
+        )
+        logger.debug("Smart playlist %s: %s evaluation at snapshot %s", playlist_id, mode, snapshot)
+        return self._count(mode)
+
+    @staticmethod
+    def _current(state: Optional[Dict[str, Any]], compiled: CompiledFilters, version: Optional[int]) -> bool:
+        # Versions are unique but unordered (migration 008): only equality says
+        # that no write has committed since the evaluation.
+        return bool(
+            state
+            and version is not None
+            and state["snapshot"]
+            and state["filters_hash"] == compiled.fingerprint
+            and state["catalog_version"] == version
+            and not state["expired"]
+        )
+
+    def items(self, cursor, playlist: Dict[str, Any], viewer_id: Any) -> List[Dict[str, Any]]:
+        """Current items of a smart playlist, in its sort order; the caller commits.
+
+        ``unwatched`` is evaluated for ``viewer_id``.
+        """
+        compiled = compile_filters(playlist.get("smart_filters"))
+        self.refresh(cursor, playlist["id"], compiled)
+
+        clauses = ["s.playlist_id = %s"]
+        params: List[Any] = [playlist["id"]]
+        if compiled.added_within_days is not None:
+            clauses.append("m.created_at >= now() - make_interval(days => %s)")
+            params.append(compiled.added_within_days)
+        if compiled.unwatched:
+            clauses.append(
+                """NOT EXISTS (
+                    SELECT 1 FROM viewing_history vh
+                    WHERE vh.user_id::text = %s AND vh.media_id = m.id::text AND vh.completed = 'true'
+                )"""
+            )
+            params.append(str(viewer_id))
+
+        cursor.execute(
+            f"""
+            SELECT {_MEMBER_COLUMNS}
+            FROM smart_playlist_members s
+            JOIN media_items m ON m.id::text = s.media_item_id
+            WHERE {' AND '.join(clauses)}
+            ORDER BY {compiled.order_sql}
+            LIMIT %s
+            """,
+            (*params, compiled.limit),
+        )
+        return list(cursor.fetchall() or [])
+
+
+smart_playlists = SmartPlaylists()
+
+
+def prune_changes() -> int:
+    """Delete change log rows older than the retention; returns the count.
+
+    Run by the maintenance scan, so the log stays bounded even when no smart
+    playlist is ever opened.
+    """
+    with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+        cursor.execute(
+            "DELETE FROM media_item_changes WHERE changed_at < now() - make_interval(days => %s)",
+            (CHANGE_RETENTION_DAYS,),
+        )
+        deleted = cursor.rowcount
+        conn.commit()
+    return deleted
@@ -0,0 +1,414 @@
+"""Sidecar subtitle index and WebVTT conversion cache.
+
+The maintenance scan excludes ``*.srt``/``*.sub`` from the catalog itself;
+after each committed scan :func:`refresh_subtitles` looks next to every
+available video for sidecars instead (``Movie.srt``, ``Movie.en.forced.srt``,
+``Subs/Movie.eng.srt``, ``Subs/<episode>/2_English.srt``) and records them in
+``media_subtitles`` (migration 011) with language and flags parsed from the
+file name. Each directory is listed once per refresh.
+
+Browsers only accept WebVTT, so SRT, ASS/SSA and MicroDVD files are converted
+once and the result kept under ``SUBTITLE_CACHE_ROOT`` as
+``<id>-<mtime_ns>-<size>.vtt``; a request is a file read unless the source
+changed since it was last converted.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+import threading
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from psycopg2.extras import execute_values
+
+from postgres_config import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+CACHE_ROOT = Path(os.getenv("SUBTITLE_CACHE_ROOT", os.path.join(os.getenv("DATA_ROOT", "/app/data"), "subtitles")))
+MICRODVD_FPS = float(os.getenv("SUBTITLE_MICRODVD_FPS", "23.976"))
+
+SUBTITLE_FORMATS = {".srt": "srt", ".vtt": "vtt", ".ass": "ass", ".ssa": "ssa", ".sub": "sub"}
+SUBTITLE_DIRS = {"subs", "subtitles"}
+VIDEO_EXTENSIONS = {".mp4", ".mkv", ".avi", ".mov", ".wmv", ".flv", ".webm", ".m4v", ".mpg", ".mpeg"}
+
+_FORCED_TAGS = {"forced"}
+_HEARING_IMPAIRED_TAGS = {"sdh", "cc", "hi"}
+_LANGUAGES = {
+    "english": "en", "eng": "en", "spanish": "es", "spa": "es", "french": "fr", "fre": "fr", "fra": "fr",
+    "german": "de", "ger": "de", "deu": "de", "italian": "it", "ita": "it", "portuguese": "pt", "por": "pt",
+    "dutch": "nl", "dut": "nl", "nld": "nl", "swedish": "sv", "swe": "sv", "norwegian": "no", "nor": "no",
+    "danish": "da", "dan": "da", "finnish": "fi", "fin": "fi", "polish": "pl", "pol": "pl",
+    "russian": "ru", "rus": "ru", "japanese": "ja", "jpn": "ja", "chinese": "zh", "chi": "zh", "zho": "zh",
+    "korean": "ko", "kor": "ko", "arabic": "ar", "ara": "ar", "hebrew": "he", "heb": "he",
+    "turkish": "tr", "tur": "tr", "greek": "el", "gre": "el", "ell": "el", "czech": "cs", "cze": "cs",
+    "ces": "cs", "hungarian": "hu", "hun": "hu", "romanian": "ro", "rum": "ro", "ron": "ro",
+}
+_TOKEN_SPLIT = re.compile(r"[._\-\s\[\]()]+")
+
+_schema_lock = threading.Lock()
+_table_available: Optional[bool] = None
+
+
+def subtitles_available(force: bool = False) -> bool:
+    """Whether migration 011's table exists (checked once per process)."""
+    global _table_available
+    with _schema_lock:
+        if _table_available is not None and not force:
+            return _table_available
+        try:
+            with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+                cursor.execute("SELECT to_regclass('public.media_subtitles') IS NOT NULL AS present")
+                row = cursor.fetchone()
+            _table_available = bool(row and row["present"])
+        except Exception as exc:
+            logger.warning("Subtitle table discovery failed: %s", exc)
+            return False
+        return _table_available
+
+
+# -- discovery ---------------------------------------------------------------
+
+
+def _describe(tokens: Sequence[str]) -> Dict[str, Any]:
+    """Language and flags from file name tokens (``['en', 'forced']``)."""
+    language = None
+    forced = hearing_impaired = False
+    for token in (token.lower() for token in tokens if token):
+        if token in _FORCED_TAGS:
+            forced = True
+        elif token in _HEARING_IMPAIRED_TAGS:
+            hearing_impaired = True
+        elif language is None and token in _LANGUAGES:
+            language = _LANGUAGES[token]
+        elif language is None and len(token) == 2 and token.isalpha():
+            language = token
+    return {"language": language, "is_forced": forced, "is_hearing_impaired": hearing_impaired}
+
+
+class _DirectoryListing:
+    """``os.scandir`` results cached for the duration of one refresh."""
+
+    def __init__(self):
+        self._entries: Dict[str, List[Tuple[str, bool]]] = {}
+
+    def __call__(self, directory: str) -> List[Tuple[str, bool]]:
+        entries = self._entries.get(directory)
+        if entries is None:
+            try:
+                with os.scandir(directory) as scanner:
+                    entries = [(entry.name, entry.is_dir()) for entry in scanner]
+            except OSError:
+                entries = []
+            self._entries[directory] = entries
+        return entries
+
+
+def _subtitle_format(filename: str, names: set) -> Optional[str]:
+    stem, extension = os.path.splitext(filename)
+    fmt = SUBTITLE_FORMATS.get(extension.lower())
+    # A .sub next to an .idx is a VobSub bitmap track, which cannot be converted.
+    if fmt == "sub" and f"{stem}.idx" in names:
+        return None
+    return fmt
+
+
+def discover_sidecars(video_path: str, listing: _DirectoryListing) -> List[Dict[str, Any]]:
+    """Subtitle files belonging to ``video_path``."""
+    directory, video_name = os.path.split(video_path)
+    video_stem = os.path.splitext(video_name)[0]
+    stem_key = video_stem.lower()
+    entries = listing(directory)
+    names = {name for name, _ in entries}
+    videos_in_directory = sum(
+        1 for name, is_dir in entries if not is_dir and os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS
+    )
+    found: List[Dict[str, Any]] = []
+
+    def _add(folder: str, filename: str, tokens: Sequence[str], folder_names: set) -> None:
+        fmt = _subtitle_format(filename, folder_names)
+        if fmt is not None:
+            found.append({"source_path": os.path.join(folder, filename), "format": fmt, **_describe(tokens)})
+
+    for name, is_dir in entries:
+        if is_dir:
+            continue
+        stem = os.path.splitext(name)[0]
+        if stem.lower() == stem_key or stem.lower().startswith(stem_key + "."):
+            _add(directory, name, stem[len(video_stem):].split("."), names)
+
+    for name, is_dir in entries:
+        if not is_dir or name.lower() not in SUBTITLE_DIRS:
+            continue
+        subs_dir = os.path.join(directory, name)
+        sub_entries = listing(subs_dir)
+        sub_names = {sub_name for sub_name, _ in sub_entries}
+        for sub_name, sub_is_dir in sub_entries:
+            stem = os.path.splitext(sub_name)[0]
+            if sub_is_dir and sub_name.lower() == stem_key:
+                # Subs/<video stem>/2_English.srt (per-episode folders)
+                episode_dir = os.path.join(subs_dir, sub_name)
+                episode_entries = listing(episode_dir)
+                episode_names = {entry_name for entry_name, _ in episode_entries}
+                for episode_name, episode_is_dir in episode_entries:
+                    if not episode_is_dir:
+                        _add(episode_dir, episode_name, _TOKEN_SPLIT.split(os.path.splitext(episode_name)[0]),
+                             episode_names)
+            elif not sub_is_dir:
+                if stem.lower().startswith(stem_key):
+                    _add(subs_dir, sub_name, _TOKEN_SPLIT.split(stem[len(video_stem):]), sub_names)
+                elif videos_in_directory == 1:
+                    # A movie folder: every file in Subs/ belongs to its only video.
+                    _add(subs_dir, sub_name, _TOKEN_SPLIT.split(stem), sub_names)
+    return found
+
+
+def refresh_subtitles(*, categories: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """Re-index sidecar subtitles for available videos in ``categories``."""
+    if not subtitles_available():
+        raise RuntimeError("Subtitle table missing; apply migrations/011_add_media_subtitles.sql")
+
+    summary = {"videos": 0, "found": 0, "written": 0, "removed": 0}
+    category_filter = ""
+    params: List[Any] = []
+    if categories:
+        category_filter = "AND metadata->>'category' = ANY(%s)"
+        params.append(list(categories))
+
+    with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+        cursor.execute(
+            f"""
+            SELECT id::text AS id, source_path
+            FROM media_items
+            WHERE status = 'available' AND media_type = 'video' AND source_path IS NOT NULL
+              {category_filter}
+            """,
+            params,
+        )
+        videos = cursor.fetchall() or []
+        summary["videos"] = len(videos)
+        if not videos:
+            return summary
+
+        listing = _DirectoryListing()
+        found: Dict[str, Dict[str, Any]] = {}
+        for video in videos:
+            for sidecar in discover_sidecars(video["source_path"], listing):
+                try:
+                    stat = os.stat(sidecar["source_path"])
+                except OSError:
+                    continue
+                sidecar.update(media_item_id=video["id"], size_bytes=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                found.setdefault(sidecar["source_path"], sidecar)
+        summary["found"] = len(found)
+
+        video_ids = [video["id"] for video in videos]
+        cursor.execute(
+            """
+            SELECT id, media_item_id, source_path, language, format, is_forced,
+                   is_hearing_impaired, size_bytes, mtime_ns
+            FROM media_subtitles
+            WHERE media_item_id = ANY(%s)
+            """,
+            (video_ids,),
+        )
+        existing = {row["source_path"]: row for row in cursor.fetchall() or []}
+
+        columns = ("media_item_id", "source_path", "language", "format", "is_forced",
+                   "is_hearing_impaired", "size_bytes", "mtime_ns")
+        changed = [
+            tuple(sidecar[column] for column in columns)
+            for path, sidecar in found.items()
+            if path not in existing or any(existing[path][column] != sidecar[column] for column in columns)
+        ]
+        if changed:
+            execute_values(
+                cursor,
+                """
+                INSERT INTO media_subtitles (
+                    media_item_id, source_path, language, format, is_forced,
+                    is_hearing_impaired, size_bytes, mtime_ns
+                )
+                VALUES %s
+                ON CONFLICT (source_path) DO UPDATE
+                SET media_item_id = EXCLUDED.media_item_id,
+                    language = EXCLUDED.language,
+                    format = EXCLUDED.format,
+                    is_forced = EXCLUDED.is_forced,
+                    is_hearing_impaired = EXCLUDED.is_hearing_impaired,
+                    size_bytes = EXCLUDED.size_bytes,
+                    mtime_ns = EXCLUDED.mtime_ns,
+                    updated_at = now()
+                """,
+                changed,
+                page_size=500,
+            )
+        removed = [row["id"] for path, row in existing.items() if path not in found]
+        if removed:
+            cursor.execute("DELETE FROM media_subtitles WHERE id = ANY(%s)", (removed,))
+        conn.commit()
+
+    summary["written"] = len(changed)
+    summary["removed"] = len(removed)
+    return summary
+
+
+def list_subtitles(cursor, media_id: str) -> List[Dict[str, Any]]:
+    cursor.execute(
+        """
+        SELECT id, source_path, language, format, is_forced, is_hearing_impaired, size_bytes, mtime_ns
+        FROM media_subtitles
+        WHERE media_item_id = %s
+        ORDER BY language NULLS LAST, is_forced, is_hearing_impaired, id
+        """,
+        (str(media_id),),
+    )
+    return cursor.fetchall() or []
+
+
+def get_subtitle(cursor, media_id: str, subtitle_id: int) -> Optional[Dict[str, Any]]:
+    cursor.execute(
+        """
+        SELECT id, source_path, format, size_bytes, mtime_ns
+        FROM media_subtitles
+        WHERE id = %s AND media_item_id = %s
+        """,
+        (subtitle_id, str(media_id)),
+    )
+    return cursor.fetchone()
+
+
+# -- conversion --------------------------------------------------------------
+
+_TIMESTAMP = re.compile(r"(?:(\d+):)?(\d{1,2}):(\d{2})[,.](\d{1,3})")
+_ASS_OVERRIDE = re.compile(r"\{[^}]*\}")
+_MICRODVD_LINE = re.compile(r"^\{(\d+)\}\{(\d+)\}(.*)$")
+
+
+def _decode(data: bytes) -> str:
+    if data.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return data.decode("utf-16")
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("cp1252", errors="replace")
+
+
+def _vtt_time(seconds: float) -> str:
+    milliseconds = int(round(max(seconds, 0) * 1000))
+    hours, remainder = divmod(milliseconds, 3_600_000)
+    minutes, remainder = divmod(remainder, 60_000)
+    secs, millis = divmod(remainder, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}"
+
+
+def _parse_time(value: str) -> Optional[float]:
+    match = _TIMESTAMP.search(value)
+    if not match:
+        return None
+    hours, minutes, seconds, fraction = match.groups()
+    return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds) + int(fraction.ljust(3, "0")[:3]) / 1000
+
+
+def _cue_text(lines: Sequence[str]) -> str:
+    # "-->" ends a cue's timing line; it may not appear in cue text.
+    return "\n".join(line.replace("-->", "->") for line in lines if line.strip())
+
+
+def _srt_to_vtt(text: str) -> List[str]:
+    cues: List[str] = []
+    for block in re.split(r"\n\s*\n", text):
+        lines = block.strip("\n").split("\n")
+        timing = next((index for index, line in enumerate(lines) if "-->" in line), None)
+        if timing is None:
+            continue
+        start_text, _, end_text = lines[timing].partition("-->")
+        start, end = _parse_time(start_text), _parse_time(end_text)
+        body = _cue_text(_ASS_OVERRIDE.sub("", line) for line in lines[timing + 1:])
+        if start is None or end is None or not body:
+            continue
+        cues.append(f"{_vtt_time(start)} --> {_vtt_time(end)}\n{body}")
+    return cues
+
+
+def _ass_to_vtt(text: str) -> List[str]:
+    cues: List[Tuple[float, str]] = []
+    fields: List[str] = []
+    in_events = False
+    for line in text.split("\n"):
+        stripped = line.strip()
+        if stripped.startswith("["):
+            in_events = stripped.lower() == "[events]"
+            continue
+        if not in_events:
+            continue
+        key, _, value = stripped.partition(":")
+        if key.lower() == "format":
+            fields = [name.strip().lower() for name in value.split(",")]
+        elif key.lower() == "dialogue" and fields:
+            parts = value.strip().split(",", len(fields) - 1)
+            if len(parts) != len(fields):
+                continue
+            event = dict(zip(fields, parts))
+            start, end = _parse_time(event.get("start", "")), _parse_time(event.get("end", ""))
+            body = _ASS_OVERRIDE.sub("", event.get("text", ""))
+            body = body.replace("\\N", "\n").replace("\\n", "\n").replace("\\h", " ")
+            body = _cue_text(body.split("\n"))
+            if start is not None and end is not None and body:
+                cues.append((start, f"{_vtt_time(start)} --> {_vtt_time(end)}\n{body}"))
+    return [cue for _, cue in sorted(cues, key=lambda entry: entry[0])]
+
+
+def _microdvd_to_vtt(text: str) -> List[str]:
+    cues: List[str] = []
+    fps = MICRODVD_FPS
+    for index, line in enumerate(text.split("\n")):
+        match = _MICRODVD_LINE.match(line.strip())
+        if not match:
+            continue
+        start_frame, end_frame, body = int(match.group(1)), int(match.group(2)), match.group(3)
+        if index == 0 and start_frame == end_frame <= 1:
+            # {1}{1}23.976 declares the frame rate.
+            try:
+                fps = float(body) or fps
+                continue
+            except ValueError:
+                pass
+        body = _cue_text(_ASS_OVERRIDE.sub("", body).split("|"))
+        if body:
+            cues.append(f"{_vtt_time(start_frame / fps)} --> {_vtt_time(end_frame / fps)}\n{body}")
+    return cues
+
+
+def convert_to_webvtt(data: bytes, fmt: str) -> bytes:
+    text = _decode(data).replace("\r\n", "\n").replace("\r", "\n")
+    if fmt == "vtt":
+        body = text
+        if not body.startswith("WEBVTT"):
+            body = "WEBVTT\n\n" + body
+        return body.encode("utf-8")
+    converters = {"srt": _srt_to_vtt, "ass": _ass_to_vtt, "ssa": _ass_to_vtt, "sub": _microdvd_to_vtt}
+    cues = converters[fmt](text)
+    return ("WEBVTT\n\n" + "\n\n".join(cues) + "\n").encode("utf-8")
+
+
+def webvtt_path(subtitle: Dict[str, Any]) -> Path:
+    """Cached WebVTT for ``subtitle``, converting it first if the source changed."""
+    source = Path(subtitle["source_path"])
+    stat = source.stat()
+    cached = CACHE_ROOT / f"{subtitle['id']}-{stat.st_mtime_ns}-{stat.st_size}.vtt"
+    if cached.is_file():
+        return cached
+
+    converted = convert_to_webvtt(source.read_bytes(), subtitle["format"])
+    CACHE_ROOT.mkdir(parents=True, exist_ok=True)
+    partial = cached.with_name(f"{cached.name}.{threading.get_ident()}.tmp")
+    partial.write_bytes(converted)
+    os.replace(partial, cached)
+    for stale in CACHE_ROOT.glob(f"{subtitle['id']}-*.vtt"):
+        if stale != cached:
+            stale.unlink(missing_ok=True)
+    return cached
@@ -0,0 +1,139 @@
+"""Process-wide cache of the ``system_settings`` table.
+
+The table is created once at startup by :func:`ensure_settings_schema`.
+Reads are served from an in-memory snapshot of every row; writers go through
+:func:`save_setting`, which upserts the row and publishes a
+``watch2_settings`` notification so every worker drops its snapshot once
+the transaction commits. While the notification listener is not connected
+the snapshot expires after ``SETTINGS_CACHE_FALLBACK_TTL`` seconds instead.
+"""
+from __future__ import annotations
+
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import closing
+from typing import Any, Dict, Optional
+
+from app.services import notifications
+from postgres_config import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+SETTINGS_CHANNEL = "watch2_settings"
+FALLBACK_TTL_SECONDS = float(os.getenv("SETTINGS_CACHE_FALLBACK_TTL", "5"))
+
+
+def ensure_settings_table(cursor) -> None:
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS system_settings (
+            key TEXT PRIMARY KEY,
+            value JSONB NOT NULL,
+            updated_at TIMESTAMPTZ DEFAULT NOW()
+        )
+        """
+    )
+
+
+def ensure_settings_schema() -> bool:
+    """Create ``system_settings`` if needed; called once from ``create_app``."""
+    try:
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            ensure_settings_table(cursor)
+            conn.commit()
+        return True
+    except Exception as exc:
+        logger.warning("Could not ensure system_settings table: %s", exc)
+        return False
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return None
+    return value
+
+
+class _SettingsCache:
+    def __init__(self):
+        self._values: Optional[Dict[str, Any]] = None
+        self._loaded_at = 0.0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._subscribed = False
+        self.loads = 0
+
+    def _ensure_subscribed(self) -> None:
+        if not self._subscribed:
+            self._subscribed = True
+            notifications.subscribe(SETTINGS_CHANNEL, lambda payload: self.invalidate())
+
+    def snapshot(self) -> Dict[str, Any]:
+        self._ensure_subscribed()
+        values = self._values
+        if values is not None and (
+            notifications.is_listening()
+            or time.monotonic() - self._loaded_at < FALLBACK_TTL_SECONDS
+        ):
+            return values
+        with self._lock:
+            generation = self._generation
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            cursor.execute("SELECT key, value FROM system_settings")
+            values = {row["key"]: _decode(row["value"]) for row in cursor.fetchall() or []}
+        with self._lock:
+            self.loads += 1
+            # An invalidation that raced with the load wins; serve but do not keep.
+            if generation == self._generation:
+                self._values = values
+                self._loaded_at = time.monotonic()
+        return values
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._values = None
+
+
+_cache = _SettingsCache()
+
+
+def get_setting(key: str, default: Any = None) -> Any:
+    """Return a copy of the stored value for ``key`` (``default`` if unset)."""
+    value = _cache.snapshot().get(key)
+    if value is None:
+        return default
+    return copy.deepcopy(value)
+
+
+def save_setting(cursor, key: str, value: Any) -> None:
+    """Upsert ``key`` on ``cursor`` and notify all workers on commit."""
+    cursor.execute(
+        """
+        INSERT INTO system_settings (key, value, updated_at)
+        VALUES (%s, %s::jsonb, NOW())
+        ON CONFLICT (key)
+        DO UPDATE SET value = EXCLUDED.value, updated_at = NOW()
+        """,
+        (key, json.dumps(value)),
+    )
+    notifications.notify(cursor, SETTINGS_CHANNEL, key)
+    _cache.invalidate()
+
+
+def invalidate_settings() -> None:
+    _cache.invalidate()
+
+
+def settings_cache_stats() -> Dict[str, Any]:
+    return {
+        "loaded": _cache._values is not None,
+        "loads": _cache.loads,
+        "listening": notifications.is_listening(),
+    }
@@ -0,0 +1,370 @@
+"""CPU transcodes of video items into ``transcoded_files`` renditions.
+
+Renditions are H.264/AAC MP4 files at the sizes in ``QUALITY_PRESETS``,
+written to ``TRANSCODE_ROOT/<media id>/<quality>-<rendition>.mp4``. Jobs run
+from a priority queue: on-demand requests (a player asked for a quality) are
+served ahead of background pre-transcodes, and a queued background job is
+promoted when someone asks for it. Concurrency follows a core budget:
+``TRANSCODE_CPU_BUDGET`` cores shared by jobs of
+``TRANSCODE_THREADS_PER_JOB`` ffmpeg threads each.
+
+Progress is written to ``processing_progress``. A ready rendition whose
+``source_signature`` matches the current file is streamed from its own URL
+(``/stream?quality=<q>&rendition=<key>``), never in place of the original.
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import os
+import threading
+from contextlib import closing
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.core.cache import TTLCache
+from app.services.ffmpeg import FFMPEG_PATH, FfmpegError, run_ffmpeg
+from app.services.hls_packaging import rendition_key
+from app.services.renditions import (
+    ProgressWriter,
+    claim_rendition,
+    fail_rendition,
+    finish_rendition,
+    load_rendition,
+)
+from postgres_config import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+TRANSCODE_ROOT = Path(os.getenv("TRANSCODE_ROOT", os.path.join(os.getenv("DATA_ROOT", "/app/data"), "transcodes")))
+CPU_BUDGET = int(os.getenv("TRANSCODE_CPU_BUDGET", str(max((os.cpu_count() or 2) // 2, 1))))
+THREADS_PER_JOB = int(os.getenv("TRANSCODE_THREADS_PER_JOB", "2"))
+X264_PRESET = os.getenv("TRANSCODE_X264_PRESET", "veryfast")
+BACKGROUND_QUALITIES = [
+    quality.strip() for quality in os.getenv("TRANSCODE_BACKGROUND_QUALITIES", "720p").split(",") if quality.strip()
+]
+
+TRANSCODE_FORMAT = "mp4"
+PRIORITY_ON_DEMAND = 0
+PRIORITY_BACKGROUND = 10
+
+# Bitrates in kbit/s.
+QUALITY_PRESETS: Dict[str, Dict[str, int]] = {
+    "1080p": {"height": 1080, "video_bitrate": 5000, "audio_bitrate": 192},
+    "720p": {"height": 720, "video_bitrate": 2800, "audio_bitrate": 128},
+    "480p": {"height": 480, "video_bitrate": 1200, "audio_bitrate": 128},
+    "360p": {"height": 360, "video_bitrate": 700, "audio_bitrate": 96},
+}
+# Requested qualities that mean "play the original file".
+SOURCE_QUALITIES = frozenset({"auto", "original", "source"})
+
+_ready_paths = TTLCache(maxsize=2048, ttl=30)
+
+
+class TranscodeError(Exception):
+    """Raised for invalid transcode requests; ``status`` is the HTTP status to return."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass(order=True)
+class _QueuedJob:
+    priority: int
+    sequence: int
+    media_id: str = field(compare=False)
+    quality: str = field(compare=False)
+    # Set when the job was re-queued at a higher priority.
+    superseded: bool = field(default=False, compare=False)
+
+
+def _scaled_width(metadata: Dict[str, Any], height: int) -> Optional[int]:
+    probe = metadata.get("probe") or {}
+    source_width, source_height = probe.get("width"), probe.get("height")
+    if not source_width or not source_height:
+        return None
+    return int(round(source_width * height / source_height / 2)) * 2
+
+
+class TranscodeQueue:
+    def __init__(self):
+        self._heap: List[_QueuedJob] = []
+        self._queued: Dict[Tuple[str, str], _QueuedJob] = {}
+        self._running: Dict[Tuple[str, str], int] = {}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._workers: List[threading.Thread] = []
+
+    @property
+    def concurrency(self) -> int:
+        return max(CPU_BUDGET // max(THREADS_PER_JOB, 1), 1)
+
+    @property
+    def threads_per_job(self) -> int:
+        return max(min(THREADS_PER_JOB, CPU_BUDGET), 1)
+
+    def _ensure_workers(self) -> None:
+        while len(self._workers) < self.concurrency:
+            worker = threading.Thread(
+                target=self._work,
+                name=f"watch2-transcode-{len(self._workers)}",
+                daemon=True,
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    # -- queue --------------------------------------------------------------
+
+    def enqueue(self, media_id: str, quality: str, priority: int = PRIORITY_ON_DEMAND) -> str:
+        """Queue a rendition; returns ``"queued"`` or ``"running"``."""
+        if quality not in QUALITY_PRESETS:
+            raise TranscodeError(f"Unknown quality '{quality}'; expected one of {', '.join(QUALITY_PRESETS)}")
+        if FFMPEG_PATH is None:
+            raise TranscodeError("ffmpeg is not available on this server", status=503)
+
+        key = (str(media_id), quality)
+        with self._condition:
+            if key in self._running:
+                return "running"
+            existing = self._queued.get(key)
+            if existing is not None:
+                if priority >= existing.priority:
+                    return "queued"
+                existing.superseded = True
+            job = _QueuedJob(priority, next(self._sequence), key[0], quality)
+            self._queued[key] = job
+            heapq.heappush(self._heap, job)
+            self._ensure_workers()
+            self._condition.notify()
+        return "queued"
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                while not self._heap:
+                    self._condition.wait()
+                job = heapq.heappop(self._heap)
+                if job.superseded:
+                    continue
+                key = (job.media_id, job.quality)
+                self._queued.pop(key, None)
+                self._running[key] = 0
+            try:
+                self._transcode(job.media_id, job.quality)
+            except Exception as exc:
+                logger.exception("Transcode of %s to %s failed: %s", job.media_id, job.quality, exc)
+            finally:
+                with self._condition:
+                    self._running.pop(key, None)
+
+    def state(self, media_id: str, quality: str) -> Optional[Dict[str, Any]]:
+        """In-memory queue state for one rendition (``None`` when idle)."""
+        key = (str(media_id), quality)
+        with self._condition:
+            if key in self._running:
+                return {"status": "running", "progress": self._running[key]}
+            job = self._queued.get(key)
+            if job is not None:
+                ahead = sum(1 for other in self._heap if not other.superseded and other < job)
+                return {"status": "queued", "position": ahead + 1}
+        return None
+
+    # -- transcoding --------------------------------------------------------
+
+    def _transcode(self, media_id: str, quality: str) -> None:
+        preset = QUALITY_PRESETS[quality]
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            cursor.execute(
+                """
+                SELECT id::text AS id, source_path, duration_seconds, metadata
+                FROM media_items
+                WHERE id = %s AND status = 'available' AND media_type = 'video'
+                """,
+                (media_id,),
+            )
+            item = cursor.fetchone()
+            if not item or not item.get("source_path"):
+                logger.info("Transcode skipped for %s: not an available video", media_id)
+                return
+
+            metadata = item.get("metadata") or {}
+            signature = metadata.get("scannerSignature")
+            existing = load_rendition(cursor, media_id, TRANSCODE_FORMAT, quality)
+            if existing and existing["is_ready"] and existing["source_signature"] == signature \
+                    and Path(existing["file_path"]).exists():
+                return
+            source_height = (metadata.get("probe") or {}).get("height")
+            if source_height and preset["height"] >= source_height:
+                logger.info("Transcode skipped for %s: source is %sp, not above %s", media_id, source_height, quality)
+                return
+
+            output_dir = TRANSCODE_ROOT / media_id
+            output_dir.mkdir(parents=True, exist_ok=True)
+            output = output_dir / f"{quality}-{rendition_key(signature)}.mp4"
+            partial = output.with_suffix(".part")
+            duration = float(item.get("duration_seconds") or metadata.get("durationSeconds") or 0)
+
+            row_id = claim_rendition(cursor, media_id, TRANSCODE_FORMAT, quality, str(output), signature)
+            conn.commit()
+            write_progress = ProgressWriter(conn, cursor, row_id)
+            key = (media_id, quality)
+
+            def _progress(percent: int) -> None:
+                with self._condition:
+                    self._running[key] = percent
+                write_progress(percent)
+
+            video_bitrate, audio_bitrate = preset["video_bitrate"], preset["audio_bitrate"]
+            arguments = [
+                "-i", item["source_path"],
+                "-map", "0:v:0", "-map", "0:a:0?",
+                "-vf", f"scale=-2:{preset['height']}",
+                "-c:v", "libx264", "-preset", X264_PRESET,
+                "-b:v", f"{video_bitrate}k",
+                "-maxrate", f"{int(video_bitrate * 1.5)}k",
+                "-bufsize", f"{video_bitrate * 2}k",
+                "-c:a", "aac", "-b:a", f"{audio_bitrate}k", "-ac", "2",
+                "-threads", str(self.threads_per_job),
+                "-movflags", "+faststart",
+                "-f", "mp4",
+                str(partial),
+            ]
+            try:
+                run_ffmpeg(
+                    arguments,
+                    log_path=output_dir / f"{quality}.log",
+                    duration=duration,
+                    on_progress=_progress,
+                )
+            except FfmpegError as exc:
+                fail_rendition(cursor, row_id, str(exc))
+                conn.commit()
+                partial.unlink(missing_ok=True)
+                _ready_paths.pop((media_id, quality, signature))
+                return
+
+            os.replace(partial, output)
+            for stale in output_dir.glob(f"{quality}-*.mp4"):
+                if stale != output:
+                    stale.unlink(missing_ok=True)
+            finish_rendition(
+                cursor,
+                row_id,
+                file_size=output.stat().st_size,
+                duration=duration or None,
+                width=_scaled_width(metadata, preset["height"]),
+                height=preset["height"],
+                bitrate=(video_bitrate + audio_bitrate) * 1000,
+            )
+            conn.commit()
+        _ready_paths.pop((media_id, quality, signature))
+        logger.info("Transcoded %s to %s", media_id, quality)
+
+    # -- lookups ------------------------------------------------------------
+
+    def _lookup(self, media_id: str, quality: str, signature: Optional[str]) -> Tuple[str, bool, str]:
+        """Cached ``(ready file path, attempted, error)`` for the current source."""
+
+        def _load() -> Tuple[str, bool, str]:
+            with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+                row = load_rendition(cursor, media_id, TRANSCODE_FORMAT, quality)
+            if row and row["source_signature"] == signature:
+                return (row["file_path"] if row["is_ready"] else ""), True, row["error"] or ""
+            return "", False, ""
+
+        return _ready_paths.get_or_load((media_id, quality, signature), _load)
+
+    def ready_path(
+        self,
+        media_id: str,
+        quality: str,
+        signature: Optional[str],
+        *,
+        request_missing: bool = False,
+    ) -> Optional[Path]:
+        """Path of a ready rendition built from the current source, if any.
+
+        With ``request_missing`` a rendition never attempted for this source
+        is queued on demand.
+        """
+        media_id = str(media_id)
+        file_path, attempted, _error = self._lookup(media_id, quality, signature)
+        if file_path and Path(file_path).is_file():
+            return Path(file_path)
+        if request_missing and not attempted and quality in QUALITY_PRESETS:
+            try:
+                self.enqueue(media_id, quality, PRIORITY_ON_DEMAND)
+            except TranscodeError as exc:
+                logger.debug("On-demand transcode not queued for %s: %s", media_id, exc)
+        return None
+
+    def failure(self, media_id: str, quality: str, signature: Optional[str]) -> Optional[str]:
+        """Error of a failed rendition of the current source, if it failed."""
+        _file_path, _attempted, error = self._lookup(str(media_id), quality, signature)
+        return error or None
+
+    def queue_background(
+        self,
+        *,
+        qualities: Optional[Sequence[str]] = None,
+        categories: Optional[Sequence[str]] = None,
+        limit: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Queue pre-transcodes for videos lacking a current rendition."""
+        qualities = list(qualities or BACKGROUND_QUALITIES)
+        unknown = [quality for quality in qualities if quality not in QUALITY_PRESETS]
+        if unknown:
+            raise TranscodeError(f"Unknown qualities: {', '.join(unknown)}")
+
+        category_filter = ""
+        params: List[Any] = [qualities, TRANSCODE_FORMAT]
+        if categories:
+            category_filter = "AND m.metadata->>'category' = ANY(%s)"
+            params.append(list(categories))
+        params.append(limit)
+
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            cursor.execute(
+                f"""
+                SELECT m.id::text AS id, q.quality
+                FROM media_items m
+                CROSS JOIN unnest(%s::text[]) AS q(quality)
+                LEFT JOIN transcoded_files t
+                       ON t.media_item_id = m.id::text AND t.format = %s AND t.quality = q.quality
+                WHERE m.status = 'available'
+                  AND m.media_type = 'video'
+                  AND (t.id IS NULL
+                       OR t.source_signature IS DISTINCT FROM m.metadata->>'scannerSignature'
+                       OR (NOT t.is_ready AND t.error IS NULL))
+                  {category_filter}
+                ORDER BY m.created_at DESC
+                LIMIT %s
+                """,
+                params,
+            )
+            rows = cursor.fetchall() or []
+
+        for row in rows:
+            self.enqueue(row["id"], row["quality"], PRIORITY_BACKGROUND)
+        return {"queued": len(rows), "qualities": qualities}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            queued = [job for job in self._heap if not job.superseded]
+            running = {f"{media_id}:{quality}": progress for (media_id, quality), progress in self._running.items()}
+        return {
+            "ffmpeg": FFMPEG_PATH,
+            "cpu_budget": CPU_BUDGET,
+            "threads_per_job": self.threads_per_job,
+            "concurrency": self.concurrency,
+            "queued_on_demand": sum(1 for job in queued if job.priority == PRIORITY_ON_DEMAND),
+            "queued_background": sum(1 for job in queued if job.priority != PRIORITY_ON_DEMAND),
+            "running": running,
+            "ready_path_cache": _ready_paths.stats(),
+        }
+
+
+transcodes = TranscodeQueue()
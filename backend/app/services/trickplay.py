@@ -0,0 +1,244 @@
+"""Seek-preview ("trickplay") sprite sheets for video items.
+
+For every video a thumbnail is taken each ``TRICKPLAY_INTERVAL_SECONDS`` and
+tiled ``TRICKPLAY_COLUMNS`` x ``TRICKPLAY_ROWS`` per sheet under
+``THUMBNAILS_ROOT/trickplay/<media id>/<rendition>/``, next to a WebVTT index
+whose cues point at ``sheet_NNN.jpg#xywh=x,y,w,h``. Players load the index
+once and show previews while scrubbing without touching the video stream.
+
+Sheets are independent ffmpeg runs (input-seeked to their time span) executed
+on a pool of ``TRICKPLAY_CPU_BUDGET`` single-threaded workers. Each sheet is
+written atomically and ``index.vtt`` last, so an interrupted job resumes at
+the first missing sheet; the rendition key follows ``scannerSignature`` so a
+replaced file starts over.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.services.ffmpeg import FFMPEG_PATH, FfmpegError, run_ffmpeg
+from app.services.hls_packaging import rendition_key
+from postgres_config import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+TRICKPLAY_ROOT = Path(os.getenv("THUMBNAILS_ROOT", "/app/thumbnails")) / "trickplay"
+INTERVAL_SECONDS = int(os.getenv("TRICKPLAY_INTERVAL_SECONDS", "10"))
+TILE_WIDTH = int(os.getenv("TRICKPLAY_TILE_WIDTH", "240"))
+COLUMNS = int(os.getenv("TRICKPLAY_COLUMNS", "10"))
+ROWS = int(os.getenv("TRICKPLAY_ROWS", "10"))
+IMAGE_FORMAT = os.getenv("TRICKPLAY_FORMAT", "jpg").lower()
+CPU_BUDGET = int(os.getenv("TRICKPLAY_CPU_BUDGET", str(max((os.cpu_count() or 2) // 2, 1))))
+
+INDEX_NAME = "index.vtt"
+MANIFEST_NAME = "manifest.json"
+_SAFE_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+# Used when the probe did not record the source dimensions.
+_DEFAULT_ASPECT = 16 / 9
+
+
+def _vtt_time(seconds: float) -> str:
+    milliseconds = int(round(seconds * 1000))
+    hours, remainder = divmod(milliseconds, 3_600_000)
+    minutes, remainder = divmod(remainder, 60_000)
+    secs, millis = divmod(remainder, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}"
+
+
+def _tile_height(metadata: Dict[str, Any]) -> int:
+    probe = metadata.get("probe") or {}
+    width, height = probe.get("width"), probe.get("height")
+    aspect = width / height if width and height else _DEFAULT_ASPECT
+    return max(int(round(TILE_WIDTH / aspect / 2)) * 2, 2)
+
+
+def output_dir(media_id: str, signature: Optional[str]) -> Path:
+    return TRICKPLAY_ROOT / str(media_id) / rendition_key(signature)
+
+
+def _sheet_name(index: int) -> str:
+    return f"sheet_{index:03d}.{IMAGE_FORMAT}"
+
+
+class _Plan:
+    """Sheets and geometry for one video."""
+
+    def __init__(self, item: Dict[str, Any]):
+        metadata = item.get("metadata") or {}
+        self.media_id = item["id"]
+        self.source_path = item["source_path"]
+        self.duration = float(item.get("duration_seconds") or metadata.get("durationSeconds") or 0)
+        self.directory = output_dir(self.media_id, metadata.get("scannerSignature"))
+        self.tile_height = _tile_height(metadata)
+        self.thumbnails = max(int(self.duration // INTERVAL_SECONDS) + 1, 1)
+        self.per_sheet = COLUMNS * ROWS
+        self.sheets = (self.thumbnails + self.per_sheet - 1) // self.per_sheet
+
+    def missing_sheets(self) -> List[int]:
+        return [index for index in range(self.sheets) if not (self.directory / _sheet_name(index)).is_file()]
+
+    def render_sheet(self, index: int) -> None:
+        start = index * self.per_sheet * INTERVAL_SECONDS
+        span = self.per_sheet * INTERVAL_SECONDS
+        target = self.directory / _sheet_name(index)
+        partial = target.with_name(f".{target.name}")
+        scale = f"scale={TILE_WIDTH}:{self.tile_height}"
+        run_ffmpeg(
+            [
+                "-ss", str(start), "-t", str(span),
+                "-i", self.source_path,
+                "-an", "-sn",
+                "-vf", f"fps=1/{INTERVAL_SECONDS},{scale},tile={COLUMNS}x{ROWS}",
+                "-frames:v", "1", "-update", "1", "-threads", "1",
+                "-f", "image2", "-c:v", "libwebp" if IMAGE_FORMAT == "webp" else "mjpeg",
+                str(partial),
+            ],
+            log_path=self.directory / f".{target.stem}.log",
+        )
+        os.replace(partial, target)
+
+    def write_index(self) -> None:
+        cues = ["WEBVTT", ""]
+        for thumb in range(self.thumbnails):
+            sheet, position = divmod(thumb, self.per_sheet)
+            row, column = divmod(position, COLUMNS)
+            start = thumb * INTERVAL_SECONDS
+            end = min(start + INTERVAL_SECONDS, self.duration) if self.duration else start + INTERVAL_SECONDS
+            if end <= start:
+                continue
+            cues.append(f"{_vtt_time(start)} --> {_vtt_time(end)}")
+            cues.append(
+                f"{_sheet_name(sheet)}#xywh={column * TILE_WIDTH},{row * self.tile_height},"
+                f"{TILE_WIDTH},{self.tile_height}"
+            )
+            cues.append("")
+        manifest = {
+            "interval": INTERVAL_SECONDS,
+            "tile_width": TILE_WIDTH,
+            "tile_height": self.tile_height,
+            "columns": COLUMNS,
+            "rows": ROWS,
+            "sheets": self.sheets,
+            "thumbnails": self.thumbnails,
+            "format": IMAGE_FORMAT,
+        }
+        (self.directory / MANIFEST_NAME).write_text(json.dumps(manifest), encoding="utf-8")
+        partial = self.directory / f".{INDEX_NAME}"
+        partial.write_text("\n".join(cues), encoding="utf-8")
+        os.replace(partial, self.directory / INDEX_NAME)
+
+
+def _pending_items(categories: Optional[Sequence[str]], limit: Optional[int]) -> List[Dict[str, Any]]:
+    category_filter = ""
+    params: List[Any] = []
+    if categories:
+        category_filter = "AND metadata->>'category' = ANY(%s)"
+        params.append(list(categories))
+    with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+        cursor.execute(
+            f"""
+            SELECT id::text AS id, source_path, duration_seconds, metadata
+            FROM media_items
+            WHERE status = 'available' AND media_type = 'video' AND source_path IS NOT NULL
+              {category_filter}
+            ORDER BY created_at DESC
+            """,
+            params,
+        )
+        rows = cursor.fetchall() or []
+    pending = []
+    for row in rows:
+        signature = (row.get("metadata") or {}).get("scannerSignature")
+        if not (output_dir(row["id"], signature) / INDEX_NAME).is_file():
+            pending.append(row)
+            if limit and len(pending) >= limit:
+                break
+    return pending
+
+
+def generate_trickplay(
+    *,
+    categories: Optional[Sequence[str]] = None,
+    limit: Optional[int] = None,
+    media_ids: Optional[Sequence[str]] = None,
+) -> Dict[str, Any]:
+    """Generate missing sprite sheets; resumes partially generated videos."""
+    if FFMPEG_PATH is None:
+        raise RuntimeError("ffmpeg is not available on this server")
+
+    items = _pending_items(categories, None if media_ids else limit)
+    if media_ids:
+        wanted = {str(media_id) for media_id in media_ids}
+        items = [item for item in items if item["id"] in wanted]
+
+    summary = {"videos": 0, "sheets": 0, "resumed": 0, "skipped_no_duration": 0, "failed": 0}
+    plans: List[_Plan] = []
+    for item in items:
+        plan = _Plan(item)
+        if not plan.duration:
+            summary["skipped_no_duration"] += 1
+            continue
+        plan.directory.mkdir(parents=True, exist_ok=True)
+        for stale in plan.directory.parent.iterdir():
+            if stale != plan.directory:
+                shutil.rmtree(stale, ignore_errors=True)
+        if len(plan.missing_sheets()) < plan.sheets:
+            summary["resumed"] += 1
+        plans.append(plan)
+
+    tasks: List[Tuple[_Plan, int]] = [(plan, index) for plan in plans for index in plan.missing_sheets()]
+    failed: set = set()
+
+    def _render(task: Tuple[_Plan, int]) -> Optional[str]:
+        plan, index = task
+        if plan.media_id in failed:
+            return plan.media_id
+        try:
+            plan.render_sheet(index)
+            return None
+        except (FfmpegError, OSError) as exc:
+            logger.warning("Trickplay sheet %d failed for %s: %s", index, plan.media_id, exc)
+            failed.add(plan.media_id)
+            return plan.media_id
+
+    with ThreadPoolExecutor(max_workers=max(CPU_BUDGET, 1), thread_name_prefix="watch2-trickplay") as pool:
+        for result in pool.map(_render, tasks):
+            if result is None:
+                summary["sheets"] += 1
+
+    for plan in plans:
+        if plan.media_id in failed or plan.missing_sheets():
+            summary["failed"] += 1
+            continue
+        plan.write_index()
+        summary["videos"] += 1
+    return summary
+
+
+def trickplay_manifest(media_id: str, signature: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Manifest of a complete sprite set for the current source, if generated."""
+    directory = output_dir(media_id, signature)
+    if not (directory / INDEX_NAME).is_file():
+        return None
+    try:
+        manifest = json.loads((directory / MANIFEST_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    manifest["rendition"] = directory.name
+    return manifest
+
+
+def resolve(media_id: str, rendition: str, filename: str) -> Optional[Path]:
+    """Path of a generated sheet or index; ``None`` for unknown names."""
+    if not all(_SAFE_NAME.match(part or "") for part in (str(media_id), rendition, filename)):
+        return None
+    path = TRICKPLAY_ROOT / str(media_id) / rendition / filename
+    return path if path.is_file() else None
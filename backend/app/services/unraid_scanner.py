@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import logging
+import os
+from dataclasses import replace
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.services.media_maintenance import (
+    MediaMaintenanceError,
+    _select_categories,
+    scan_categories,
+)
+from config_loader import MediaCategory, load_media_config
+
+logger = logging.getLogger(__name__)
+
+DRIVE_PREFIXES = ("T:/", "T:\\")
+DEFAULT_T_DRIVE_PATH = "T:/"
+DEFAULT_UNRAID_MEDIA_PATH = "/mnt/user/media"
+
+
+class UnifiedUnraidScanner:
+    """Scan the Unraid media share in-process using the maintenance pipeline.
+
+    Category roots in ``config/watch_media_dirs.yml`` are written against the
+    ``T:`` drive. Depending on the detected environment they are rebased
+    onto the direct drive path (local development) or the container mount
+    (Unraid), then scanned by ``EnhancedMediaScanner`` through
+    :func:`app.services.media_maintenance.scan_categories`, which also imports
+    the results into ``media_items`` unless ``dry_run`` is set.
+    """
+
+    def __init__(self, environ: Optional[Dict[str, str]] = None):
+        self.environ = dict(os.environ if environ is None else environ)
+        self.environment = self.detect_environment()
+
+    def detect_environment(self) -> Dict[str, Any]:
+        env_type = self.environ.get("ENV_TYPE", "unknown")
+        access_method = self.environ.get("UNRAID_ACCESS_METHOD", "unknown")
+        t_drive_path = self.environ.get("T_DRIVE_PATH", DEFAULT_T_DRIVE_PATH)
+        unraid_path = self.environ.get("UNRAID_MEDIA_PATH", DEFAULT_UNRAID_MEDIA_PATH)
+
+        if env_type == "local" and access_method == "direct_scanner":
+            return {
+                "type": "local",
+                "method": "direct_scanner",
+                "description": "Local development with direct T: drive access",
+                "media_root": t_drive_path,
+            }
+        if env_type == "unraid" and access_method == "container_mount":
+            return {
+                "type": "unraid",
+                "method": "container_mount",
+                "description": "Unraid production with container mount",
+                "media_root": unraid_path,
+            }
+
+        if os.path.exists(t_drive_path):
+            media_root = t_drive_path
+        elif os.path.exists(unraid_path):
+            media_root = unraid_path
+        else:
+            media_root = t_drive_path
+        return {
+            "type": "fallback",
+            "method": "auto_detect",
+            "description": "Auto-detection fallback",
+            "media_root": media_root,
+        }
+
+    def resolve_root(self, root_path: str) -> str:
+        """Rebase a ``T:``-relative category root onto the detected media root."""
+        for prefix in DRIVE_PREFIXES:
+            if root_path.startswith(prefix):
+                relative = root_path[len(prefix):].lstrip("/\\")
+                return os.path.join(self.environment["media_root"], relative)
+        return root_path
+
+    def build_categories(self, requested: Optional[Sequence[str]] = None) -> List[MediaCategory]:
+        config = load_media_config()
+        selected = _select_categories(config.categories, requested)
+        return [replace(category, root_path=self.resolve_root(category.root_path)) for category in selected]
+
+    def scan(
+        self,
+        *,
+        categories: Optional[Sequence[str]] = None,
+        dry_run: bool = False,
+        limit: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        category_models = self.build_categories(categories)
+        if not category_models:
+            raise MediaMaintenanceError("No categories matched the requested selection")
+
+        logger.info(
+            "Unraid scan via %s rooted at %s (%d categories, dry_run=%s)",
+            self.environment["method"],
+            self.environment["media_root"],
+            len(category_models),
+            dry_run,
+        )
+        summary = scan_categories(
+            category_models,
+            dry_run=dry_run,
+            limit=limit,
+            config_version=load_media_config().version,
+        )
+        totals = summary["totals"]
+        return {
+            "environment": self.environment,
+            "scan_method": self.environment["method"],
+            "total_files_found": totals["files_found"],
+            "files_added": totals["added"] if not dry_run else 0,
+            "files_updated": totals["updated"] if not dry_run else 0,
+            "directories_scanned": sum(
+                1 for result in summary["categories"].values() if result["root_exists"]
+            ),
+            "scan_results": {
+                key: result["files_found"] for key, result in summary["categories"].items()
+            },
+            "summary": summary,
+        }
+
+
+def run_unraid_scan(
+    *,
+    categories: Optional[Sequence[str]] = None,
+    dry_run: bool = False,
+    limit: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Entry point used by the background job runner."""
+    return UnifiedUnraidScanner().scan(categories=categories, dry_run=dry_run, limit=limit)
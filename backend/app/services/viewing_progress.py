@@ -0,0 +1,459 @@
+"""Write-behind buffer for viewing progress heartbeats.
+
+Players report their position every few seconds. Heartbeats are coalesced
+per ``(user_id, media_id)`` in a buffer and written to ``viewing_history`` in
+batches: every ``PROGRESS_FLUSH_INTERVAL`` seconds, when a session ends and
+at interpreter exit. Resume positions are served from the buffer (or the
+recently-flushed cache) and only fall back to Postgres on a miss.
+
+The buffer is in-process by default. When ``REDIS_URL`` is set and the
+``redis`` package is installed it lives in Redis instead, so every worker
+sees the same pending state and any worker may flush it.
+
+``watch_duration`` in a heartbeat is the number of seconds watched since the
+previous heartbeat; the buffer sums these deltas and the flush adds them to
+the stored total.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import threading
+from contextlib import closing
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+from app.core.cache import TTLCache
+from app.services.viewing_stats import record_daily_stats
+from postgres_config import get_db_connection
+
+try:  # Optional dependency
+    import redis
+except ImportError:  # pragma: no cover - redis is optional
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_SECONDS = float(os.getenv("PROGRESS_FLUSH_INTERVAL", "10"))
+FLUSH_BATCH_SIZE = int(os.getenv("PROGRESS_FLUSH_BATCH", "500"))
+BUFFER_BACKEND = os.getenv("PROGRESS_BUFFER_BACKEND", "auto").lower()
+RESUME_CACHE_SIZE = int(os.getenv("PROGRESS_RESUME_CACHE_SIZE", "10000"))
+RESUME_CACHE_TTL_SECONDS = float(os.getenv("PROGRESS_RESUME_CACHE_TTL", "3600"))
+MAX_HEARTBEAT_DELTA_SECONDS = 300
+COMPLETION_THRESHOLD = 90.0
+
+Key = Tuple[str, str]
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+@dataclass
+class ProgressEntry:
+    """Coalesced state for one ``(user_id, media_id)`` pair."""
+
+    user_id: str
+    media_id: str
+    current_position: int = 0
+    progress_percentage: float = 0.0
+    completed: str = "false"
+    device_info: Optional[str] = None
+    quality: Optional[str] = None
+    watch_delta: int = 0
+    started_at: datetime = field(default_factory=_utcnow)
+    last_watched_at: datetime = field(default_factory=_utcnow)
+
+    @property
+    def key(self) -> Key:
+        return (self.user_id, self.media_id)
+
+    def merge(self, newer: "ProgressEntry") -> None:
+        """Fold a later heartbeat into this entry (last write wins, deltas add)."""
+        self.current_position = newer.current_position
+        self.progress_percentage = newer.progress_percentage
+        self.completed = newer.completed
+        self.device_info = newer.device_info or self.device_info
+        self.quality = newer.quality or self.quality
+        self.watch_delta += newer.watch_delta
+        self.last_watched_at = newer.last_watched_at
+
+    def to_resume(self, source: str) -> Dict[str, Any]:
+        return {
+            "media_id": self.media_id,
+            "current_position": self.current_position,
+            "progress_percentage": self.progress_percentage,
+            "completed": self.completed,
+            "last_watched_at": self.last_watched_at.isoformat(),
+            "source": source,
+        }
+
+
+def build_entry(user_id: Any, payload: Dict[str, Any]) -> ProgressEntry:
+    """Normalise a validated heartbeat payload into a :class:`ProgressEntry`."""
+    progress = max(0.0, min(float(payload.get("progress_percentage") or 0.0), 100.0))
+    completed = payload.get("completed") or "false"
+    if progress >= COMPLETION_THRESHOLD and completed == "false":
+        completed = "true"
+    delta = int(payload.get("watch_duration") or 0)
+    return ProgressEntry(
+        user_id=str(user_id),
+        media_id=str(payload["media_id"]),
+        current_position=max(int(payload.get("current_position") or 0), 0),
+        progress_percentage=progress,
+        completed=completed,
+        device_info=payload.get("device_info"),
+        quality=payload.get("quality"),
+        watch_delta=max(0, min(delta, MAX_HEARTBEAT_DELTA_SECONDS)),
+    )
+
+
+class InMemoryProgressBuffer:
+    """Per-process buffer; pending entries are lost if the process is killed."""
+
+    backend = "memory"
+
+    def __init__(self):
+        self._pending: Dict[Key, ProgressEntry] = {}
+        self._lock = threading.Lock()
+
+    def record(self, entry: ProgressEntry) -> None:
+        with self._lock:
+            existing = self._pending.get(entry.key)
+            if existing is None:
+                self._pending[entry.key] = entry
+            else:
+                existing.merge(entry)
+
+    def peek(self, key: Key) -> Optional[ProgressEntry]:
+        with self._lock:
+            return self._pending.get(key)
+
+    def drain(self, keys: Optional[List[Key]] = None, limit: int = FLUSH_BATCH_SIZE) -> List[ProgressEntry]:
+        with self._lock:
+            if keys is None:
+                keys = list(self._pending)[:limit]
+            return [entry for entry in (self._pending.pop(key, None) for key in keys) if entry]
+
+    def restore(self, entries: List[ProgressEntry]) -> None:
+        """Put entries back after a failed flush, merging newer heartbeats on top."""
+        with self._lock:
+            for entry in entries:
+                newer = self._pending.get(entry.key)
+                if newer is not None:
+                    entry.merge(newer)
+                self._pending[entry.key] = entry
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+
+class RedisProgressBuffer:
+    """Buffer shared by all workers through Redis hashes plus a dirty set."""
+
+    backend = "redis"
+    DIRTY_KEY = "watch2:progress:dirty"
+    ENTRY_TTL_SECONDS = 7 * 24 * 3600
+
+    def __init__(self, client):
+        self.client = client
+
+    @staticmethod
+    def _hash_key(key: Key) -> str:
+        return f"watch2:progress:{key[0]}:{key[1]}"
+
+    def record(self, entry: ProgressEntry) -> None:
+        hash_key = self._hash_key(entry.key)
+        fields = {
+            "user_id": entry.user_id,
+            "media_id": entry.media_id,
+            "current_position": entry.current_position,
+            "progress_percentage": entry.progress_percentage,
+            "completed": entry.completed,
+            "last_watched_at": entry.last_watched_at.isoformat(),
+        }
+        if entry.device_info:
+            fields["device_info"] = entry.device_info
+        if entry.quality:
+            fields["quality"] = entry.quality
+        pipe = self.client.pipeline()
+        pipe.hsetnx(hash_key, "started_at", entry.started_at.isoformat())
+        pipe.hset(hash_key, mapping=fields)
+        pipe.hincrby(hash_key, "watch_delta", entry.watch_delta)
+        pipe.expire(hash_key, self.ENTRY_TTL_SECONDS)
+        pipe.sadd(self.DIRTY_KEY, hash_key)
+        pipe.execute()
+
+    @staticmethod
+    def _from_hash(data: Dict[Any, Any]) -> Optional[ProgressEntry]:
+        if not data:
+            return None
+        data = {
+            (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+            for k, v in data.items()
+        }
+        if "user_id" not in data or "media_id" not in data:
+            return None
+        return ProgressEntry(
+            user_id=data["user_id"],
+            media_id=data["media_id"],
+            current_position=int(float(data.get("current_position", 0))),
+            progress_percentage=float(data.get("progress_percentage", 0.0)),
+            completed=data.get("completed", "false"),
+            device_info=data.get("device_info"),
+            quality=data.get("quality"),
+            watch_delta=int(data.get("watch_delta", 0)),
+            started_at=datetime.fromisoformat(data["started_at"]) if data.get("started_at") else _utcnow(),
+            last_watched_at=datetime.fromisoformat(data["last_watched_at"]) if data.get("last_watched_at") else _utcnow(),
+        )
+
+    def peek(self, key: Key) -> Optional[ProgressEntry]:
+        return self._from_hash(self.client.hgetall(self._hash_key(key)))
+
+    def drain(self, keys: Optional[List[Key]] = None, limit: int = FLUSH_BATCH_SIZE) -> List[ProgressEntry]:
+        if keys is None:
+            hash_keys = self.client.spop(self.DIRTY_KEY, limit) or []
+        else:
+            hash_keys = [self._hash_key(key) for key in keys]
+            self.client.srem(self.DIRTY_KEY, *hash_keys)
+        entries = []
+        for hash_key in hash_keys:
+            # Read the entry and reset its delta atomically so heartbeats that
+            # arrive during the flush are counted by the next one.
+            pipe = self.client.pipeline(transaction=True)
+            pipe.hgetall(hash_key)
+            pipe.hset(hash_key, "watch_delta", 0)
+            data, _ = pipe.execute()
+            entry = self._from_hash(data)
+            if entry is not None:
+                entries.append(entry)
+        return entries
+
+    def restore(self, entries: List[ProgressEntry]) -> None:
+        if not entries:
+            return
+        pipe = self.client.pipeline()
+        for entry in entries:
+            if entry.watch_delta:
+                pipe.hincrby(self._hash_key(entry.key), "watch_delta", entry.watch_delta)
+            pipe.sadd(self.DIRTY_KEY, self._hash_key(entry.key))
+        pipe.execute()
+
+    def pending_count(self) -> int:
+        return int(self.client.scard(self.DIRTY_KEY))
+
+
+def _create_buffer():
+    redis_url = os.getenv("REDIS_URL")
+    if BUFFER_BACKEND != "memory" and redis is not None and redis_url:
+        try:
+            client = redis.Redis.from_url(redis_url, socket_timeout=2)
+            client.ping()
+            logger.info("Viewing progress buffer using Redis at %s", redis_url)
+            return RedisProgressBuffer(client)
+        except Exception as exc:
+            logger.warning("Redis unavailable for progress buffer, using memory: %s", exc)
+    return InMemoryProgressBuffer()
+
+
+_UPDATE_SQL = """
+    UPDATE viewing_history AS vh
+    SET current_position = v.current_position,
+        progress_percentage = v.progress_percentage,
+        watch_duration = COALESCE(vh.watch_duration, 0) + v.watch_delta,
+        completed = CASE WHEN prev.completed = 'true' THEN 'true' ELSE v.completed END,
+        device_info = COALESCE(v.device_info, vh.device_info),
+        quality = COALESCE(v.quality, vh.quality),
+        last_watched_at = v.last_watched_at
+    FROM (VALUES %s) AS v (user_id, media_id, current_position, progress_percentage,
+                           watch_delta, completed, device_info, quality, last_watched_at)
+    CROSS JOIN LATERAL (
+        SELECT latest.id, latest.completed
+        FROM viewing_history AS latest
+        WHERE latest.user_id::text = v.user_id AND latest.media_id = v.media_id
+        ORDER BY latest.last_watched_at DESC
+        LIMIT 1
+    ) AS prev
+    WHERE vh.id = prev.id
+    RETURNING v.user_id, v.media_id, prev.completed AS previous_completed
+"""
+_UPDATE_TEMPLATE = "(%s, %s, %s::int, %s::float8, %s::int, %s, %s, %s, %s::timestamptz)"
+
+_INSERT_SQL = """
+    INSERT INTO viewing_history (
+        user_id, media_id, started_at, last_watched_at, watch_duration,
+        progress_percentage, current_position, completed, device_info, quality
+    ) VALUES %s
+"""
+
+
+def write_batch(cursor, entries: List[ProgressEntry]) -> None:
+    """Persist coalesced entries: one batched UPDATE, one INSERT for new pairs,
+    then the matching daily aggregate deltas."""
+    if not entries:
+        return
+    # Touch rows in a fixed key order so concurrent flushes cannot deadlock.
+    entries = sorted(entries, key=lambda e: e.key)
+    returned = execute_values(
+        cursor,
+        _UPDATE_SQL,
+        [
+            (
+                e.user_id, e.media_id, e.current_position, e.progress_percentage,
+                e.watch_delta, e.completed, e.device_info, e.quality, e.last_watched_at,
+            )
+            for e in entries
+        ],
+        template=_UPDATE_TEMPLATE,
+        page_size=len(entries),
+        fetch=True,
+    )
+    previous = {(row["user_id"], row["media_id"]): row["previous_completed"] for row in returned or []}
+    new_rows = [
+        (
+            e.user_id, e.media_id, e.started_at, e.last_watched_at, e.watch_delta,
+            e.progress_percentage, e.current_position, e.completed, e.device_info, e.quality,
+        )
+        for e in entries
+        if e.key not in previous
+    ]
+    if new_rows:
+        execute_values(cursor, _INSERT_SQL, new_rows, page_size=len(new_rows))
+
+    record_daily_stats(cursor, [
+        (
+            e.last_watched_at.date(), e.user_id, e.media_id, e.watch_delta,
+            int(e.completed == "true" and previous.get(e.key) != "true"),
+            e.progress_percentage,
+        )
+        for e in entries
+    ])
+
+
+class ProgressTracker:
+    """Coordinates the buffer, the resume cache and the periodic flusher."""
+
+    def __init__(self, buffer=None):
+        self.buffer = buffer or _create_buffer()
+        self._resume_cache = TTLCache(maxsize=RESUME_CACHE_SIZE, ttl=RESUME_CACHE_TTL_SECONDS)
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self._flusher_pid: Optional[int] = None
+        self._stop = threading.Event()
+        self.stats = {"heartbeats": 0, "flushes": 0, "rows_flushed": 0, "flush_errors": 0}
+
+    def record(self, entry: ProgressEntry) -> None:
+        self._ensure_flusher()
+        self.buffer.record(entry)
+        self._resume_cache.pop(entry.key)
+        self.stats["heartbeats"] += 1
+
+    def resume(self, user_id: Any, media_id: Any) -> Optional[Dict[str, Any]]:
+        key = (str(user_id), str(media_id))
+        entry = self.buffer.peek(key)
+        if entry is not None:
+            return entry.to_resume("buffer")
+        cached = self._resume_cache.get(key)
+        if cached is not None:
+            return cached
+        resume = self._load_resume(key)
+        if resume is not None:
+            self._resume_cache.set(key, resume)
+        return resume
+
+    @staticmethod
+    def _load_resume(key: Key) -> Optional[Dict[str, Any]]:
+        with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+            cursor.execute(
+                """
+                SELECT media_id, current_position, progress_percentage, completed, last_watched_at
+                FROM viewing_history
+                WHERE user_id::text = %s AND media_id = %s
+                ORDER BY last_watched_at DESC
+                LIMIT 1
+                """,
+                key,
+            )
+            row = cursor.fetchone()
+        if not row:
+            return None
+        return {
+            "media_id": row["media_id"],
+            "current_position": row["current_position"] or 0,
+            "progress_percentage": row["progress_percentage"] or 0.0,
+            "completed": row["completed"] or "false",
+            "last_watched_at": row["last_watched_at"].isoformat() if row["last_watched_at"] else None,
+            "source": "database",
+        }
+
+    def flush(self, keys: Optional[List[Key]] = None) -> int:
+        """Write pending entries (all of them, or only ``keys``) to Postgres."""
+        flushed = 0
+        with self._flush_lock:
+            while True:
+                entries = self.buffer.drain(keys)
+                if not entries:
+                    break
+                try:
+                    with closing(get_db_connection()) as conn, closing(conn.cursor()) as cursor:
+                        write_batch(cursor, entries)
+                        conn.commit()
+                except Exception as exc:
+                    self.stats["flush_errors"] += 1
+                    logger.warning("Viewing progress flush failed (%d entries): %s", len(entries), exc)
+                    self.buffer.restore(entries)
+                    break
+                for entry in entries:
+                    self._resume_cache.set(entry.key, entry.to_resume("buffer"))
+                flushed += len(entries)
+                self.stats["flushes"] += 1
+                self.stats["rows_flushed"] += len(entries)
+                if keys is not None or len(entries) < FLUSH_BATCH_SIZE:
+                    break
+        return flushed
+
+    def end_session(self, user_id: Any, media_id: Any) -> int:
+        return self.flush([(str(user_id), str(media_id))])
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is not None and self._flusher.is_alive() and self._flusher_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._flusher is not None and self._flusher.is_alive() and self._flusher_pid == os.getpid():
+                return
+            self._flusher = threading.Thread(target=self._run, name="watch2-progress-flush", daemon=True)
+            self._flusher_pid = os.getpid()
+            self._flusher.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(FLUSH_INTERVAL_SECONDS):
+            try:
+                self.flush()
+            except Exception as exc:
+                logger.warning("Viewing progress flusher error: %s", exc)
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception as exc:
+            logger.warning("Final viewing progress flush failed: %s", exc)
+
+    def buffer_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "backend": self.buffer.backend,
+            "pending": self.buffer.pending_count(),
+            "flush_interval_seconds": FLUSH_INTERVAL_SECONDS,
+            "resume_cache": self._resume_cache.stats(),
+        }
+
+
+tracker = ProgressTracker()
+atexit.register(tracker.shutdown)
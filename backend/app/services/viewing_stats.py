@@ -0,0 +1,256 @@
+"""Watch-time statistics backed by incrementally maintained daily aggregates.
+
+The viewing progress flush calls :func:`record_daily_stats` in its own
+transaction with the watch-time deltas it just wrote, so the
+``viewing_daily_user_media`` and ``viewing_daily_media`` tables (migration
+005) stay in step with ``viewing_history`` without ever re-aggregating it.
+Queries here read those tables only: per user (``ViewingStats``), per media
+(``MostWatchedContent``) and per category.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from collections import defaultdict
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+from app.core.cache import TTLCache
+from app.schemas.viewing_history import MostWatchedContent, ViewingStats
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOP_DAYS = 7
+MAX_TOP_LIMIT = 200
+
+_category_cache = TTLCache(
+    maxsize=int(os.getenv("VIEWING_STATS_CATEGORY_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("VIEWING_STATS_CATEGORY_CACHE_TTL", "3600")),
+)
+
+# (day, user_id, media_id, watch_seconds, completions, progress_percentage)
+DailyDelta = Tuple[date, str, str, int, int, float]
+
+_RECORD_SQL = """
+    WITH deltas (day, user_id, media_id, category, watch_seconds, completions, max_progress) AS (
+        VALUES %s
+    ),
+    user_rows AS (
+        INSERT INTO viewing_daily_user_media AS u (day, user_id, media_id, watch_seconds, completions, max_progress)
+        SELECT day, user_id, media_id, watch_seconds, completions, max_progress FROM deltas
+        ORDER BY day, user_id, media_id
+        ON CONFLICT (day, user_id, media_id) DO UPDATE SET
+            watch_seconds = u.watch_seconds + EXCLUDED.watch_seconds,
+            completions = u.completions + EXCLUDED.completions,
+            max_progress = GREATEST(u.max_progress, EXCLUDED.max_progress)
+        RETURNING u.day, u.user_id, u.media_id, (u.xmax = 0) AS inserted
+    )
+    INSERT INTO viewing_daily_media AS m (day, media_id, category, watch_seconds, viewers, completions, max_progress)
+    SELECT d.day, d.media_id, MAX(d.category), SUM(d.watch_seconds),
+           COUNT(*) FILTER (WHERE r.inserted), SUM(d.completions), MAX(d.max_progress)
+    FROM deltas AS d
+    JOIN user_rows AS r ON r.day = d.day AND r.user_id = d.user_id AND r.media_id = d.media_id
+    GROUP BY d.day, d.media_id
+    ORDER BY d.day, d.media_id
+    ON CONFLICT (day, media_id) DO UPDATE SET
+        category = EXCLUDED.category,
+        watch_seconds = m.watch_seconds + EXCLUDED.watch_seconds,
+        viewers = m.viewers + EXCLUDED.viewers,
+        completions = m.completions + EXCLUDED.completions,
+        max_progress = GREATEST(m.max_progress, EXCLUDED.max_progress)
+"""
+_RECORD_TEMPLATE = "(%s::date, %s, %s, %s, %s::bigint, %s::int, %s::float8)"
+
+
+def _resolve_categories(cursor, media_ids: Iterable[str]) -> Dict[str, str]:
+    categories: Dict[str, str] = {}
+    missing = []
+    for media_id in media_ids:
+        cached = _category_cache.get(media_id)
+        if cached is None:
+            missing.append(media_id)
+        else:
+            categories[media_id] = cached
+    if missing:
+        cursor.execute(
+            "SELECT id::text AS media_id, media_type FROM media_items WHERE id::text = ANY(%s)",
+            (missing,),
+        )
+        for row in cursor.fetchall() or []:
+            category = row["media_type"] or "uncategorized"
+            categories[row["media_id"]] = category
+            _category_cache.set(row["media_id"], category)
+    return categories
+
+
+def record_daily_stats(cursor, deltas: List[DailyDelta]) -> None:
+    """Fold flushed watch deltas into the daily aggregate tables.
+
+    Runs inside a savepoint so a database without migration 005 still
+    persists the progress rows themselves.
+    """
+    merged: Dict[Tuple[date, str, str], List[Any]] = defaultdict(lambda: [0, 0, 0.0])
+    for day, user_id, media_id, watch_seconds, completions, progress in deltas:
+        if not watch_seconds and not completions and not progress:
+            continue
+        bucket = merged[(day, user_id, media_id)]
+        bucket[0] += watch_seconds
+        bucket[1] += completions
+        bucket[2] = max(bucket[2], progress)
+    if not merged:
+        return
+
+    cursor.execute("SAVEPOINT viewing_daily_stats")
+    try:
+        categories = _resolve_categories(cursor, {key[2] for key in merged})
+        # Upserts lock rows in key order, so concurrent flushes cannot deadlock.
+        rows = [
+            (day, user_id, media_id, categories.get(media_id, "uncategorized"), *values)
+            for (day, user_id, media_id), values in sorted(merged.items())
+        ]
+        execute_values(cursor, _RECORD_SQL, rows, template=_RECORD_TEMPLATE, page_size=len(rows))
+        cursor.execute("RELEASE SAVEPOINT viewing_daily_stats")
+    except Exception as exc:
+        cursor.execute("ROLLBACK TO SAVEPOINT viewing_daily_stats")
+        logger.warning("Daily viewing stats update skipped: %s", exc)
+
+
+def get_user_stats(cursor, user_id: Any) -> Dict[str, Any]:
+    """``ViewingStats`` for one user."""
+    cursor.execute(
+        """
+        SELECT COALESCE(SUM(watch_seconds), 0) AS total_watch_time,
+               COUNT(DISTINCT media_id) AS total_videos,
+               COUNT(DISTINCT media_id) FILTER (WHERE completions > 0) AS completed_videos,
+               COALESCE(SUM(watch_seconds) FILTER (WHERE day > CURRENT_DATE - %s), 0) AS weekly_watch_time
+        FROM viewing_daily_user_media
+        WHERE user_id = %s
+        """,
+        (DEFAULT_TOP_DAYS, str(user_id)),
+    )
+    row = cursor.fetchone() or {}
+    total_videos = int(row.get("total_videos") or 0)
+    completed_videos = int(row.get("completed_videos") or 0)
+    return ViewingStats(
+        total_watch_time=int(row.get("total_watch_time") or 0),
+        total_videos=total_videos,
+        completed_videos=completed_videos,
+        weekly_watch_time=int(row.get("weekly_watch_time") or 0),
+        completion_rate=round(completed_videos * 100.0 / total_videos, 2) if total_videos else 0.0,
+    ).model_dump()
+
+
+def _file_size(metadata: Any) -> int:
+    if isinstance(metadata, dict):
+        for key in ("fileSize", "sizeBytes", "size"):
+            value = metadata.get(key)
+            if value not in (None, ""):
+                try:
+                    return int(float(value))
+                except (TypeError, ValueError):
+                    continue
+    return 0
+
+
+def get_most_watched(
+    cursor,
+    *,
+    days: int = DEFAULT_TOP_DAYS,
+    limit: int = 50,
+    category: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Top titles by watch time over the last ``days`` days (``MostWatchedContent``)."""
+    limit = max(1, min(int(limit), MAX_TOP_LIMIT))
+    filters = ["day > CURRENT_DATE - %s"]
+    params: List[Any] = [int(days)]
+    if category:
+        filters.append("category = %s")
+        params.append(category)
+    params.append(limit)
+    cursor.execute(
+        f"""
+        WITH top AS (
+            SELECT media_id,
+                   MAX(category) AS category,
+                   SUM(watch_seconds) AS total_watch_time,
+                   SUM(viewers) AS watch_count,
+                   MAX(max_progress) AS max_progress
+            FROM viewing_daily_media
+            WHERE {' AND '.join(filters)}
+            GROUP BY media_id
+            ORDER BY total_watch_time DESC
+            LIMIT %s
+        )
+        SELECT top.*, mi.title, mi.source_path, mi.metadata
+        FROM top
+        LEFT JOIN media_items mi ON mi.id::text = top.media_id
+        ORDER BY top.total_watch_time DESC
+        """,
+        params,
+    )
+    items = []
+    for row in cursor.fetchall() or []:
+        source_path = row.get("source_path") or ""
+        items.append(MostWatchedContent(
+            media_id=row["media_id"],
+            filename=os.path.basename(source_path) or row.get("title") or row["media_id"],
+            total_watch_time=int(row["total_watch_time"] or 0),
+            watch_count=int(row["watch_count"] or 0),
+            max_progress=float(row["max_progress"] or 0.0),
+            category=row["category"] or "uncategorized",
+            file_size=_file_size(row.get("metadata")),
+        ).model_dump())
+    return items
+
+
+def get_category_stats(cursor, *, days: int = DEFAULT_TOP_DAYS) -> Dict[str, Dict[str, int]]:
+    cursor.execute(
+        """
+        SELECT category,
+               SUM(watch_seconds) AS watch_seconds,
+               SUM(viewers) AS viewers,
+               SUM(completions) AS completions
+        FROM viewing_daily_media
+        WHERE day > CURRENT_DATE - %s
+        GROUP BY category
+        """,
+        (int(days),),
+    )
+    return {
+        row["category"]: {
+            "watch_seconds": int(row["watch_seconds"] or 0),
+            "viewers": int(row["viewers"] or 0),
+            "completions": int(row["completions"] or 0),
+        }
+        for row in cursor.fetchall() or []
+    }
+
+
+def get_watch_time(cursor, *, days: int = DEFAULT_TOP_DAYS) -> int:
+    cursor.execute(
+        "SELECT COALESCE(SUM(watch_seconds), 0) AS total FROM viewing_daily_media WHERE day > CURRENT_DATE - %s",
+        (int(days),),
+    )
+    row = cursor.fetchone()
+    return int(row["total"]) if row else 0
+
+
+def get_dashboard_activity(cursor, *, top_limit: int = 10) -> Dict[str, Any]:
+    """Weekly watch time and top titles for the analytics dashboard.
+
+    Returns zeros when the aggregate tables are not installed yet.
+    """
+    cursor.execute("SAVEPOINT viewing_dashboard")
+    try:
+        activity = {
+            "weekly_watch_time_seconds": get_watch_time(cursor),
+            "top_media": get_most_watched(cursor, limit=top_limit),
+        }
+        cursor.execute("RELEASE SAVEPOINT viewing_dashboard")
+        return activity
+    except Exception as exc:
+        cursor.execute("ROLLBACK TO SAVEPOINT viewing_dashboard")
+        logger.warning("Viewing stats unavailable for dashboard: %s", exc)
+        return {"weekly_watch_time_seconds": 0, "top_media": []}
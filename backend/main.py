@@ -18,16 +18,26 @@ from app.api.v1.endpoints.settings_flask import router as settings_router
 from app.api.v1.endpoints.analytics_flask import router as analytics_router
 from app.api.v1.endpoints.system_flask import router as system_router
 from app.api.v1.endpoints.admin_flask import router as admin_router
+from app.api.v1.endpoints.viewing_history_flask import router as viewing_history_router
 import app.api.v1.endpoints.media_flask as media_flask_module
 import app.api.v1.endpoints.settings_flask as settings_flask_module
 STRUCTURED_ENDPOINTS_AVAILABLE = True
 from config_loader import load_media_config, ConfigError
+from app.core.authorization import get_current_user, init_token_revocation
+from app.core.compression import init_compression
+from app.core.json_provider import FastJSONProvider
+from app.services.analytics_rollups import discover_rollup_schema
+from app.services.catalog_index import start_catalog_index
+from app.services.catalog_version import start_catalog_version
+from app.services.media_search import search_index_available
+from app.services.system_settings import ensure_settings_schema
 
 def create_app():
     '''Application factory'''
     load_dotenv()
     
     app = Flask(__name__)
+    app.json = FastJSONProvider(app)
     
     # Configuration
     app.config['JSON_SORT_KEYS'] = False
@@ -77,13 +87,21 @@ def create_app():
         app,
         resources={r"/api/*": {"origins": default_cors_origins}},
         supports_credentials=True,
-        allow_headers=['Content-Type', 'Authorization', 'X-Requested-With'],
-        methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS', 'HEAD'],
-        expose_headers=['Content-Type', 'Content-Length', 'Accept-Ranges', 'Content-Range', 'Range']
+        allow_headers=['Content-Type', 'Authorization', 'X-Requested-With', 'If-None-Match', 'X-Filename', 'X-Content-Type', 'Upload-Offset', 'Upload-Length'],
+        methods=['GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'HEAD'],
+        expose_headers=['Content-Type', 'Content-Length', 'Accept-Ranges', 'Content-Range', 'Range', 'ETag', 'Location', 'Upload-Offset', 'Upload-Length']
     )
     
     # Initialize extensions
     jwt = JWTManager(app)
+    init_token_revocation(jwt)
+
+    # One-time schema setup (previously repeated on every settings request)
+    ensure_settings_schema()
+    discover_rollup_schema()
+    search_index_available()
+    start_catalog_index()
+    start_catalog_version()
     
     # Security headers (relaxed for development)
     @app.after_request
@@ -97,6 +115,8 @@ def create_app():
             response.headers['Cross-Origin-Embedder-Policy'] = 'require-corp'
             response.headers['Cross-Origin-Opener-Policy'] = 'same-origin'
         return response
+
+    init_compression(app)
     
     # Register structured endpoints if available
     if STRUCTURED_ENDPOINTS_AVAILABLE:
@@ -108,7 +128,8 @@ def create_app():
         app.register_blueprint(analytics_router, url_prefix='/api/v1/analytics')
         app.register_blueprint(system_router, url_prefix='/api/v1/system')
         app.register_blueprint(admin_router, url_prefix='/api/v1/admin')
-        print("✅ Structured endpoints registered: auth, media, users, playlists, settings, analytics, system, admin")
+        app.register_blueprint(viewing_history_router, url_prefix='/api/v1/viewing-history')
+        print("✅ Structured endpoints registered: auth, media, users, playlists, settings, analytics, system, admin, viewing-history")
 
         app.add_url_rule(
             '/settings',
@@ -195,20 +216,9 @@ def create_app():
     @app.route('/api/v1/users/me')
     @jwt_required()
     def legacy_users_me():
-        from flask_jwt_extended import get_jwt_identity
-        from postgres_config import get_db_connection
-        
         try:
-            user_id = get_jwt_identity()
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT id, email, is_active, is_superuser, created_at
-                FROM users WHERE id = %s
-            """, (user_id,))
-            
-            user = cursor.fetchone()
+            # Served from token claims (or the cached user row for older tokens).
+            user = get_current_user()
             if not user:
                 return jsonify({"detail": "User not found"}), 404
             
@@ -217,7 +227,7 @@ def create_app():
                 "email": user['email'],
                 "is_active": user['is_active'],
                 "is_superuser": user['is_superuser'],
-                "created_at": user['created_at'].isoformat() if user['created_at'] else None,
+                "created_at": user['created_at'],
                 "full_name": user['email'],  # Use email as full_name for compatibility
                 "username": user['email']    # Use email as username for compatibility
             })
@@ -225,11 +235,6 @@ def create_app():
         except Exception as e:
             print(f"Legacy users/me error: {e}")
             return jsonify({"detail": "Internal server error"}), 500
-        finally:
-            if 'cursor' in locals():
-                cursor.close()
-            if 'conn' in locals():
-                conn.close()
     
     return app
 
@@ -0,0 +1,16 @@
+BEGIN;
+
+-- Per-user token version embedded in JWTs as the `tv` claim. Bumping it
+-- revokes every access token issued before the change.
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.tables
+        WHERE table_schema = 'public' AND table_name = 'users'
+    ) THEN
+        ALTER TABLE users
+            ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0;
+    END IF;
+END $$;
+
+COMMIT;
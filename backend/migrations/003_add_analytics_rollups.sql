@@ -0,0 +1,239 @@
+BEGIN;
+
+-- Precomputed library statistics for /api/v1/analytics/dashboard.
+-- Kept current by statement-level triggers on media_items and playlists, so
+-- ingestion, maintenance scans and deletes update them in the same
+-- transaction without the endpoint aggregating the catalog.
+CREATE TABLE IF NOT EXISTS media_category_rollups (
+    category TEXT PRIMARY KEY,
+    item_count BIGINT NOT NULL DEFAULT 0,
+    total_size_bytes BIGINT NOT NULL DEFAULT 0,
+    total_duration_seconds BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS media_daily_additions (
+    day DATE NOT NULL,
+    category TEXT NOT NULL,
+    item_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, category)
+);
+
+CREATE TABLE IF NOT EXISTS analytics_counters (
+    name TEXT PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+);
+
+-- Size is stored in media_items.metadata by the scanner/ingestion services.
+CREATE OR REPLACE FUNCTION media_item_size_bytes(metadata JSONB)
+RETURNS BIGINT
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT CASE
+        WHEN raw ~ '^[0-9]+(\.[0-9]+)?$' THEN raw::numeric::bigint
+        ELSE 0
+    END
+    FROM (
+        SELECT COALESCE(metadata->>'fileSize', metadata->>'sizeBytes', metadata->>'size') AS raw
+    ) AS source
+$$;
+
+-- Per-(category, day) change of the rollups; one array per statement.
+DO $$
+BEGIN
+    IF to_regtype('media_rollup_delta') IS NULL THEN
+        CREATE TYPE media_rollup_delta AS (
+            category TEXT,
+            day DATE,
+            cnt BIGINT,
+            size BIGINT,
+            duration BIGINT
+        );
+    END IF;
+END $$;
+
+-- Rows are upserted in key order, and category rollups before daily
+-- additions, so concurrent statements lock shared rows in the same order
+-- and cannot deadlock each other.
+CREATE OR REPLACE FUNCTION media_rollup_apply_deltas(deltas media_rollup_delta[])
+RETURNS VOID
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF deltas IS NULL THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO media_category_rollups AS r (category, item_count, total_size_bytes, total_duration_seconds, updated_at)
+    SELECT category, SUM(cnt), SUM(size), SUM(duration), NOW()
+    FROM unnest(deltas)
+    GROUP BY category
+    HAVING SUM(cnt) <> 0 OR SUM(size) <> 0 OR SUM(duration) <> 0
+    ORDER BY category
+    ON CONFLICT (category) DO UPDATE SET
+        item_count = r.item_count + EXCLUDED.item_count,
+        total_size_bytes = r.total_size_bytes + EXCLUDED.total_size_bytes,
+        total_duration_seconds = r.total_duration_seconds + EXCLUDED.total_duration_seconds,
+        updated_at = NOW();
+
+    INSERT INTO media_daily_additions AS d (day, category, item_count)
+    SELECT day, category, SUM(cnt)
+    FROM unnest(deltas)
+    GROUP BY day, category
+    HAVING SUM(cnt) <> 0
+    ORDER BY day, category
+    ON CONFLICT (day, category) DO UPDATE SET
+        item_count = d.item_count + EXCLUDED.item_count;
+END $$;
+
+-- One delta per (category, day) for the whole statement. Soft-deleted
+-- items (status = 'deleted') are not counted.
+CREATE OR REPLACE FUNCTION media_items_rollup_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    deltas media_rollup_delta[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(ROW(d.category, d.day, d.cnt, d.size, d.duration)::media_rollup_delta)
+        INTO deltas
+        FROM (
+            SELECT COALESCE(NULLIF(media_type, ''), 'uncategorized') AS category,
+                   COALESCE(created_at, NOW())::date AS day,
+                   COUNT(*) AS cnt,
+                   SUM(media_item_size_bytes(metadata)) AS size,
+                   SUM(COALESCE(duration_seconds, 0)::numeric::bigint) AS duration
+            FROM new_rows
+            WHERE status IS DISTINCT FROM 'deleted'
+            GROUP BY 1, 2
+        ) AS d;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(ROW(d.category, d.day, -d.cnt, -d.size, -d.duration)::media_rollup_delta)
+        INTO deltas
+        FROM (
+            SELECT COALESCE(NULLIF(media_type, ''), 'uncategorized') AS category,
+                   COALESCE(created_at, NOW())::date AS day,
+                   COUNT(*) AS cnt,
+                   SUM(media_item_size_bytes(metadata)) AS size,
+                   SUM(COALESCE(duration_seconds, 0)::numeric::bigint) AS duration
+            FROM old_rows
+            WHERE status IS DISTINCT FROM 'deleted'
+            GROUP BY 1, 2
+        ) AS d;
+    ELSE
+        SELECT array_agg(ROW(d.category, d.day, d.cnt, d.size, d.duration)::media_rollup_delta)
+        INTO deltas
+        FROM (
+            SELECT category, day, SUM(cnt) AS cnt, SUM(size) AS size, SUM(duration) AS duration
+            FROM (
+                SELECT COALESCE(NULLIF(media_type, ''), 'uncategorized') AS category,
+                       COALESCE(created_at, NOW())::date AS day,
+                       -1 AS cnt,
+                       -media_item_size_bytes(metadata) AS size,
+                       -COALESCE(duration_seconds, 0)::numeric::bigint AS duration
+                FROM old_rows
+                WHERE status IS DISTINCT FROM 'deleted'
+                UNION ALL
+                SELECT COALESCE(NULLIF(media_type, ''), 'uncategorized'),
+                       COALESCE(created_at, NOW())::date,
+                       1,
+                       media_item_size_bytes(metadata),
+                       COALESCE(duration_seconds, 0)::numeric::bigint
+                FROM new_rows
+                WHERE status IS DISTINCT FROM 'deleted'
+            ) AS changes
+            GROUP BY category, day
+            HAVING SUM(cnt) <> 0 OR SUM(size) <> 0 OR SUM(duration) <> 0
+        ) AS d;
+    END IF;
+    PERFORM media_rollup_apply_deltas(deltas);
+    RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION playlists_rollup_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    delta BIGINT := 0;
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT delta + COUNT(*) INTO delta FROM new_rows WHERE is_deleted = FALSE;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT delta - COUNT(*) INTO delta FROM old_rows WHERE is_deleted = FALSE;
+    END IF;
+    IF delta <> 0 THEN
+        INSERT INTO analytics_counters AS c (name, value)
+        VALUES ('playlists', delta)
+        ON CONFLICT (name) DO UPDATE SET value = c.value + EXCLUDED.value;
+    END IF;
+    RETURN NULL;
+END $$;
+
+-- Full recomputation; used after this migration and by the admin rebuild.
+CREATE OR REPLACE FUNCTION refresh_analytics_rollups()
+RETURNS VOID
+LANGUAGE plpgsql AS $$
+BEGIN
+    DELETE FROM media_category_rollups;
+    DELETE FROM media_daily_additions;
+    DELETE FROM analytics_counters WHERE name = 'playlists';
+
+    IF to_regclass('public.media_items') IS NOT NULL THEN
+        PERFORM media_rollup_apply_deltas(ARRAY(
+            SELECT ROW(d.category, d.day, d.cnt, d.size, d.duration)::media_rollup_delta
+            FROM (
+                SELECT COALESCE(NULLIF(media_type, ''), 'uncategorized') AS category,
+                       COALESCE(created_at, NOW())::date AS day,
+                       COUNT(*) AS cnt,
+                       SUM(media_item_size_bytes(metadata)) AS size,
+                       SUM(COALESCE(duration_seconds, 0)::numeric::bigint) AS duration
+                FROM media_items
+                WHERE status IS DISTINCT FROM 'deleted'
+                GROUP BY 1, 2
+            ) AS d
+        ));
+    END IF;
+
+    IF to_regclass('public.playlists') IS NOT NULL THEN
+        INSERT INTO analytics_counters (name, value)
+        SELECT 'playlists', COUNT(*) FROM playlists WHERE is_deleted = FALSE;
+    END IF;
+END $$;
+
+DO $$
+DECLARE
+    op TEXT;
+BEGIN
+    IF to_regclass('public.media_items') IS NOT NULL THEN
+        FOREACH op IN ARRAY ARRAY['insert', 'update', 'delete'] LOOP
+            EXECUTE format('DROP TRIGGER IF EXISTS media_items_rollup_%s ON media_items', op);
+        END LOOP;
+        EXECUTE 'CREATE TRIGGER media_items_rollup_insert AFTER INSERT ON media_items
+                 REFERENCING NEW TABLE AS new_rows
+                 FOR EACH STATEMENT EXECUTE FUNCTION media_items_rollup_trigger()';
+        EXECUTE 'CREATE TRIGGER media_items_rollup_update AFTER UPDATE ON media_items
+                 REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+                 FOR EACH STATEMENT EXECUTE FUNCTION media_items_rollup_trigger()';
+        EXECUTE 'CREATE TRIGGER media_items_rollup_delete AFTER DELETE ON media_items
+                 REFERENCING OLD TABLE AS old_rows
+                 FOR EACH STATEMENT EXECUTE FUNCTION media_items_rollup_trigger()';
+    END IF;
+
+    IF to_regclass('public.playlists') IS NOT NULL THEN
+        FOREACH op IN ARRAY ARRAY['insert', 'update', 'delete'] LOOP
+            EXECUTE format('DROP TRIGGER IF EXISTS playlists_rollup_%s ON playlists', op);
+        END LOOP;
+        EXECUTE 'CREATE TRIGGER playlists_rollup_insert AFTER INSERT ON playlists
+                 REFERENCING NEW TABLE AS new_rows
+                 FOR EACH STATEMENT EXECUTE FUNCTION playlists_rollup_trigger()';
+        EXECUTE 'CREATE TRIGGER playlists_rollup_update AFTER UPDATE ON playlists
+                 REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+                 FOR EACH STATEMENT EXECUTE FUNCTION playlists_rollup_trigger()';
+        EXECUTE 'CREATE TRIGGER playlists_rollup_delete AFTER DELETE ON playlists
+                 REFERENCING OLD TABLE AS old_rows
+                 FOR EACH STATEMENT EXECUTE FUNCTION playlists_rollup_trigger()';
+    END IF;
+END $$;
+
+SELECT refresh_analytics_rollups();
+
+COMMIT;
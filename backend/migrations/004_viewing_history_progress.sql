@@ -0,0 +1,33 @@
+BEGIN;
+
+-- viewing_history.media_id pointed at the legacy media_files table; progress
+-- is now reported against media_items ids, so store it as text without the
+-- foreign key. The expression index serves the buffered progress flush and
+-- resume lookups, which match user ids as text.
+DO $$
+DECLARE
+    fk_name TEXT;
+BEGIN
+    IF to_regclass('public.viewing_history') IS NULL THEN
+        RETURN;
+    END IF;
+
+    FOR fk_name IN
+        SELECT con.conname
+        FROM pg_constraint con
+        JOIN pg_attribute att
+          ON att.attrelid = con.conrelid AND att.attnum = ANY (con.conkey)
+        WHERE con.conrelid = 'public.viewing_history'::regclass
+          AND con.contype = 'f'
+          AND att.attname = 'media_id'
+    LOOP
+        EXECUTE format('ALTER TABLE viewing_history DROP CONSTRAINT %I', fk_name);
+    END LOOP;
+
+    ALTER TABLE viewing_history ALTER COLUMN media_id TYPE TEXT USING media_id::text;
+
+    CREATE INDEX IF NOT EXISTS ix_viewing_history_user_media_recent
+        ON viewing_history ((user_id::text), media_id, last_watched_at DESC);
+END $$;
+
+COMMIT;
@@ -0,0 +1,74 @@
+BEGIN;
+
+-- Daily watch statistics, maintained incrementally by the viewing progress
+-- flush (app/services/viewing_stats.py). viewing_daily_user_media holds one
+-- row per user, media and day; viewing_daily_media rolls that up per media
+-- (with its category) so "most watched this week" reads at most
+-- days x titles rows instead of scanning viewing_history.
+CREATE TABLE IF NOT EXISTS viewing_daily_user_media (
+    day DATE NOT NULL,
+    user_id TEXT NOT NULL,
+    media_id TEXT NOT NULL,
+    watch_seconds BIGINT NOT NULL DEFAULT 0,
+    completions INTEGER NOT NULL DEFAULT 0,
+    max_progress DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, user_id, media_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_viewing_daily_user_media_user_day
+    ON viewing_daily_user_media (user_id, day);
+
+CREATE TABLE IF NOT EXISTS viewing_daily_media (
+    day DATE NOT NULL,
+    media_id TEXT NOT NULL,
+    category TEXT NOT NULL DEFAULT 'uncategorized',
+    watch_seconds BIGINT NOT NULL DEFAULT 0,
+    viewers INTEGER NOT NULL DEFAULT 0,
+    completions INTEGER NOT NULL DEFAULT 0,
+    max_progress DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, media_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_viewing_daily_media_category_day
+    ON viewing_daily_media (category, day);
+
+-- Seed from existing history: each row's total is attributed to the day it
+-- was last watched.
+DO $$
+BEGIN
+    IF to_regclass('public.viewing_history') IS NULL THEN
+        RETURN;
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM viewing_daily_user_media) THEN
+        INSERT INTO viewing_daily_user_media (day, user_id, media_id, watch_seconds, completions, max_progress)
+        SELECT COALESCE(last_watched_at, started_at, NOW())::date,
+               user_id::text,
+               media_id::text,
+               SUM(COALESCE(watch_duration, 0)),
+               COUNT(*) FILTER (WHERE completed = 'true'),
+               MAX(COALESCE(progress_percentage, 0))
+        FROM viewing_history
+        WHERE user_id IS NOT NULL AND media_id IS NOT NULL
+        GROUP BY 1, 2, 3;
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM viewing_daily_media) THEN
+        IF to_regclass('public.media_items') IS NOT NULL THEN
+            INSERT INTO viewing_daily_media (day, media_id, category, watch_seconds, viewers, completions, max_progress)
+            SELECT d.day, d.media_id,
+                   COALESCE(NULLIF(MAX(mi.media_type), ''), 'uncategorized'),
+                   SUM(d.watch_seconds), COUNT(*), SUM(d.completions), MAX(d.max_progress)
+            FROM viewing_daily_user_media d
+            LEFT JOIN media_items mi ON mi.id::text = d.media_id
+            GROUP BY d.day, d.media_id;
+        ELSE
+            INSERT INTO viewing_daily_media (day, media_id, watch_seconds, viewers, completions, max_progress)
+            SELECT day, media_id, SUM(watch_seconds), COUNT(*), SUM(completions), MAX(max_progress)
+            FROM viewing_daily_user_media
+            GROUP BY day, media_id;
+        END IF;
+    END IF;
+END $$;
+
+COMMIT;
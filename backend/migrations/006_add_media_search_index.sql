@@ -0,0 +1,72 @@
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS "pg_trgm";
+
+-- Search document for media_items: title, filenames and the scanner's
+-- hierarchy fields (series/season, artist/album) plus the description.
+-- search_vector serves ranked word/prefix matches (GIN); search_document is
+-- the lower-cased plain text behind substring and fuzzy matches (trigram GIN).
+CREATE OR REPLACE FUNCTION media_items_search_text(title TEXT, description TEXT, metadata JSONB)
+RETURNS TEXT
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT lower(concat_ws(' ',
+        title,
+        metadata->>'filename',
+        metadata->>'originalFilename',
+        metadata->>'series',
+        metadata->>'season',
+        metadata->>'artist',
+        metadata->>'album',
+        description
+    ))
+$$;
+
+CREATE OR REPLACE FUNCTION media_items_search_vector(title TEXT, description TEXT, metadata JSONB)
+RETURNS tsvector
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT setweight(to_tsvector('simple', COALESCE(title, '')), 'A')
+        || setweight(to_tsvector('simple', concat_ws(' ',
+               metadata->>'series', metadata->>'artist', metadata->>'album')), 'B')
+        || setweight(to_tsvector('simple', concat_ws(' ',
+               regexp_replace(COALESCE(metadata->>'filename', ''), '[._\-]+', ' ', 'g'),
+               regexp_replace(COALESCE(metadata->>'originalFilename', ''), '[._\-]+', ' ', 'g'),
+               metadata->>'season')), 'C')
+        || setweight(to_tsvector('simple', COALESCE(description, '')), 'D')
+$$;
+
+CREATE OR REPLACE FUNCTION media_items_search_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.search_document := media_items_search_text(NEW.title, NEW.description, NEW.metadata);
+    NEW.search_vector := media_items_search_vector(NEW.title, NEW.description, NEW.metadata);
+    RETURN NEW;
+END $$;
+
+DO $$
+BEGIN
+    IF to_regclass('public.media_items') IS NULL THEN
+        RETURN;
+    END IF;
+
+    ALTER TABLE media_items
+        ADD COLUMN IF NOT EXISTS search_document TEXT,
+        ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+    DROP TRIGGER IF EXISTS media_items_search_update ON media_items;
+    CREATE TRIGGER media_items_search_update
+        BEFORE INSERT OR UPDATE OF title, description, metadata ON media_items
+        FOR EACH ROW EXECUTE FUNCTION media_items_search_trigger();
+
+    UPDATE media_items
+    SET search_document = media_items_search_text(title, description, metadata),
+        search_vector = media_items_search_vector(title, description, metadata)
+    WHERE search_vector IS NULL;
+
+    CREATE INDEX IF NOT EXISTS ix_media_items_search_vector
+        ON media_items USING GIN (search_vector);
+    CREATE INDEX IF NOT EXISTS ix_media_items_search_document_trgm
+        ON media_items USING GIN (search_document gin_trgm_ops);
+END $$;
+
+COMMIT;
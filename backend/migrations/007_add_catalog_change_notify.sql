@@ -0,0 +1,27 @@
+BEGIN;
+
+-- Publish a notification on the watch2_catalog channel whenever a statement
+-- changes media_items. Workers holding in-process catalog state (see
+-- app/services/catalog_index.py) use it to refresh; delivery happens on
+-- commit, once per statement.
+CREATE OR REPLACE FUNCTION media_items_notify_change()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('watch2_catalog', lower(TG_OP));
+    RETURN NULL;
+END $$;
+
+DO $$
+BEGIN
+    IF to_regclass('public.media_items') IS NULL THEN
+        RETURN;
+    END IF;
+
+    DROP TRIGGER IF EXISTS media_items_notify_change ON media_items;
+    CREATE TRIGGER media_items_notify_change
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON media_items
+        FOR EACH STATEMENT EXECUTE FUNCTION media_items_notify_change();
+END $$;
+
+COMMIT;
@@ -0,0 +1,32 @@
+BEGIN;
+
+-- Catalog version for HTTP ETags: every statement that writes media_items
+-- draws a value from catalog_version_seq and publishes it as the
+-- watch2_catalog payload. nextval never waits for other transactions, so
+-- concurrent writers do not serialize on a counter row. Values are unique
+-- but not ordered by commit; notifications are delivered on commit, in
+-- commit order, so the last payload a worker received identifies the
+-- catalog state it has seen.
+CREATE SEQUENCE IF NOT EXISTS catalog_version_seq;
+
+CREATE OR REPLACE FUNCTION media_items_notify_change()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('watch2_catalog', nextval('catalog_version_seq')::text);
+    RETURN NULL;
+END $$;
+
+DO $$
+BEGIN
+    IF to_regclass('public.media_items') IS NULL THEN
+        RETURN;
+    END IF;
+
+    DROP TRIGGER IF EXISTS media_items_notify_change ON media_items;
+    CREATE TRIGGER media_items_notify_change
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON media_items
+        FOR EACH STATEMENT EXECUTE FUNCTION media_items_notify_change();
+END $$;
+
+COMMIT;
@@ -0,0 +1,31 @@
+BEGIN;
+
+-- Staged content fingerprints for duplicate and move detection
+-- (app/services/media_fingerprints.py):
+--   file_size_bytes     size from metadata, kept in sync by the database
+--   fingerprint_sample  hash of size + head/middle/tail blocks, computed only
+--                       for files whose size collides with another item
+--   content_hash        full SHA-256, computed only when samples collide
+--   fingerprint_signature  scannerSignature the fingerprint was computed for,
+--                       so unchanged files are never read again
+DO $$
+BEGIN
+    IF to_regclass('public.media_items') IS NULL THEN
+        RETURN;
+    END IF;
+
+    ALTER TABLE media_items
+        ADD COLUMN IF NOT EXISTS file_size_bytes BIGINT
+            GENERATED ALWAYS AS (media_item_size_bytes(metadata)) STORED,
+        ADD COLUMN IF NOT EXISTS fingerprint_sample TEXT,
+        ADD COLUMN IF NOT EXISTS content_hash TEXT,
+        ADD COLUMN IF NOT EXISTS fingerprint_signature TEXT,
+        ADD COLUMN IF NOT EXISTS fingerprinted_at TIMESTAMPTZ;
+
+    CREATE INDEX IF NOT EXISTS ix_media_items_size_fingerprint
+        ON media_items (file_size_bytes, fingerprint_sample);
+    CREATE INDEX IF NOT EXISTS ix_media_items_content_hash
+        ON media_items (content_hash) WHERE content_hash IS NOT NULL;
+END $$;
+
+COMMIT;
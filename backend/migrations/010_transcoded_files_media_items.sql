@@ -0,0 +1,31 @@
+BEGIN;
+
+-- transcoded_files was keyed on the legacy media_files table. Renditions
+-- (HLS remuxes, transcodes) are produced for media_items, so record the item
+-- id as text (like viewing_history.media_id) together with the
+-- scannerSignature the output was built from; a changed source invalidates
+-- it. last_accessed_at drives cache-budget eviction, file_size becomes
+-- BIGINT because packaged films exceed 2 GiB.
+DO $$
+BEGIN
+    IF to_regclass('public.transcoded_files') IS NULL THEN
+        RETURN;
+    END IF;
+
+    ALTER TABLE transcoded_files
+        ADD COLUMN IF NOT EXISTS media_item_id TEXT,
+        ADD COLUMN IF NOT EXISTS source_signature TEXT,
+        ADD COLUMN IF NOT EXISTS error TEXT,
+        ADD COLUMN IF NOT EXISTS last_accessed_at TIMESTAMPTZ;
+
+    ALTER TABLE transcoded_files ALTER COLUMN file_size TYPE BIGINT;
+
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_transcoded_files_item_rendition
+        ON transcoded_files (media_item_id, format, quality)
+        WHERE media_item_id IS NOT NULL;
+    CREATE INDEX IF NOT EXISTS ix_transcoded_files_eviction
+        ON transcoded_files (format, last_accessed_at)
+        WHERE is_ready;
+END $$;
+
+COMMIT;
@@ -0,0 +1,24 @@
+BEGIN;
+
+-- Sidecar subtitle files (Movie.en.srt, Subs/Movie.eng.forced.srt, ...)
+-- found next to video items by the maintenance scan
+-- (app/services/subtitles.py). size_bytes and mtime_ns identify the file
+-- version that the converted WebVTT cache entry was built from.
+CREATE TABLE IF NOT EXISTS media_subtitles (
+    id SERIAL PRIMARY KEY,
+    media_item_id TEXT NOT NULL,
+    source_path TEXT NOT NULL UNIQUE,
+    language TEXT,
+    format TEXT NOT NULL,
+    is_forced BOOLEAN NOT NULL DEFAULT FALSE,
+    is_hearing_impaired BOOLEAN NOT NULL DEFAULT FALSE,
+    size_bytes BIGINT NOT NULL DEFAULT 0,
+    mtime_ns BIGINT NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ix_media_subtitles_media_item
+    ON media_subtitles (media_item_id);
+
+COMMIT;
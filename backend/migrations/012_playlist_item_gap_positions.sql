@@ -0,0 +1,24 @@
+BEGIN;
+
+-- Gap-based playlist ordering (app/services/playlist_order.py): positions
+-- become multiples of 1024 so reordering rewrites only the moved rows, and
+-- (playlist_id, position) is indexed for ordered reads and tail lookups.
+DO $$
+BEGIN
+    IF to_regclass('public.playlist_items') IS NULL THEN
+        RETURN;
+    END IF;
+
+    UPDATE playlist_items pi
+    SET position = ranked.rank * 1024
+    FROM (
+        SELECT id, row_number() OVER (PARTITION BY playlist_id ORDER BY position, id) AS rank
+        FROM playlist_items
+    ) AS ranked
+    WHERE pi.id = ranked.id AND pi.position IS DISTINCT FROM ranked.rank * 1024;
+
+    CREATE INDEX IF NOT EXISTS ix_playlist_items_playlist_position
+        ON playlist_items (playlist_id, position);
+END $$;
+
+COMMIT;
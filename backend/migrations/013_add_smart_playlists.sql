@@ -0,0 +1,104 @@
+BEGIN;
+
+-- Smart playlist evaluation (app/services/smart_playlists.py):
+--   media_item_year        release year from metadata (scanner/NFO "year" or
+--                          the probed "date" tag), indexable like the
+--                          category expression used by the filters
+--   media_item_changes     ids written by each media_items statement, tagged
+--                          with the writing transaction, while at least one
+--                          smart playlist exists
+--   smart_playlist_members materialized membership per playlist
+--   smart_playlist_state   filters hash and the snapshot the membership
+--                          reflects; changes from transactions not visible
+--                          in that snapshot are re-checked (commit order,
+--                          not id or version order)
+CREATE OR REPLACE FUNCTION media_item_year(metadata JSONB)
+RETURNS INTEGER
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT substring(
+        COALESCE(metadata->>'year', metadata->'probe'->'tags'->>'date')
+        FROM '^\s*([0-9]{4})'
+    )::integer
+$$;
+
+CREATE TABLE IF NOT EXISTS media_item_changes (
+    id BIGSERIAL PRIMARY KEY,
+    txid XID8 NOT NULL DEFAULT pg_current_xact_id(),
+    media_item_id TEXT NOT NULL,
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ix_media_item_changes_txid
+    ON media_item_changes (txid);
+CREATE INDEX IF NOT EXISTS ix_media_item_changes_changed_at
+    ON media_item_changes (changed_at);
+
+CREATE TABLE IF NOT EXISTS smart_playlist_members (
+    playlist_id INTEGER NOT NULL REFERENCES playlists(id) ON DELETE CASCADE,
+    media_item_id TEXT NOT NULL,
+    PRIMARY KEY (playlist_id, media_item_id)
+);
+
+CREATE TABLE IF NOT EXISTS smart_playlist_state (
+    playlist_id INTEGER PRIMARY KEY REFERENCES playlists(id) ON DELETE CASCADE,
+    filters_hash TEXT NOT NULL DEFAULT '',
+    snapshot PG_SNAPSHOT,
+    -- Last watch2_catalog payload seen before evaluating (migration 008).
+    catalog_version BIGINT,
+    evaluated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ix_playlists_smart
+    ON playlists (id) WHERE is_smart AND is_deleted = FALSE;
+
+-- A writer that checked before the first smart playlist committed may go
+-- unlogged; the periodic full re-evaluation bounds that window.
+CREATE OR REPLACE FUNCTION media_items_record_changes()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM playlists WHERE is_smart AND is_deleted = FALSE) THEN
+        RETURN NULL;
+    END IF;
+    -- changed_rows is the NEW TABLE (insert/update) or OLD TABLE (delete).
+    INSERT INTO media_item_changes (media_item_id)
+    SELECT id::text FROM changed_rows;
+    RETURN NULL;
+END $$;
+
+DO $$
+BEGIN
+    IF to_regclass('public.media_items') IS NULL THEN
+        RETURN;
+    END IF;
+
+    CREATE INDEX IF NOT EXISTS ix_media_items_id_text
+        ON media_items ((id::text));
+    CREATE INDEX IF NOT EXISTS ix_media_items_category
+        ON media_items ((metadata->>'category'));
+    CREATE INDEX IF NOT EXISTS ix_media_items_year
+        ON media_items (media_item_year(metadata));
+    CREATE INDEX IF NOT EXISTS ix_media_items_type_created
+        ON media_items (media_type, created_at);
+
+    -- Transition tables require one trigger per event.
+    DROP TRIGGER IF EXISTS media_items_record_changes_insert ON media_items;
+    CREATE TRIGGER media_items_record_changes_insert
+        AFTER INSERT ON media_items
+        REFERENCING NEW TABLE AS changed_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION media_items_record_changes();
+
+    DROP TRIGGER IF EXISTS media_items_record_changes_update ON media_items;
+    CREATE TRIGGER media_items_record_changes_update
+        AFTER UPDATE ON media_items
+        REFERENCING NEW TABLE AS changed_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION media_items_record_changes();
+
+    DROP TRIGGER IF EXISTS media_items_record_changes_delete ON media_items;
+    CREATE TRIGGER media_items_record_changes_delete
+        AFTER DELETE ON media_items
+        REFERENCING OLD TABLE AS changed_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION media_items_record_changes();
+END $$;
+
+COMMIT;
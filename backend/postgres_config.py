@@ -3,7 +3,9 @@ from __future__ import annotations
 
 import logging
 import os
+import threading
 from contextlib import contextmanager
+from typing import Dict, Tuple
 
 import psycopg2
 from psycopg2 import sql
@@ -12,6 +14,9 @@ from psycopg2.extras import RealDictCursor
 
 logger = logging.getLogger(__name__)
 
+_column_types: Dict[Tuple[str, str], str] = {}
+_column_types_lock = threading.Lock()
+
 DEFAULTS = {
     "host": os.getenv("POSTGRES_HOST", os.getenv("DB_HOST", "localhost")),
     "port": int(os.getenv("POSTGRES_PORT", os.getenv("DB_PORT", "5432"))),
@@ -49,3 +54,29 @@ def test_db_connection() -> bool:
     except Exception as exc:
         logger.error("Database test query failed: %s", exc)
         return False
+
+
+def column_type(cursor, table: str, column: str) -> str:
+    """SQL type of ``table.column`` (e.g. ``uuid``), looked up once per process.
+
+    Batched ``UPDATE ... FROM (VALUES ...)`` statements cast their key column
+    to it, so the join compares native values and can use the table's index.
+    """
+    key = (table, column)
+    with _column_types_lock:
+        if key in _column_types:
+            return _column_types[key]
+    cursor.execute(
+        """
+        SELECT format_type(atttypid, atttypmod) AS type
+        FROM pg_attribute
+        WHERE attrelid = to_regclass(%s) AND attname = %s AND NOT attisdropped
+        """,
+        (table, column),
+    )
+    row = cursor.fetchone()
+    if row is None:
+        raise LookupError(f"Column {table}.{column} does not exist")
+    with _column_types_lock:
+        _column_types[key] = row["type"]
+    return row["type"]